@@ -0,0 +1,177 @@
+import collections
+import numpy as np
+
+from match_results import MatchResults, ScoredMatchResults
+
+
+class MatchGraph:
+  """The bipartite graph of a MatchResults object: an edge for each match, between a key paper
+  (on the left) and a matching paper (on the right), weighted by the score of the match.
+  The papers are numbered in the order they first appear, and the edges are held in arrays."""
+  def __init__(self, results, score=None):
+    """If score is None, the scores of a ScoredMatchResults are used, and otherwise every edge
+    has weight 1.  score may also be a function of two papers, such as a ranking.Score."""
+    if score is None and isinstance(results, ScoredMatchResults):
+      score = lambda p, q: results.scores[(p.id, q.id)]
+    self.left = list(results.results)
+    self.right = []
+    position = {}
+    u, v, w = [], [], []
+    for a, (key, values) in enumerate(results.results.items()):
+      for value in values:
+        if value.id not in position:
+          position[value.id] = len(self.right)
+          self.right.append(value)
+        u.append(a)
+        v.append(position[value.id])
+        w.append(1.0 if score is None else score(key, value))
+    self.u = np.array(u, dtype=np.int64)
+    self.v = np.array(v, dtype=np.int64)
+    self.w = np.array(w, dtype=float)
+    self.scored = score is not None
+
+  def __len__(self):
+    return len(self.u)
+
+  def components(self):
+    """Return a list of arrays of edge numbers, one for each connected component of the graph,
+    with the edges of each in their original order."""
+    n = len(self.left)
+    parent = list(range(n + len(self.right)))
+    def find(x):
+      while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+      return x
+    for a, b in zip(self.u.tolist(), (self.v + n).tolist()):
+      ra, rb = find(a), find(b)
+      if ra != rb:
+        parent[rb] = ra
+    if not len(self.u):
+      return []
+    roots = np.array([find(a) for a in self.u.tolist()], dtype=np.int64)
+    order = np.argsort(roots, kind="stable")
+    starts = np.flatnonzero(np.r_[True, roots[order][1:] != roots[order][:-1]])
+    return np.split(order, starts[1:])
+
+  def results(self, edges):
+    """Return the MatchResults (or ScoredMatchResults) for the given edges, in the original order."""
+    edges = np.sort(edges)
+    matches = collections.defaultdict(list)
+    scores = {}
+    for a, b, w in zip(self.u[edges].tolist(), self.v[edges].tolist(), self.w[edges].tolist()):
+      key, value = self.left[a], self.right[b]
+      matches[a].append(value)
+      scores[(key.id, value.id)] = w
+    results = dict((self.left[a], matches[a]) for a in sorted(matches))
+    return ScoredMatchResults(results, scores) if self.scored else MatchResults(results)
+
+
+def greedy(graph, edges=None):
+  """Return the edges chosen by taking the edges in order of decreasing weight (the earlier edge
+  first, where they are equal), keeping each one whose papers are both still unmatched."""
+  if edges is None:
+    edges = np.arange(len(graph))
+  edges = edges[np.argsort(-graph.w[edges], kind="stable")]
+  used1, used2 = set(), set()
+  chosen = []
+  for e, a, b in zip(edges.tolist(), graph.u[edges].tolist(), graph.v[edges].tolist()):
+    if a not in used1 and b not in used2:
+      used1.add(a)
+      used2.add(b)
+      chosen.append(e)
+  return np.array(chosen, dtype=np.int64)
+
+def hungarian(cost):
+  """Return the column assigned to each row of a cost matrix with no more rows than columns,
+  so that the total cost is as small as possible.  This is the shortest augmenting path form of
+  the Hungarian algorithm, which takes O(rows^2 columns) time, with the work on each column
+  done by numpy."""
+  n, m = cost.shape
+  u = np.zeros(n + 1)
+  v = np.zeros(m + 1)
+  p = np.zeros(m + 1, dtype=np.int64)    # p[j] is the row (from 1) assigned to column j (from 1)
+  way = np.zeros(m + 1, dtype=np.int64)
+  for i in range(1, n + 1):
+    p[0] = i
+    j0 = 0
+    minv = np.full(m + 1, np.inf)
+    used = np.zeros(m + 1, dtype=bool)
+    while True:
+      used[j0] = True
+      i0 = p[j0]
+      free = ~used[1:]
+      reduced = cost[i0 - 1] - u[i0] - v[1:]
+      better = free & (reduced < minv[1:])
+      minv[1:][better] = reduced[better]
+      way[1:][better] = j0
+      candidates = np.where(free, minv[1:], np.inf)
+      j1 = int(np.argmin(candidates)) + 1
+      delta = candidates[j1 - 1]
+      u[p[used]] += delta
+      v[used] -= delta
+      minv[1:][free] -= delta
+      j0 = j1
+      if p[j0] == 0:
+        break
+    while j0:
+      j1 = way[j0]
+      p[j0] = p[j1]
+      j0 = j1
+  result = np.zeros(n, dtype=np.int64)
+  assigned = np.flatnonzero(p[1:])
+  result[p[1:][assigned] - 1] = assigned
+  return result
+
+def optimal(graph, edges=None):
+  """Return the edges of the assignment with the largest total weight, amongst the given edges
+  (which should be a connected component, as each is solved as a dense matrix).  Edges with no
+  weight may be left out."""
+  if edges is None:
+    edges = np.arange(len(graph))
+  rows, u = np.unique(graph.u[edges], return_inverse=True)
+  columns, v = np.unique(graph.v[edges], return_inverse=True)
+  if len(rows) == 1 or len(columns) == 1:
+    best = edges[[np.argmax(graph.w[edges])]]
+    return best[graph.w[best] > 0]
+  transpose = len(rows) > len(columns)
+  if transpose:
+    u, v = v, u
+  # Unmatched papers cost nothing, so the best assignment only uses edges of positive weight;
+  # the others cost nothing either, as leaving them out is always at least as good.
+  cost = np.zeros((u.max() + 1, v.max() + 1))
+  number = np.full(cost.shape, -1, dtype=np.int64)
+  cost[u, v] = -np.maximum(graph.w[edges], 0)
+  number[u, v] = edges
+  chosen = number[np.arange(cost.shape[0]), hungarian(cost)]
+  chosen = chosen[chosen >= 0]
+  return chosen[graph.w[chosen] > 0]
+
+methods = {"greedy": greedy, "optimal": optimal}
+
+def assign(results, method="greedy", score=None, max_size=1000):
+  """Return a MatchResults object in which each paper is matched with at most one other paper,
+  chosen from the matches in results, so that the matches resolve into a one-to-one assignment.
+
+  The match graph (see MatchGraph, which explains score) is split into its connected components,
+  and each is resolved on its own: by method "greedy", which takes the matches in order of
+  decreasing score, or "optimal", which finds the assignment with the largest total score
+  (without scores, the largest number of matches).  Components which are already one-to-one are
+  kept as they are (by "optimal", only if their score is positive, as for any other edge), and components with more than max_size papers on both sides are resolved
+  greedily, as the optimal assignment takes time cubic in the size of the component.
+  If results has scores (or score is given), the result is a ScoredMatchResults."""
+  if method not in methods:
+    raise ValueError("Unknown assignment method {!r}, expected one of {}".format(method, ", ".join(sorted(methods))))
+  graph = MatchGraph(results, score)
+  if method == "greedy":
+    # Taking the edges greedily gives the same result for the whole graph as for each component.
+    return graph.results(greedy(graph))
+  chosen = []
+  for edges in graph.components():
+    if len(edges) == 1:
+      chosen.append(edges[graph.w[edges] > 0])
+    elif min(len(np.unique(graph.u[edges])), len(np.unique(graph.v[edges]))) > max_size:
+      chosen.append(greedy(graph, edges))
+    else:
+      chosen.append(optimal(graph, edges))
+  return graph.results(np.concatenate(chosen) if chosen else np.zeros(0, dtype=np.int64))
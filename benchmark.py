@@ -0,0 +1,197 @@
+"""A benchmark of the main operations: reading the CSV files, normalising the papers, matching
+with the standard rules, scoring the results and mapping the venues.
+
+As well as the bundled DBLP1.csv (matched against Scholar.csv, with DBLP-Scholar_perfectMapping.csv
+as gold, if Scholar.csv is present), it runs on synthetic collections.  These match DBLP1.csv against
+'scale' perturbed copies of each of its papers, so that the second collection is 1, 10, 100...
+times the size of DBLP1.csv, with gold known by construction.
+
+The results are written as JSON, with the time and the peak memory of each step, so that runs on
+different commits can be compared:
+
+  python benchmark.py --scales 1 10 100 --output after.json --compare before.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import blocking
+import disk_cache
+import features
+import ingest
+from matcher import *
+from paper_collection import PaperCollection
+from scorer import Eval, ScoreResults
+from venues import venue_map
+
+rules = [
+  ("match", match),
+  ("full", full),
+  ("all_but_venue", all_but_venue),
+  ("fuzzy_title", fuzzy_title(3) + valid_year),
+  ("fuzzy_authors", valid_year + first_fuzzy_authors(3, 3) + words(0.5)),
+]
+
+
+def synthetic(source, scale, dirname, seed=0):
+  """Write a CSV file with 'scale' perturbed copies of each paper in the CSV file 'source', in the
+  same format, and a gold file mapping the ids in source to the ids of their copies.  The copies
+  differ as the DBLP and Scholar records of a paper do: in case, punctuation, missing letters,
+  truncation, authors reduced to surnames, and missing or reworded venues and years.
+  Return the names of the two files."""
+  rnd = random.Random(seed)
+  rows = list(ingest.read_rows(source))
+  filename = os.path.join(dirname, "synthetic{}.csv".format(scale))
+  gold_filename = os.path.join(dirname, "synthetic{}_gold.csv".format(scale))
+  with open(filename, "w", newline="", encoding="utf-8") as f, open(gold_filename, "w", newline="") as g:
+    papers = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+    gold = csv.writer(g, quoting=csv.QUOTE_ALL)
+    papers.writerow(["id", "title", "authors", "venue", "year"])
+    gold.writerow(["idDBLP", "idScholar"])
+    for copy in range(scale):
+      for id, title, authors, venue, year in rows:
+        r = rnd.random()
+        if r < 0.2:
+          title = title.lower()
+        elif r < 0.3 and len(title) > 10:
+          k = rnd.randrange(len(title))
+          title = title[:k] + title[k+1:]
+        elif r < 0.35:
+          title = title[:len(title)//2]
+        if rnd.random() < 0.3:
+          authors = ", ".join(a.split()[-1] if a.split() else a for a in authors.split(", "))
+        venue = rnd.choice([venue, "", venue.lower(), "Proceedings of the " + venue])
+        year = year if rnd.random() < 0.6 else ""
+        papers.writerow([id + "#" + str(copy), title, authors, venue, year])
+        gold.writerow([id, id + "#" + str(copy)])
+  return filename, gold_filename
+
+
+class Timer:
+  """Records the time and peak memory of each step of a benchmark.  The memory of a step is the
+  most it allocated (as traced by tracemalloc, which includes numpy arrays) on top of what was
+  held when it started, so each step is measured on its own.  Tracing slows down allocation, so
+  the times are only comparable with other runs which traced memory too."""
+  def __init__(self, memory=True):
+    self.results = []
+    self.memory = memory
+    if memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  def __call__(self, dataset, step, fn, *args):
+    if self.memory:
+      tracemalloc.reset_peak()
+      held = tracemalloc.get_traced_memory()[0]
+    start = time.time()
+    result = fn(*args)
+    seconds = time.time() - start
+    peak = (tracemalloc.get_traced_memory()[1] - held) / (1024.0 * 1024.0) if self.memory else None
+    self.results.append(dict(dataset=dataset, step=step, seconds=seconds, peak_memory_mb=peak))
+    print("{:12} {:24} {:8.3f}s {:>8}MB".format(dataset, step, seconds, "-" if peak is None else "{:.1f}".format(peak)))
+    sys.stdout.flush()
+    return result
+
+
+def run(timer, dataset, filename1, filename2, gold_filename, blocker):
+  c1 = timer(dataset, "load", PaperCollection, filename1)
+  c2 = timer(dataset, "load2", PaperCollection, filename2)
+  n1 = timer(dataset, "normalised", c1.normalised)
+  n2 = timer(dataset, "normalised2", c2.normalised)
+  scorer = Eval(gold_filename, n1, n2, blocker=blocker)
+  if blocker is not None:
+    timer(dataset, "index", n2.index, blocker)
+  results = {}
+  for name, rule in rules:
+    # Each rule starts with an empty feature cache, so it pays for its own features.
+    features.cache.clear()
+    results[name] = timer(dataset, "matchup " + name, n1.matchup, n2, rule, blocker)
+  timer(dataset, "ScoreResults", ScoreResults, scorer, results["match"], match)
+  timer(dataset, "venue_map", venue_map, scorer._gold, n1, n2)
+
+
+def compare(results, filename, slowdown, growth):
+  """Print the ratios of the times and peak memory in results to those in the JSON file of an
+  earlier run, flagging the steps which are more than 'slowdown' times slower, or which take more
+  than 'growth' times the memory.  Return the number flagged."""
+  with open(filename) as f:
+    before = {(r["dataset"], r["step"]): r for r in json.load(f)["results"]}
+  flagged = 0
+  for r in results:
+    b = before.get((r["dataset"], r["step"]))
+    if b is None:
+      continue
+    notes = []
+    ratio = r["seconds"] / b["seconds"] if b["seconds"] else float("nan")
+    if b["seconds"] and ratio > slowdown and r["seconds"] - b["seconds"] > 0.01:
+      notes.append("SLOWER")
+    memory = _ratio(r.get("peak_memory_mb"), b.get("peak_memory_mb"))
+    if memory is not None and memory > growth and r["peak_memory_mb"] - b["peak_memory_mb"] > 1:
+      notes.append("MORE MEMORY")
+    flagged += bool(notes)
+    print("{:12} {:24} {:8.3f}s {:8.3f}s {:6.2f}x {:>7}{}".format(
+      r["dataset"], r["step"], b["seconds"], r["seconds"], ratio,
+      "-" if memory is None else "{:.2f}x".format(memory), "".join("  " + n for n in notes)))
+  return flagged
+
+def _ratio(after, before):
+  """The ratio of the peak memory of a step after to before, or None if either wasn't measured."""
+  if after is None or before is None:
+    return None
+  return after / max(before, 0.1)
+
+
+def commit():
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark loading, normalising, matching and scoring.")
+  parser.add_argument("--scales", type=int, nargs="*", default=[1, 10, 100], help="sizes of the synthetic collections, as multiples of DBLP1.csv")
+  parser.add_argument("--dblp", default="DBLP1.csv")
+  parser.add_argument("--scholar", default="Scholar.csv", help="run on this with the gold mapping too, if it exists")
+  parser.add_argument("--gold", default="DBLP-Scholar_perfectMapping.csv")
+  parser.add_argument("--blocker", choices=["standard", "none"], default="standard", help="the blocker for matching (none is only feasible for small scales)")
+  parser.add_argument("--output", default="benchmark.json")
+  parser.add_argument("--compare", help="a JSON file from an earlier run to compare with")
+  parser.add_argument("--slowdown", type=float, default=1.2, help="the ratio of times which counts as slower")
+  parser.add_argument("--growth", type=float, default=1.2, help="the ratio of peak memory which counts as more")
+  parser.add_argument("--no-memory", action="store_true", help="don't trace memory, which slows down allocation")
+  args = parser.parse_args(argv)
+
+  # Everything is read from the files, and matched from scratch.
+  disk_cache.enabled = False
+  blocker = blocking.standard if args.blocker == "standard" else None
+  timer = Timer(not args.no_memory)
+  if os.path.exists(args.scholar):
+    run(timer, "scholar", args.dblp, args.scholar, args.gold, blocker)
+  dirname = tempfile.mkdtemp()
+  try:
+    for scale in args.scales:
+      filename, gold_filename = synthetic(args.dblp, scale, dirname)
+      run(timer, "synthetic{}".format(scale), args.dblp, filename, gold_filename, blocker)
+  finally:
+    for name in os.listdir(dirname):
+      os.remove(os.path.join(dirname, name))
+    os.rmdir(dirname)
+
+  with open(args.output, "w") as f:
+    json.dump(dict(commit=commit(), python=platform.python_version(), time=time.strftime("%Y-%m-%d %H:%M:%S"),
+                   blocker=args.blocker, results=timer.results), f, indent=2)
+  if args.compare:
+    return 1 if compare(timer.results, args.compare, args.slowdown, args.growth) else 0
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
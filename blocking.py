@@ -0,0 +1,843 @@
+import collections
+import functools
+import zlib
+import numpy as np
+
+from normaliser import Normaliser
+from utils import INF, bounded_edit_distance, edit_distances
+
+class _Any:
+  """The type of ANY, a blocking key which is shared with every other paper (e.g. a missing year).
+  It pickles as a reference to ANY, so that cached indices still recognise it."""
+  def __repr__(self):
+    return "ANY"
+
+  def __reduce__(self):
+    return "ANY"
+
+ANY = _Any()
+
+
+class Blocker:
+  """A Blocker maps a paper to a set of blocking keys.  Two papers are candidates for
+  matching if they share at least one key, so a Matcher need only be run on the candidates,
+  rather than on the full cross product of two collections.  A key of ANY is treated as a
+  wildcard, and is shared with every paper.  Blockers are commonly constructed from a function
+  using the @blocker decorator, and may be composed like Matchers:
+
+  a + b  - papers are candidates if they are candidates according to both a and b
+  a | b  - papers are candidates if they are candidates according to either a or b
+
+  Keys which are shared by more than max_block papers in the indexed collection are considered
+  too common to be informative (for example, the title word "data"), and are ignored."""
+  def __init__(self, label, fn, max_block=None):
+    self.label = label
+    self.func = fn
+    self.max_block = max_block
+
+  def __repr__(self):
+    if self.max_block is None:
+      return self.label
+    return "{}[:{}]".format(self.label, self.max_block)
+
+  def keys(self, paper):
+    """Return the set of blocking keys for the paper."""
+    return self.func(paper)
+
+  def limit(self, max_block):
+    """Return a copy of this Blocker which ignores keys shared by more than max_block papers."""
+    return Blocker(self.label, self.func, max_block)
+
+  def index(self, collection):
+    """Return an index of the collection which can be used to look up candidates."""
+    return BlockIndex(self, collection)
+
+  def __add__(self, blocker):
+    """Construct a ConjBlocker so that papers must be candidates according to both blockers."""
+    return ConjBlocker(self, blocker)
+
+  def __or__(self, blocker):
+    """Construct an AltBlocker so that papers may be candidates according to either blocker."""
+    return AltBlocker(self, blocker)
+
+
+class CompositeBlocker(Blocker):
+  """An abstract class for composing blockers."""
+  def __init__(self, *args):
+    self.blockers = []
+    for arg in args:
+      if isinstance(arg, self.__class__):
+        self.blockers.extend(arg.blockers)
+      else:
+        self.blockers.append(arg)
+
+  def __repr__(self):
+    return self.sep.join(str(b) for b in self.blockers)
+
+  def __str__(self):
+    return "({!r})".format(self)
+
+  def index(self, collection):
+    return self.index_class(self, [b.index(collection) for b in self.blockers])
+
+
+class BlockIndex:
+  """An inverted index from blocking keys to the positions of the papers in a collection
+  which have those keys."""
+  def __init__(self, blocker, collection):
+    self.blocker = blocker
+    self.collection = collection
+    self.postings = collections.defaultdict(list)
+    self.wild = []
+    self.keys = []
+    for paper in collection:
+      self.add(paper)
+
+  def __repr__(self):
+    return "BlockIndex({!r}, keys={}, papers={})".format(self.blocker, len(self.postings), len(self.keys))
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __getstate__(self):
+    """Neither the blocker nor the collection is saved with the index: they must be restored
+    with attach()."""
+    state = self.__dict__.copy()
+    del state["blocker"]
+    del state["collection"]
+    return state
+
+  def attach(self, blocker, collection):
+    """Attach the index to its blocker and the collection it indexes, e.g. after unpickling."""
+    self.blocker = blocker
+    self.collection = collection
+
+  def add(self, paper):
+    """Add a paper to the index.  The paper is assumed to have been appended to the collection."""
+    pos = len(self.keys)
+    keys = self.blocker.keys(paper)
+    self.keys.append(keys)
+    if ANY in keys:
+      self.wild.append(pos)
+    for key in keys:
+      if key is not ANY:
+        self.postings[key].append(pos)
+
+  def _blocks(self, keys):
+    """Return the posting lists for keys, leaving out those which are too common."""
+    max_block = self.blocker.max_block
+    blocks = (self.postings.get(key) for key in keys if key is not ANY)
+    return [b for b in blocks if b and (max_block is None or len(b) <= max_block)]
+
+  def estimate(self, paper):
+    """Return an upper bound on the number of candidates for the paper."""
+    keys = self.blocker.keys(paper)
+    if ANY in keys:
+      return len(self.keys)
+    return len(self.wild) + sum(len(b) for b in self._blocks(keys))
+
+  def positions(self, paper):
+    """Return the set of positions of the candidates for the paper."""
+    keys = self.blocker.keys(paper)
+    if ANY in keys:
+      return set(range(len(self.keys)))
+    result = set(self.wild)
+    for block in self._blocks(keys):
+      result.update(block)
+    return result
+
+  def admits(self, keys, pos):
+    """Return whether the paper at position pos is a candidate for a paper with the given keys."""
+    other = self.keys[pos]
+    if ANY in keys or ANY in other:
+      return True
+    max_block = self.blocker.max_block
+    return any(key in other and (max_block is None or len(self.postings[key]) <= max_block) for key in keys)
+
+  def candidates(self, paper):
+    """Return the candidates for the paper, in the order in which they appear in the collection."""
+    papers = self.collection.papers
+    return [papers[i] for i in sorted(self.positions(paper))]
+
+
+class CompositeIndex(BlockIndex):
+  """An abstract class for indexes built from the indexes of composed blockers."""
+  def __init__(self, blocker, indices):
+    self.blocker = blocker
+    self.indices = indices
+    self.collection = indices[0].collection
+
+  def __repr__(self):
+    return "{}({!r})".format(self.__class__.__name__, self.blocker)
+
+  def __len__(self):
+    return len(self.indices[0])
+
+  def attach(self, blocker, collection):
+    self.blocker = blocker
+    self.collection = collection
+    for index, b in zip(self.indices, blocker.blockers):
+      index.attach(b, collection)
+
+  def add(self, paper):
+    for index in self.indices:
+      index.add(paper)
+
+
+class ConjIndex(CompositeIndex):
+  def estimate(self, paper):
+    return min(index.estimate(paper) for index in self.indices)
+
+  def positions(self, paper):
+    """Look up the candidates in the most selective index, and filter them with the others."""
+    indices = sorted(self.indices, key=lambda index: index.estimate(paper))
+    result = indices[0].positions(paper)
+    for index in indices[1:]:
+      keys = index.blocker.keys(paper)
+      result = {pos for pos in result if index.admits(keys, pos)}
+    return result
+
+  def admits(self, keys, pos):
+    return all(index.admits(k, pos) for index, k in zip(self.indices, keys))
+
+
+class AltIndex(CompositeIndex):
+  def estimate(self, paper):
+    return sum(index.estimate(paper) for index in self.indices)
+
+  def positions(self, paper):
+    result = set()
+    for index in self.indices:
+      result.update(index.positions(paper))
+    return result
+
+  def admits(self, keys, pos):
+    return any(index.admits(k, pos) for index, k in zip(self.indices, keys))
+
+
+class ConjBlocker(CompositeBlocker):
+  """A composite blocker linked by '+', meaning that papers must be candidates for all blockers."""
+  sep = " + "
+  index_class = ConjIndex
+
+  def keys(self, paper):
+    return tuple(b.keys(paper) for b in self.blockers)
+
+
+class AltBlocker(CompositeBlocker):
+  """A composite blocker linked by '|', meaning that papers may be candidates for any blocker."""
+  sep = " | "
+  index_class = AltIndex
+
+  def keys(self, paper):
+    return tuple(b.keys(paper) for b in self.blockers)
+
+
+class MinHashBlocker(Blocker):
+  """A locality-sensitive hashing (LSH) blocker, which makes papers with similar titles candidates.
+  The normalised title is broken into shingles (character n-grams of length 'shingle', or words
+  if shingle is None), and its MinHash signature of bands*rows values is calculated.  Each band of
+  'rows' values is a blocking key, so papers are candidates if all the values in any one band agree.
+  Papers whose titles have a Jaccard similarity of s are candidates with probability
+  1 - (1 - s**rows)**bands, which rises steeply around (1/bands)**(1/rows).
+
+  If threshold is given, candidates are also filtered on the Jaccard similarity estimated from
+  the whole signatures, which must be at least threshold.  For example:
+
+  eval.candidates(MinHashBlocker(bands=20, rows=4, threshold=0.4))
+  """
+  prime = (1 << 31) - 1
+
+  def __init__(self, bands=20, rows=5, shingle=3, threshold=None, seed=0, max_block=None):
+    self.bands = bands
+    self.rows = rows
+    self.shingle = shingle
+    self.threshold = threshold
+    self.seed = seed
+    label = "minhash(bands={}, rows={}, shingle={}, threshold={}, seed={})".format(bands, rows, shingle, threshold, seed)
+    Blocker.__init__(self, label, self.signature_keys, max_block)
+    random = np.random.RandomState(seed)
+    self.a = random.randint(1, self.prime, bands * rows).astype(np.int64)
+    self.b = random.randint(0, self.prime, bands * rows).astype(np.int64)
+
+  def limit(self, max_block):
+    return MinHashBlocker(self.bands, self.rows, self.shingle, self.threshold, self.seed, max_block)
+
+  def index(self, collection):
+    return MinHashIndex(self, collection)
+
+  def shingles(self, paper):
+    """Return the set of shingles of the normalised title of the paper."""
+    title = paper.normalised_title()
+    if self.shingle is None:
+      return set(title.split())
+    if len(title) <= self.shingle:
+      return {title} if title else set()
+    return {title[k:k+self.shingle] for k in range(len(title) - self.shingle + 1)}
+
+  def signature(self, paper):
+    """Return the MinHash signature of the paper, or None if its title has no shingles.
+    The shingles are hashed with crc32, rather than hash(), so that signatures are the same
+    in every process."""
+    shingles = self.shingles(paper)
+    if not shingles:
+      return None
+    x = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.int64)
+    return ((self.a[:,None] * x[None,:] + self.b[:,None]) % self.prime).min(axis=1)
+
+  def signature_keys(self, paper):
+    """Return the keys for the paper: for each band, (band, the values of the signature in that band)."""
+    sig = self.signature(paper)
+    if sig is None:
+      return set()
+    sig = sig.tolist()
+    r = self.rows
+    return {(band, tuple(sig[band*r:(band+1)*r])) for band in range(self.bands)}
+
+  @staticmethod
+  def unpack(keys):
+    """Return the signature held in the keys from signature_keys()."""
+    return np.array([v for band, values in sorted(keys) for v in values], dtype=np.int64)
+
+
+class MinHashIndex(BlockIndex):
+  """A BlockIndex for a MinHashBlocker, which also keeps the signature of each paper, so that
+  candidates can be filtered on their estimated Jaccard similarity."""
+  def __init__(self, blocker, collection):
+    self.signatures = []
+    BlockIndex.__init__(self, blocker, collection)
+
+  def add(self, paper):
+    BlockIndex.add(self, paper)
+    keys = self.keys[-1]
+    self.signatures.append(self.blocker.unpack(keys) if keys else None)
+
+  def similarity(self, keys, positions):
+    """Return the estimated Jaccard similarity of the paper with the given keys to each of the
+    papers at positions, as the fraction of their signatures which agree."""
+    if not keys or not positions:
+      return np.zeros(len(positions))
+    sig = self.blocker.unpack(keys)
+    return (np.array([self.signatures[pos] for pos in positions]) == sig).mean(axis=1)
+
+  def positions(self, paper):
+    result = BlockIndex.positions(self, paper)
+    threshold = self.blocker.threshold
+    if threshold is None or not result:
+      return result
+    positions = list(result)
+    similarity = self.similarity(self.blocker.keys(paper), positions)
+    return {pos for pos, s in zip(positions, similarity.tolist()) if s >= threshold}
+
+  def admits(self, keys, pos):
+    if not BlockIndex.admits(self, keys, pos):
+      return False
+    threshold = self.blocker.threshold
+    return threshold is None or self.similarity(keys, [pos])[0] >= threshold
+
+
+# The attributes which matchers such as title and authors test for equality, as hashable values.
+def _title(p):
+  return p.title
+
+def _authors(p):
+  return tuple(p.authors)
+
+def _year(p):
+  return p.year
+
+def _venue(p):
+  return p.venue
+
+def _first_authors(p, len):
+  return tuple(p.authors[:len])
+
+attributes = {"title": _title, "authors": _authors, "year": _year, "venue": _venue, "first_authors": _first_authors}
+
+def _join_keys(p, fields):
+  return {tuple(attributes[f[0]](p, **dict(f[1:])) for f in fields)}
+
+
+class JoinBlocker(Blocker):
+  """A Blocker for a hash join on the equality of some attributes of the papers.  Each field is the
+  name of an attribute in 'attributes', followed by any (parameter, value) pairs, e.g. ("title",) or
+  ("first_authors", ("len", 2)).  A paper's only key is the tuple of its attributes, so papers are
+  candidates exactly when all the attributes are equal.
+
+  As well as the usual index, two columnar collections can be joined directly with join()."""
+  def __init__(self, fields):
+    self.fields = tuple(fields)
+    names = [f[0] if len(f) == 1 else "{}({})".format(f[0], ", ".join("{}={!r}".format(k,v) for k,v in f[1:])) for f in self.fields]
+    Blocker.__init__(self, "join({})".format(", ".join(names)), functools.partial(_join_keys, fields=self.fields))
+    self._groups = None
+
+  def _codes(self, columns, tables, start=0):
+    """Return a 2-d array with a row of integer codes for each paper in a PaperColumns (from position
+    start on), and a column for each field, such that papers have equal codes exactly when they have
+    equal attributes.  Codes for author lists and odd years are allocated in tables, which is shared
+    between the collections being joined."""
+    result = []
+    for field in self.fields:
+      name, params = field[0], dict(field[1:])
+      if name in ("title", "venue"):
+        result.append(getattr(columns, name).values[start:].astype(np.int64))
+      elif name == "year":
+        years = columns.year.values[start:].astype(np.int64)
+        if columns.odd_years:
+          # Years which aren't integers are held outside the column: give them codes below any year.
+          odd = tables.setdefault("year", {})
+          for k, year in columns.odd_years.items():
+            if k >= start:
+              years[k - start] = -(1 << 20) - odd.setdefault(year, len(odd))
+        result.append(years)
+      else:
+        n = params.get("len")
+        table = tables.setdefault((name, n), {})
+        offsets = columns.authors.offsets.values[start:]
+        codes = columns.authors.codes.values[offsets[0]:].tolist()
+        offsets = (offsets - offsets[0]).tolist()
+        rows = (tuple(codes[a:b] if n is None else codes[a:min(b, a + n)]) for a, b in zip(offsets[:-1], offsets[1:]))
+        result.append(np.array([table.setdefault(row, len(table)) for row in rows], dtype=np.int64))
+    return np.stack(result, axis=1)
+
+  def groups(self, columns1, columns2):
+    """Return (g1, order, g2) where g1 and g2 are the group of each paper in columns1 and columns2,
+    papers being in the same group exactly when they are joined, and order sorts columns2 by group,
+    with g2 in that order.  The result for the last pair of columns is kept, and when papers are
+    appended to either, only the new papers are coded (see JoinGroups)."""
+    groups = self._groups
+    if groups is None or groups.columns1 is not columns1 or groups.columns2 is not columns2:
+      groups = self._groups = JoinGroups(self, columns1, columns2)
+    else:
+      groups.update()
+    return groups.g1, groups.order, groups.g2
+
+  def join(self, columns1, columns2, rows):
+    """Return (i, j), arrays of the positions of all the pairs of papers with equal attributes,
+    where i is in rows (a range of positions in columns1), ordered by i and then j.  The papers must
+    be held as PaperColumns with the same vocabulary."""
+    g1, order, g2 = self.groups(columns1, columns2)
+    i = np.arange(rows.start, rows.stop)
+    lo = np.searchsorted(g2, g1[i], "left")
+    counts = np.searchsorted(g2, g1[i], "right") - lo
+    total = int(counts.sum())
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return np.repeat(i, counts), order[starts + np.arange(total)]
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["_groups"] = None
+    return state
+
+
+class JoinGroups:
+  """The groups of the papers in two PaperColumns for a JoinBlocker: see JoinBlocker.groups().
+  When papers are appended to the columns, update() codes just the new papers, and looks their
+  codes up in a table of the groups, so the work done is in proportion to the new papers (apart
+  from merging new papers in the second columns into the sorted arrays, which numpy does by
+  copying them)."""
+  def __init__(self, blocker, columns1, columns2):
+    self.blocker = blocker
+    self.columns1 = columns1
+    self.columns2 = columns2
+    self.tables = {}
+    self.n1 = len(columns1)
+    self.n2 = len(columns2)
+    codes = np.concatenate([blocker._codes(columns1, self.tables), blocker._codes(columns2, self.tables)])
+    self.unique, groups = np.unique(codes, axis=0, return_inverse=True)
+    groups = groups.ravel()
+    self.lookup = None
+    self.g1 = groups[:self.n1]
+    self.order = np.argsort(groups[self.n1:], kind="stable")
+    self.g2 = groups[self.n1:][self.order]
+
+  def _groups(self, columns, start):
+    """Return the groups of the papers in columns from position start on, adding new groups for
+    new attributes.  The table of groups is only built when it is first needed."""
+    if self.lookup is None:
+      self.lookup = {tuple(row):g for g, row in enumerate(self.unique.tolist())}
+    lookup = self.lookup
+    codes = self.blocker._codes(columns, self.tables, start).tolist()
+    return np.array([lookup.setdefault(tuple(row), len(lookup)) for row in codes], dtype=np.int64)
+
+  def update(self):
+    """Bring the groups up to date with any papers appended to the columns."""
+    if len(self.columns1) > self.n1:
+      self.g1 = np.concatenate([self.g1, self._groups(self.columns1, self.n1)])
+      self.n1 = len(self.columns1)
+    if len(self.columns2) > self.n2:
+      groups = self._groups(self.columns2, self.n2)
+      new = np.argsort(groups, kind="stable")
+      at = np.searchsorted(self.g2, groups[new], "right")
+      self.order = np.insert(self.order, at, self.n2 + new)
+      self.g2 = np.insert(self.g2, at, groups[new])
+      self.n2 = len(self.columns2)
+
+
+def _first_author(p):
+  return p.authors[0] if p.authors else ""
+
+# The string attributes which a FuzzyBlocker can index.
+fuzzy_attributes = {"title": _title, "first_author": _first_author}
+
+class FuzzyBlocker(Blocker):
+  """A blocker which makes papers candidates if an attribute of theirs (the title, or the first
+  author) is within an edit distance of less than 'edit', as tested by fuzzy_title(edit), or (for
+  the first author) first_fuzzy_authors(len, edit).  Rather than having blocking keys, the blocker's
+  key for a paper is the string itself, and its index is a BK-tree of the strings, which finds
+  those within the distance without comparing the string with every other one."""
+  def __init__(self, field, edit):
+    self.field = field
+    self.edit = edit
+    Blocker.__init__(self, "fuzzy({}, edit={!r})".format(field, edit), fuzzy_attributes[field])
+
+  def limit(self, max_block):
+    return self
+
+  def index(self, collection):
+    return FuzzyIndex(self, collection)
+
+
+class FuzzyIndex(BlockIndex):
+  """A BK-tree over the distinct strings (e.g. titles) of a collection, for a FuzzyBlocker.
+  Each node of the tree is a string, and its children are keyed by their edit distance to it.
+  As edit_distance() is a metric, a string within distance r of a query q is only found below the
+  child whose key k satisfies |k - d(q, node)| < r, so most of the tree is never visited.
+
+  The tree is built, and queried, a level at a time, with the distances for a whole level
+  calculated together by edit_distances().  The distances are held in units of half an edit, so
+  that they are integers.  Papers added later (with add()) are inserted one at a time, and merged
+  into the arrays used for searching when they are next needed."""
+  def __init__(self, blocker, collection):
+    self.blocker = blocker
+    self.collection = collection
+    self.keys = [blocker.keys(p) for p in collection]
+    self.strings = list(dict.fromkeys(self.keys))
+    self.node = {string:k for k,string in enumerate(self.strings)}
+    self.children = [{} for _ in self.strings]
+    self._build()
+    self._arrays = None
+    self._edges = []
+
+  def __repr__(self):
+    return "FuzzyIndex({!r}, strings={}, papers={})".format(self.blocker, len(self.strings), len(self.keys))
+
+  def _build(self):
+    """Build the tree from the strings, with the same result as inserting them in order."""
+    strings = self.strings
+    parent = np.zeros(len(strings), dtype=np.int64)
+    pending = np.arange(1, len(strings))
+    while len(pending):
+      d = (2 * edit_distances([strings[k] for k in pending.tolist()], [strings[k] for k in parent[pending].tolist()])).astype(np.int64)
+      order = np.lexsort((pending, d, parent[pending]))
+      pending, d = pending[order], d[order]
+      parents = parent[pending]
+      # The first string at each distance from a node becomes its child, and the others go below that.
+      first = np.r_[True, (parents[1:] != parents[:-1]) | (d[1:] != d[:-1])]
+      heads = pending[first]
+      for head, node, key in zip(heads.tolist(), parents[first].tolist(), d[first].tolist()):
+        self.children[node][key] = head
+      parent[pending] = heads[np.cumsum(first) - 1]
+      pending = pending[~first]
+
+  def add(self, paper):
+    string = self.blocker.keys(paper)
+    self.keys.append(string)
+    if string in self.node:
+      return
+    k = self.node[string] = len(self.strings)
+    self.strings.append(string)
+    self.children.append({})
+    node = 0
+    while k:
+      key = int(2 * bounded_edit_distance(string, self.strings[node]))
+      child = self.children[node].get(key)
+      if child is None:
+        self.children[node][key] = k
+        self._edges.append(((node << 24) + key, k))
+        break
+      node = child
+
+  def arrays(self):
+    """Return the tree as arrays, built on first use: (edges, child, reach, order, starts), where
+    edges holds node * 2^24 + key for each edge, sorted, child the node each edge leads to, reach the
+    largest key below each node, and order the positions of the papers sorted by node, with those
+    of node k from starts[k] to starts[k+1].  Papers added since are merged in by _merge()."""
+    if self._arrays is None:
+      edges = [(node << 24) + key for node, children in enumerate(self.children) for key in children]
+      child = [c for children in self.children for c in children.values()]
+      reach = np.array([max(children) if children else 0 for children in self.children], dtype=np.int64)
+      order = np.argsort(edges, kind="stable")
+      nodes = np.array([self.node[s] for s in self.keys], dtype=np.int64)
+      positions = np.argsort(nodes, kind="stable")
+      starts = np.searchsorted(nodes[positions], np.arange(len(self.strings) + 1))
+      self._arrays = (np.array(edges, dtype=np.int64)[order], np.array(child, dtype=np.int64)[order], reach, positions, starts)
+      self._edges = []
+    elif len(self._arrays[3]) < len(self.keys):
+      self._arrays = self._merge(*self._arrays)
+    return self._arrays
+
+  def _merge(self, edges, child, reach, positions, starts):
+    """Return the arrays with the papers added since they were built merged in: the new edges
+    and papers are sorted, and inserted into the sorted arrays, so only the new papers are
+    looked at (although numpy copies the arrays to insert them)."""
+    reach = np.r_[reach, np.zeros(len(self.strings) - len(reach), dtype=np.int64)]
+    if self._edges:
+      new = np.array(self._edges, dtype=np.int64)
+      new = new[np.argsort(new[:,0])]
+      at = np.searchsorted(edges, new[:,0])
+      edges = np.insert(edges, at, new[:,0])
+      child = np.insert(child, at, new[:,1])
+      np.maximum.at(reach, new[:,0] >> 24, new[:,0] & 0xffffff)
+      self._edges = []
+    added = np.arange(len(positions), len(self.keys))
+    nodes = np.array([self.node[s] for s in self.keys[len(positions):]], dtype=np.int64)
+    order = np.argsort(nodes, kind="stable")
+    added, nodes = added[order], nodes[order]
+    starts = np.r_[starts, np.full(len(self.strings) + 1 - len(starts), starts[-1])]
+    positions = np.insert(positions, starts[nodes + 1], added)
+    starts = starts + np.searchsorted(nodes, np.arange(len(starts)))
+    return edges, child, reach, positions, starts
+
+  def search(self, queries):
+    """Return arrays (q, node) of the nodes whose strings are within the blocker's distance of
+    each of the query strings queries[q]."""
+    edges, child, reach, _, _ = self.arrays()
+    strings = self.strings
+    limit = 2 * self.blocker.edit
+    q = np.arange(len(queries))
+    nodes = np.zeros(len(queries), dtype=np.int64)
+    found_q, found_nodes = [], []
+    while len(q) and strings:
+      # The exact distance is only needed if it could lead to a child, or to a match.
+      d = 2 * edit_distances([queries[k] for k in q.tolist()], [strings[k] for k in nodes.tolist()], (reach[nodes] + limit) / 2.0)
+      hit = d < limit
+      found_q.append(q[hit])
+      found_nodes.append(nodes[hit])
+      near = d < INF
+      q, nodes, d = q[near], nodes[near], d[near]
+      lo = np.searchsorted(edges, (nodes << 24) + d - limit, "right")
+      counts = np.searchsorted(edges, (nodes << 24) + d + limit, "left") - lo
+      q = np.repeat(q, counts)
+      nodes = child[np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())]
+    if not found_q:
+      return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(found_q), np.concatenate(found_nodes)
+
+  def pairs(self, papers, rows, size=1000000, batch=1000):
+    """Yield arrays (i, j) of the pairs of positions of the papers in rows (a range of positions
+    in papers) and the indexed papers within the distance, ordered by i and then j, in chunks of
+    about 'size' pairs.  The queries are made 'batch' papers at a time."""
+    _, _, _, positions, starts = self.arrays()
+    for start in range(rows.start, rows.stop, batch):
+      stop = min(rows.stop, start + batch)
+      q, nodes = self.search([self.blocker.keys(papers[k]) for k in range(start, stop)])
+      counts = starts[nodes + 1] - starts[nodes]
+      i = np.repeat(q + start, counts)
+      j = positions[np.repeat(starts[nodes] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())]
+      order = np.lexsort((j, i))
+      i, j = i[order], j[order]
+      for k in range(0, len(i), size):
+        yield i[k:k+size], j[k:k+size]
+
+  def estimate(self, paper):
+    return len(self.positions(paper))
+
+  def positions(self, paper):
+    _, _, _, positions, starts = self.arrays()
+    _, nodes = self.search([self.blocker.keys(paper)])
+    return {p for node in nodes.tolist() for p in positions[starts[node]:starts[node+1]].tolist()}
+
+  def admits(self, keys, pos):
+    edit = self.blocker.edit
+    return bounded_edit_distance(keys, self.keys[pos], edit) < edit
+
+
+# Keys for sorting the papers by in a SortedNeighbourhood, from the normalised papers.
+def _surname_year(p):
+  surname = p.authors[0].split()[-1].lower() if p.authors and p.authors[0].split() else ""
+  return "{} {}".format(surname, p.year)
+
+def _year_title(p):
+  return "{} {}".format(p.year, p.title)
+
+sort_keys = {"title": _title, "surname_year": _surname_year, "year_title": _year_title}
+
+class SortedNeighbourhood(Blocker):
+  """The sorted neighbourhood method: the papers of both collections are put together and sorted
+  by a key, and the papers from different collections which come within 'window' places of each
+  other are candidates.  There is a pass for each of the keys, and the candidates from all the
+  passes are put together.  The keys are names from sort_keys, or functions of a paper, and are
+  calculated from the normalised papers.  For example:
+
+  collection1.matchup(collection2, match, SortedNeighbourhood(["title", "surname_year"], 10))
+
+  This takes O(n log n + n window) time, and a larger window gives more recall for more pairs.
+  Unlike other blockers, the candidates depend on both collections, so there is no index: the
+  sorted orders are kept for the last two collections (see orders()), and the pairs are read off
+  them by neighbours()."""
+  def __init__(self, keys=("title", "surname_year"), window=10):
+    self.sort_keys = [sort_keys.get(k, k) for k in keys]
+    self.window = window
+    label = "sorted_neighbourhood({}, window={})".format(", ".join(getattr(k, "__name__", k).lstrip("_") for k in self.sort_keys), window)
+    Blocker.__init__(self, label, None)
+    self._orders = None
+
+  def limit(self, max_block):
+    return self
+
+  def index(self, collection):
+    raise TypeError("{!r} has no index: its candidates depend on both collections".format(self))
+
+  def orders(self, collection1, collection2):
+    """Return the SortedOrders of the two collections, which are kept for the last two collections
+    (in either order, so that adding papers to each in turn doesn't sort them again), and brought
+    up to date when papers are appended to either."""
+    orders = self._orders
+    if orders is not None and {id(orders.collection1), id(orders.collection2)} == {id(collection1), id(collection2)}:
+      orders.update()
+    else:
+      orders = self._orders = SortedOrders(self, collection1, collection2)
+    return orders
+
+  def neighbours(self, collection1, collection2, rows=None):
+    """Return a sorted array of i * len(collection2) + j for the candidate pairs (i, j) of positions
+    in the two collections, where i is in rows (a range of positions in collection1, by default all
+    of them)."""
+    if rows is None:
+      rows = range(len(collection1))
+    n2 = len(collection2)
+    i = np.arange(rows.start, rows.stop)
+    orders = self.orders(collection1, collection2)
+    swapped = orders.collection1 is not collection1
+    pairs = []
+    for keys, side, position, where in orders.passes:
+      at = where[swapped][i]
+      for d in range(1, self.window):
+        for other in (at - d, at + d):
+          near = (other >= 0) & (other < len(side))
+          hit = np.flatnonzero(near)[side[other[near]] != swapped]
+          pairs.append(i[hit] * n2 + position[other[hit]])
+    return np.unique(np.concatenate(pairs)) if pairs else np.zeros(0, dtype=np.int64)
+
+  def pairs(self, collection1, collection2, rows, size=1000000):
+    """Yield arrays (i, j) of the candidate pairs, where i is in rows (a range of positions in
+    collection1), ordered by i and then j, in chunks of about 'size' pairs."""
+    n2 = len(collection2)
+    if not n2:
+      return
+    neighbours = self.neighbours(collection1, collection2, rows)
+    for start in range(0, len(neighbours), size):
+      chunk = neighbours[start:start+size]
+      yield chunk // n2, chunk % n2
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["_orders"] = None
+    return state
+
+
+def _objects(values):
+  """Return a numpy array of objects holding the values (which may themselves be tuples)."""
+  result = np.empty(len(values), dtype=object)
+  for k, v in enumerate(values):
+    result[k] = v
+  return result
+
+class SortedOrders:
+  """The papers of two collections sorted for each pass of a SortedNeighbourhood.  For each pass,
+  passes holds (keys, side, position, where): arrays of the keys in order, the side of each paper
+  (False for collection1, True for collection2) and its position in its collection, and a pair of
+  arrays giving where each paper of collection1, and of collection2, is in the order.  Ties are
+  broken by side and then position, so the order is the same however the papers arrived.
+
+  When papers are appended to either collection, update() normalises and sorts just the new papers,
+  and merges them into the arrays, so the work done is in proportion to the new papers (apart from
+  inserting them into the arrays, which numpy does by copying them)."""
+  def __init__(self, blocker, collection1, collection2):
+    self.blocker = blocker
+    self.collection1 = collection1
+    self.collection2 = collection2
+    self.n1 = self.n2 = 0
+    self.passes = [(_objects([]), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), None) for _ in blocker.sort_keys]
+    self.update()
+
+  def update(self):
+    """Bring the orders up to date with any papers appended to the collections."""
+    n1, n2 = len(self.collection1), len(self.collection2)
+    if n1 > self.n1:
+      self._merge(False, self.collection1, self.n1)
+    if n2 > self.n2:
+      self._merge(True, self.collection2, self.n2)
+    if (n1, n2) != (self.n1, self.n2) or self.passes[0][3] is None:
+      self.n1, self.n2 = n1, n2
+      for k, (keys, side, position, _) in enumerate(self.passes):
+        where = (np.zeros(n1, dtype=np.int64), np.zeros(n2, dtype=np.int64))
+        for second in (False, True):
+          at = np.flatnonzero(side == second)
+          where[second][position[at]] = at
+        self.passes[k] = (keys, side, position, where)
+
+  def _merge(self, second, collection, start):
+    """Merge the papers of collection from position start on into the orders."""
+    papers = Normaliser().papers(collection[k] for k in range(start, len(collection)))
+    added = np.arange(start, len(collection))
+    for k, sort_key in enumerate(self.blocker.sort_keys):
+      keys, side, position, where = self.passes[k]
+      new = [sort_key(p) for p in papers]
+      order = sorted(range(len(new)), key=new.__getitem__)
+      new = _objects([new[x] for x in order])
+      if second:
+        # The new papers of collection2 come after any others with the same key.
+        at = np.searchsorted(keys, new, "right")
+      else:
+        # The new papers of collection1 come after the others of collection1 with the same key,
+        # and before those of collection2.
+        lo = np.searchsorted(keys, new, "left")
+        hi = np.searchsorted(keys, new, "right")
+        seconds = np.r_[0, np.cumsum(side)]
+        at = hi - (seconds[hi] - seconds[lo])
+      self.passes[k] = (np.insert(keys, at, new), np.insert(side, at, second), np.insert(position, at, added[order]), where)
+
+
+def blocker(f):
+  """A function decorator which turns a function returning the set of keys for a paper into a
+  Blocker object.  As with @matcher, any arguments after the paper become parameters.
+  For example:
+
+  @blocker
+  def year_bucket(p, width=1):
+    return {p.year // width}
+  """
+  if f.__code__.co_argcount > 1:
+    keys = f.__code__.co_varnames[1:f.__code__.co_argcount]
+    def wrap(*args, **kws):
+      kws.update(zip(keys, args))
+      name = "{}({})".format(f.__name__, ", ".join("{}={!r}".format(k,v) for k,v in kws.items()))
+      return Blocker(name, functools.partial(f, **kws))
+    return wrap
+  return Blocker(f.__name__, f)
+
+@blocker
+def title_tokens(p):
+  return p.words
+
+@blocker
+def exact_title(p):
+  return {p.title}
+
+@blocker
+def first_author(p):
+  """The surname of the first author, lower-cased."""
+  if p.authors and p.authors[0].split():
+    return {p.authors[0].split()[-1].lower()}
+  return set()
+
+@blocker
+def year_bucket(p, width=1):
+  """The year divided into buckets of the given width.  A missing year matches any year."""
+  if isinstance(p.year, int):
+    return {p.year // width}
+  return {ANY}
+
+standard = title_tokens.limit(100) | first_author + year_bucket(1)
@@ -0,0 +1,274 @@
+import numpy as np
+
+import planner
+from matcher import CompoundMatcher, AltCompoundMatcher
+from match_results import MatchResults
+from utils import INF
+
+_POPCOUNT = np.array([bin(x).count("1") for x in range(256)], dtype=np.uint8)
+
+def _set_bits(bits, ids):
+  """Set the bits for the ids in a packed array of bits, without unpacking it."""
+  ids = np.asarray(ids, dtype=np.int64)
+  np.bitwise_or.at(bits, ids >> 3, (0x80 >> (ids & 7)).astype(np.uint8))
+
+
+class PairSet:
+  """A set of pair ids from a CandidateSpace, held as a bitset (a packed array of bits).
+  PairSets support the set operations &, |, - and ~, and len() counts the pairs in the set."""
+  def __init__(self, bits, size):
+    self.bits = bits
+    self.size = size
+
+  @staticmethod
+  def from_mask(mask):
+    """Construct a PairSet from a boolean array, with an element for each pair id."""
+    return PairSet(np.packbits(mask), len(mask))
+
+  @staticmethod
+  def empty(size):
+    return PairSet(np.zeros((size + 7) // 8, np.uint8), size)
+
+  @staticmethod
+  def from_ids(ids, size):
+    result = PairSet.empty(size)
+    _set_bits(result.bits, ids)
+    return result
+
+  def __repr__(self):
+    return "PairSet({} of {})".format(len(self), self.size)
+
+  def __len__(self):
+    return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+  def __bool__(self):
+    return bool(self.bits.any())
+
+  def __and__(self, other):
+    return PairSet(self.bits & other.bits, self.size)
+
+  def __or__(self, other):
+    return PairSet(self.bits | other.bits, self.size)
+
+  def __sub__(self, other):
+    return PairSet(self.bits & ~other.bits, self.size)
+
+  def __invert__(self):
+    """The complement of the set.  The padding bits at the end are kept clear, so that they aren't counted."""
+    bits = ~self.bits
+    if self.size % 8:
+      bits[-1] &= np.uint8(0xff << (8 - self.size % 8) & 0xff)
+    return PairSet(bits, self.size)
+
+  @property
+  def mask(self):
+    """The set as a boolean array, with an element for each pair id."""
+    return np.unpackbits(self.bits, count=self.size).astype(bool)
+
+  def ids(self):
+    """The ids of the pairs in the set, in order."""
+    return np.flatnonzero(self.mask)
+
+  def chunks(self, size=1 << 20):
+    """Yield the ids of the pairs in the set, in order, as arrays covering at most 'size' ids of
+    the space each, so that the ids of a large set needn't all be held at once."""
+    step = max(1, size // 8)
+    for start in range(0, len(self.bits), step):
+      block = self.bits[start:start+step]
+      if block.any():
+        yield np.flatnonzero(np.unpackbits(block)) + 8 * start
+
+
+class CandidateSpace:
+  """A fixed and ordered set of the candidate pairs for matching collection1 with collection2,
+  as generated by the blocker (or all pairs, if the blocker is None).  Each pair has an id, its
+  index in the order, so that the results of matchers over the space can be held as PairSets.
+  The results of primitive matchers are kept, so that the result of any combination of them
+  mostly needs PairSet operations.  So are the distances behind thresholds such as
+  fuzzy_title(edit), so that other values of the threshold are decided without calculating them again."""
+  def __init__(self, collection1, collection2, blocker=None, gold=()):
+    self.collection1 = collection1
+    self.collection2 = collection2
+    self.blocker = blocker
+    n2 = len(collection2)
+    if blocker is None:
+      # All the pairs: the id of the pair (i, j) is i*n2 + j, so there is no need to store them.
+      self.keys = None
+      self.size = len(collection1) * n2
+    else:
+      # The pairs are generated in order of i and then j, so their keys i*n2 + j are sorted.
+      chunks = [i * n2 + j for i, j in collection1.pairs(collection2, blocker)]
+      self.keys = np.concatenate(chunks) if chunks else np.zeros(0, np.int64)
+      self.size = len(self.keys)
+    self.ids1 = [p.id for p in collection1]
+    self.ids2 = [p.id for p in collection2]
+    self.position1 = {id:k for k,id in enumerate(self.ids1)}
+    self.position2 = {id:k for k,id in enumerate(self.ids2)}
+    # The results of primitive matchers: for each, the pairs it has been evaluated on, and those it matched.
+    self.leaves = {}
+    # The pairs generated by the blockers of planned matchers, when the space has no blocker.
+    self.candidate_pairs = {}
+    # The distances of Thresholds: for each feature, the sorted ids of the pairs it has been
+    # calculated for, their distances, and the limits they were calculated with.
+    self.distance_cache = {}
+    self.gold = self.from_pairs(gold, strict=False)
+
+  def __repr__(self):
+    return "CandidateSpace({!r}, size={})".format(self.blocker, self.size)
+
+  def __len__(self):
+    return self.size
+
+  def _positions(self, ids):
+    """Return the positions (i, j) of the pairs with the given ids, as arrays."""
+    n2 = len(self.collection2)
+    keys = ids if self.keys is None else self.keys[ids]
+    return keys // n2, keys % n2
+
+  def all(self):
+    """The PairSet of all the pairs in the space."""
+    return ~PairSet.empty(self.size)
+
+  def candidates(self, blocker):
+    """The PairSet of the pairs which the blocker generates, in a space without a blocker (where
+    the id of each pair is i*n2 + j).  It is kept for each blocker."""
+    if blocker not in self.candidate_pairs:
+      result = PairSet.empty(self.size)
+      n2 = len(self.collection2)
+      for i, j in self.collection1.pairs(self.collection2, blocker):
+        _set_bits(result.bits, i * n2 + j)
+      self.candidate_pairs[blocker] = result
+    return self.candidate_pairs[blocker]
+
+  def plan(self, matcher, within):
+    """Return (matcher, within) to evaluate in place of the given ones, with the same result.  If
+    the space has no blocker, the matcher is planned as by PaperCollection.matchup(), and only the
+    pairs generated by the planned blocker (a hash join, or a BK-tree search) are kept in within,
+    so the matcher isn't evaluated on the full cross product.  Otherwise its compositions are just
+    reordered by planner.optimise(), so that cheap, decisive parts come first."""
+    if self.keys is not None:
+      return planner.optimise(matcher), within
+    matcher, blocker = planner.plan(matcher)
+    if blocker is not None:
+      within = within & self.candidates(blocker)
+    return matcher, within
+
+  def evaluate(self, matcher, within=None):
+    """Return the PairSet of the pairs, amongst those in within (by default all of them), which
+    match according to matcher.  The matcher is first rewritten by plan().  Composite matchers are
+    evaluated with PairSet operations, and, as with Matcher.mask(), each part is only evaluated
+    on the pairs which are still undecided.  The result of each primitive matcher is kept for
+    every pair it has been evaluated on, so it is never evaluated on the same pair twice."""
+    if within is None:
+      within = self.all()
+    return self._evaluate(*self.plan(matcher, within))
+
+  def _evaluate(self, matcher, within):
+    if isinstance(matcher, CompoundMatcher):
+      for m in matcher.matchers:
+        within = self._evaluate(m, within)
+      return within
+    if isinstance(matcher, AltCompoundMatcher):
+      result = PairSet.empty(self.size)
+      for m in matcher.matchers:
+        result = result | self._evaluate(m, within - result)
+      return result
+    key = (matcher.label, getattr(matcher.func, "func", matcher.func))
+    if key not in self.leaves:
+      self.leaves[key] = (PairSet.empty(self.size), PairSet.empty(self.size))
+    known, value = self.leaves[key]
+    todo = within - known
+    if todo:
+      # The pairs are evaluated a chunk at a time, so their ids are never all held at once.
+      value = PairSet(value.bits.copy(), self.size)
+      for ids in todo.chunks():
+        _set_bits(value.bits, ids[self._mask(matcher, ids)])
+      self.leaves[key] = (known | todo, value)
+    return within & value if matcher.positive else within - value
+
+  def _mask(self, matcher, ids):
+    """Return whether each of the pairs with the given ids matches the primitive matcher, ignoring
+    its sign.  If it has a distance threshold, such as fuzzy_title(edit), this is decided from the
+    distances()."""
+    threshold = matcher.threshold
+    if threshold is not None and threshold.below:
+      return self.distances(threshold, ids, threshold.value) < threshold.value
+    i, j = self._positions(ids)
+    # Matchers are called with the paper from collection2 first, as in PaperCollection.matchup().
+    mask = matcher.mask(self.collection2, self.collection1, j, i)
+    return mask if matcher.positive else ~mask
+
+  def distances(self, threshold, ids, limit):
+    """Return the feature of a Threshold which is a distance (i.e. below is True) for each of the
+    pairs with the given ids, which must be sorted.  As with Threshold.feature, a distance need
+    only be exact if it is less than limit, and may otherwise be INF.  The distances are kept with
+    the limit they were calculated with, so a pair's distance is only calculated again if it wasn't
+    found before, and the limit is larger: evaluating the loosest value of a threshold first
+    answers all the tighter ones."""
+    feature = threshold.feature
+    key = (threshold.param, feature.func, tuple(sorted(feature.keywords.items())))
+    empty = np.zeros(0, np.int64), np.zeros(0), np.zeros(0)
+    known, values, limits = self.distance_cache.get(key, empty)
+    result = np.full(len(ids), INF)
+    have = np.zeros(len(ids), bool)
+    at = np.searchsorted(known, ids)
+    if len(known):
+      at = np.minimum(at, len(known) - 1)
+      have = known[at] == ids
+      result[have] = values[at[have]]
+    # A distance which wasn't less than its limit is only known to be at least that limit.
+    todo = ~have
+    todo[have] = (result[have] >= limits[at[have]]) & (limits[at[have]] < limit)
+    if todo.any():
+      i, j = self._positions(ids[todo])
+      result[todo] = feature(self.collection2.columns, self.collection1.columns, j, i, limit)
+      keep = np.ones(len(known), bool)
+      keep[at[have & todo]] = False
+      known = np.concatenate([known[keep], ids[todo]])
+      order = np.argsort(known, kind="stable")
+      values = np.concatenate([values[keep], result[todo]])[order]
+      limits = np.concatenate([limits[keep], np.full(int(todo.sum()), float(limit))])[order]
+      self.distance_cache[key] = (known[order], values, limits)
+    return result
+
+  def feature(self, threshold, pairs, limit):
+    """Return the feature of a Threshold for each of the pairs in a PairSet, in order of id.
+    As with evaluate(), the paper from collection2 comes first."""
+    if threshold.below:
+      return self.distances(threshold, pairs.ids(), limit)
+    i, j = self._positions(pairs.ids())
+    return threshold.feature(self.collection2.columns, self.collection1.columns, j, i, limit)
+
+  def from_pairs(self, pairs, strict=True):
+    """Return the PairSet for a collection of (paper1.id, paper2.id) pairs.  If strict is True,
+    a ValueError is raised if any of the pairs isn't in the space; otherwise they are left out."""
+    n2 = len(self.collection2)
+    keys = [self.position1[k1] * n2 + self.position2[k2] for k1,k2 in pairs
+            if k1 in self.position1 and k2 in self.position2]
+    if strict and len(keys) < len(pairs):
+      raise ValueError("Pairs are not in the candidate space")
+    keys = np.array(keys, dtype=np.int64)
+    if self.keys is None:
+      return PairSet.from_ids(keys, self.size)
+    ids = np.searchsorted(self.keys, keys)
+    found = ids < self.size
+    found[found] = self.keys[ids[found]] == keys[found]
+    if strict and not found.all():
+      raise ValueError("Pairs are not in the candidate space")
+    return PairSet.from_ids(ids[found], self.size)
+
+  def pairs(self, pairs):
+    """Return the set of (paper1.id, paper2.id) for a PairSet.  This is the reverse of from_pairs()."""
+    i, j = self._positions(pairs.ids())
+    ids1, ids2 = self.ids1, self.ids2
+    return {(ids1[a], ids2[b]) for a,b in zip(i.tolist(), j.tolist())}
+
+  def match_results(self, pairs):
+    """Return the MatchResults for a PairSet, as PaperCollection.matchup() would give it."""
+    papers1 = self.collection1.papers
+    papers2 = self.collection2.papers
+    results = {}
+    i, j = self._positions(pairs.ids())
+    for a, b in zip(i.tolist(), j.tolist()):
+      results.setdefault(a, []).append(papers2[b])
+    return MatchResults(dict((papers1[a], values) for a, values in results.items()))
@@ -0,0 +1,290 @@
+import numpy as np
+
+from paper import Paper
+
+MISSING_YEAR = -1
+
+
+class Vocabulary:
+  """Interns strings as integer codes, so that strings can be stored and compared as integers.
+  A single vocabulary is shared by all PaperColumns, so that codes from different collections
+  can be compared directly."""
+  def __init__(self):
+    self.index = {}
+    self.strings = []
+
+  def __len__(self):
+    return len(self.strings)
+
+  def __getitem__(self, code):
+    return self.strings[code]
+
+  def code(self, string):
+    """Return the code for string, allocating a new one if it hasn't been seen before."""
+    code = self.index.get(string)
+    if code is None:
+      code = self.index[string] = len(self.strings)
+      self.strings.append(string)
+    return code
+
+  def codes(self, strings):
+    """Return the codes for the strings as a list."""
+    get = self.index.get
+    result = [get(s) for s in strings]
+    if None in result:
+      result = [self.code(s) if c is None else c for s,c in zip(strings, result)]
+    return result
+
+  def find(self, string):
+    """Return the code for string, or -1 if it has never been seen."""
+    return self.index.get(string, -1)
+
+vocabulary = Vocabulary()
+
+
+class Column:
+  """A numpy array which can be appended to, by growing its capacity geometrically."""
+  def __init__(self, dtype, values=()):
+    self.data = np.array(values, dtype=dtype)
+    self.size = len(self.data)
+
+  @staticmethod
+  def wrap(array):
+    """Construct a Column around an existing array (which may be read-only, e.g. memory-mapped)
+    without copying it.  The array is only copied if the column is extended."""
+    column = Column(array.dtype)
+    column.data = array
+    column.size = len(array)
+    return column
+
+  def __len__(self):
+    return self.size
+
+  @property
+  def values(self):
+    """The contents of the column, as a numpy array."""
+    return self.data[:self.size]
+
+  def extend(self, values):
+    values = np.asarray(values, dtype=self.data.dtype)
+    if not len(values):
+      return
+    size = self.size + len(values)
+    # A wrapped array may be a memory-mapped file, which mustn't be written to, so it is copied.
+    if size > len(self.data) or isinstance(self.data, np.memmap) or not self.data.flags.writeable:
+      data = np.empty(max(size, 2*len(self.data), 16), dtype=self.data.dtype)
+      data[:self.size] = self.values
+      self.data = data
+    self.data[self.size:size] = values
+    self.size = size
+
+  def append(self, value):
+    self.extend([value])
+
+
+class RaggedColumn:
+  """A column where each row is a variable length list of codes, stored as a flat array of
+  the codes and an array of offsets into it (row i is codes[offsets[i]:offsets[i+1]])."""
+  def __init__(self):
+    self.offsets = Column(np.int64, [0])
+    self.codes = Column(np.int32)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i):
+    offsets = self.offsets.data
+    return self.codes.data[offsets[i]:offsets[i+1]]
+
+  def append(self, codes):
+    self.extend([codes])
+
+  def extend(self, rows):
+    """Append several rows at once."""
+    lengths = [len(r) for r in rows]
+    self.codes.extend([c for r in rows for c in r])
+    self.offsets.extend(self.offsets.values[-1] + np.cumsum(lengths))
+
+  @property
+  def lengths(self):
+    return np.diff(self.offsets.values)
+
+
+class PaperColumns:
+  """A column store for papers.  Rather than holding a Paper object for each paper, the attributes
+  are held in numpy arrays of codes from the shared vocabulary:
+  - id, title and venue are a code each
+  - words are the codes of the (sorted) title words, and authors are the codes of the author names,
+    both held in RaggedColumns
+  - year is an int16, with MISSING_YEAR where the year isn't an integer.
+  Paper objects are built on demand when indexed, so a PaperColumns can stand in for the list of
+  papers in a PaperCollection, while vectorised code can use the columns directly."""
+  def __init__(self, vocab=vocabulary):
+    self.vocabulary = vocab
+    self.id = Column(np.int32)
+    self.title = Column(np.int32)
+    self.words = RaggedColumn()
+    self.authors = RaggedColumn()
+    self.venue = Column(np.int32)
+    self.year = Column(np.int16)
+    self.odd_years = {}
+    self.position = {}
+    self.lookup = ColumnLookup(self)
+
+  @staticmethod
+  def build(papers, vocab=vocabulary):
+    """Construct a PaperColumns object from an iterable of Paper objects."""
+    columns = PaperColumns(vocab)
+    columns.extend(papers)
+    return columns
+
+  def __len__(self):
+    return len(self.id)
+
+  def __repr__(self):
+    return "PaperColumns(length={})".format(len(self))
+
+  def __iter__(self):
+    """Build the Paper objects in turn.  The columns are converted to lists a block at a time,
+    which is much faster than indexing the arrays for each paper."""
+    strings = self.vocabulary.strings
+    block = 4096
+    for start in range(0, len(self), block):
+      stop = min(len(self), start + block)
+      ids, titles, venues, years = (c.values[start:stop].tolist() for c in (self.id, self.title, self.venue, self.year))
+      wo = self.words.offsets.values[start:stop+1].tolist()
+      ao = self.authors.offsets.values[start:stop+1].tolist()
+      words = self.words.codes.values[wo[0]:wo[-1]].tolist()
+      authors = self.authors.codes.values[ao[0]:ao[-1]].tolist()
+      for k in range(stop - start):
+        year = years[k]
+        if year == MISSING_YEAR:
+          year = self.odd_years.get(start + k, "")
+        yield Paper._make((
+          strings[ids[k]],
+          strings[titles[k]],
+          {strings[c] for c in words[wo[k]-wo[0]:wo[k+1]-wo[0]]},
+          [strings[c] for c in authors[ao[k]-ao[0]:ao[k+1]-ao[0]]],
+          strings[venues[k]],
+          year))
+
+  def __getitem__(self, item):
+    """If a slice is given, return a PaperColumns object for those papers,
+    otherwise return the Paper at that position."""
+    if isinstance(item, slice):
+      return self.take(range(len(self))[item])
+    return self.paper(item)
+
+  def paper(self, i):
+    """Build the Paper object at position i."""
+    if i < 0:
+      i += len(self)
+    strings = self.vocabulary.strings
+    year = int(self.year.data[i])
+    if year == MISSING_YEAR:
+      year = self.odd_years.get(i, "")
+    return Paper._make((
+      strings[self.id.data[i]],
+      strings[self.title.data[i]],
+      {strings[c] for c in self.words[i]},
+      [strings[c] for c in self.authors[i]],
+      strings[self.venue.data[i]],
+      year))
+
+  def append(self, paper):
+    self.extend([paper])
+
+  def extend(self, papers):
+    """Append the papers to the columns.  The new values are gathered first, so that each
+    column only grows once."""
+    code = self.vocabulary.code
+    codes = self.vocabulary.codes
+    ids, titles, words, authors, venues, years = [], [], [], [], [], []
+    start = len(self)
+    for i, paper in enumerate(papers, start):
+      self.position[paper.id] = i
+      ids.append(code(paper.id))
+      titles.append(code(paper.title))
+      words.append(sorted(codes(paper.words)))
+      authors.append(codes(paper.authors))
+      venues.append(code(paper.venue))
+      if isinstance(paper.year, int) and -32768 <= paper.year < 32768 and paper.year != MISSING_YEAR:
+        years.append(paper.year)
+      else:
+        years.append(MISSING_YEAR)
+        if paper.year != "":
+          self.odd_years[i] = paper.year
+    self.id.extend(ids)
+    self.title.extend(titles)
+    self.words.extend(words)
+    self.authors.extend(authors)
+    self.venue.extend(venues)
+    self.year.extend(years)
+
+  def arrays(self):
+    """Return a dictionary of all the arrays which make up the columns."""
+    return dict(
+      id=self.id.values, title=self.title.values, venue=self.venue.values, year=self.year.values,
+      words_offsets=self.words.offsets.values, words_codes=self.words.codes.values,
+      authors_offsets=self.authors.offsets.values, authors_codes=self.authors.codes.values)
+
+  @staticmethod
+  def from_arrays(arrays, odd_years=None, vocab=vocabulary):
+    """Construct a PaperColumns object around the arrays given by arrays(), without copying them."""
+    columns = PaperColumns(vocab)
+    for name in ("id", "title", "venue", "year"):
+      setattr(columns, name, Column.wrap(arrays[name]))
+    for name in ("words", "authors"):
+      ragged = getattr(columns, name)
+      ragged.offsets = Column.wrap(arrays[name + "_offsets"])
+      ragged.codes = Column.wrap(arrays[name + "_codes"])
+    columns.odd_years = dict(odd_years or {})
+    strings = vocab.strings
+    columns.position = {strings[c]:i for i,c in enumerate(columns.id.values.tolist())}
+    return columns
+
+  def copy(self):
+    """Return a copy of the columns, which either can be extended without changing the other.
+    The arrays are shared, as read-only views, which Column.extend() copies before writing to."""
+    columns = PaperColumns(self.vocabulary)
+    for name, array in self.arrays().items():
+      view = array.view()
+      view.flags.writeable = False
+      if name.endswith("_offsets") or name.endswith("_codes"):
+        ragged, part = name.rsplit("_", 1)
+        setattr(getattr(columns, ragged), part, Column.wrap(view))
+      else:
+        setattr(columns, name, Column.wrap(view))
+    columns.odd_years = dict(self.odd_years)
+    columns.position = dict(self.position)
+    return columns
+
+  def take(self, positions):
+    """Return a new PaperColumns object with the papers at the given positions."""
+    return PaperColumns.build((self.paper(i) for i in positions), self.vocabulary)
+
+
+class ColumnLookup:
+  """A read-only mapping from paper id to Paper, for a PaperColumns object."""
+  def __init__(self, columns):
+    self.columns = columns
+
+  def __len__(self):
+    return len(self.columns)
+
+  def __contains__(self, id):
+    return id in self.columns.position
+
+  def __getitem__(self, id):
+    return self.columns.paper(self.columns.position[id])
+
+  def get(self, id, default=None):
+    if id in self:
+      return self[id]
+    return default
+
+  def __iter__(self):
+    return iter(self.columns.position)
+
+  def keys(self):
+    return self.columns.position.keys()
@@ -0,0 +1,161 @@
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+import blocking
+import columns
+import ingest
+import normaliser
+import paper
+from columns import PaperColumns, vocabulary
+
+# The cache is kept in a directory next to each data file.  Set enabled to False to turn it off.
+enabled = True
+directory = ".paper_cache"
+
+def _source_hash(*modules):
+  sha = hashlib.sha1()
+  for module in modules:
+    sha.update(inspect.getsource(module).encode("utf-8"))
+  return sha.hexdigest()
+
+# Cached papers depend on how they are read and normalised, and how they are stored; cached
+# indices also depend on the blockers.  Any change to that code changes the version, and so
+# invalidates the cache.
+VERSION = _source_hash(paper, ingest, normaliser, columns)
+INDEX_VERSION = _source_hash(paper, ingest, normaliser, columns, blocking)
+
+def digest(filename):
+  """Return a hash of the contents of the file."""
+  sha = hashlib.sha1()
+  with open(filename, "rb") as f:
+    for block in iter(lambda: f.read(1 << 20), b""):
+      sha.update(block)
+  return sha.hexdigest()
+
+def origin(filename, kind):
+  """Return the origin of a collection of papers read from the file: the digest of the file and
+  the kind of processing applied ("raw" or "normalised").  Returns None if the cache is disabled."""
+  if not enabled:
+    return None
+  return digest(filename), kind
+
+def _path(filename, origin, version, suffix=""):
+  name = "{}-{}{}-{}-{}".format(os.path.basename(filename), origin[1], suffix, origin[0][:16], version[:16])
+  return os.path.join(os.path.dirname(os.path.abspath(filename)), directory, name)
+
+def _blocker_hash(blocker):
+  """Return a hash of the blocker, covering the code of its key functions, or None if the code
+  can't be found (in which case its index isn't cached)."""
+  sha = hashlib.sha1(repr(blocker).encode("utf-8"))
+  for b in getattr(blocker, "blockers", [blocker]):
+    if hasattr(b, "blockers"):
+      h = _blocker_hash(b)
+      if h is None:
+        return None
+      sha.update(h.encode("utf-8"))
+      continue
+    func = getattr(b.func, "func", b.func)
+    try:
+      sha.update(inspect.getsource(func).encode("utf-8"))
+    except (OSError, TypeError):
+      return None
+  return sha.hexdigest()
+
+def _save(path, write):
+  """Write a cache entry into a temporary directory with write(dirname), and then move it into
+  place, removing any older entries for the same file and kind.  Failures only cause a warning,
+  as the cache is just an optimisation.  The temporary directory is removed if anything fails."""
+  parent, name = os.path.split(path)
+  prefix = name.rsplit("-", 2)[0] + "-"
+  tmp = None
+  try:
+    if not os.path.isdir(parent):
+      os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent)
+    write(tmp)
+    for old in os.listdir(parent):
+      if old.startswith(prefix) and old.count("-") == name.count("-") and old != name:
+        shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
+    os.rename(tmp, path)
+    tmp = None
+  except OSError as e:
+    warnings.warn("Unable to write to the cache {!r}: {}".format(path, e))
+  finally:
+    if tmp is not None:
+      shutil.rmtree(tmp, ignore_errors=True)
+
+def save_columns(filename, origin, cols):
+  """Save the columns to the cache.  The codes are saved relative to the strings they use (rather
+  than the whole vocabulary, which may include strings from other collections)."""
+  if not enabled or origin is None:
+    return
+  arrays = cols.arrays()
+  code_arrays = ("id", "title", "venue", "words_codes", "authors_codes")
+  used = np.unique(np.concatenate([arrays[name] for name in code_arrays]))
+  strings = [cols.vocabulary[c] for c in used.tolist()]
+  for name in code_arrays:
+    arrays[name] = np.searchsorted(used, arrays[name]).astype(np.int32)
+  def write(dirname):
+    for name, array in arrays.items():
+      np.save(os.path.join(dirname, name + ".npy"), array)
+    with open(os.path.join(dirname, "strings.pickle"), "wb") as f:
+      pickle.dump((strings, cols.odd_years), f, pickle.HIGHEST_PROTOCOL)
+  _save(_path(filename, origin, VERSION), write)
+
+def load_columns(filename, origin):
+  """Return the columns saved in the cache, or None if there are none.  The arrays are
+  memory-mapped where possible, which is whenever the saved strings have the same codes in the
+  vocabulary as they had when saved (e.g. when this is the first collection loaded)."""
+  if not enabled or origin is None:
+    return None
+  path = _path(filename, origin, VERSION)
+  if not os.path.isdir(path):
+    return None
+  with open(os.path.join(path, "strings.pickle"), "rb") as f:
+    strings, odd_years = pickle.load(f)
+  codes = np.array(vocabulary.codes(strings), dtype=np.int32)
+  identity = np.array_equal(codes, np.arange(len(codes)))
+  arrays = {}
+  for name in os.listdir(path):
+    if name.endswith(".npy"):
+      name = name[:-4]
+      array = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+      if name in ("id", "title", "venue", "words_codes", "authors_codes") and not identity:
+        array = codes[array]
+      arrays[name] = array
+  return PaperColumns.from_arrays(arrays, odd_years)
+
+def save_index(filename, origin, index):
+  """Save a blocking index to the cache."""
+  if not enabled or origin is None:
+    return
+  h = _blocker_hash(index.blocker)
+  if h is None:
+    return
+  def write(dirname):
+    with open(os.path.join(dirname, "index.pickle"), "wb") as f:
+      pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+  _save(_path(filename, origin, INDEX_VERSION, ".index." + h[:16]), write)
+
+def load_index(filename, origin, blocker, collection):
+  """Return the blocking index for blocker saved in the cache, attached to the collection,
+  or None if there is none."""
+  if not enabled or origin is None:
+    return None
+  h = _blocker_hash(blocker)
+  if h is None:
+    return None
+  path = _path(filename, origin, INDEX_VERSION, ".index." + h[:16])
+  if not os.path.isdir(path):
+    return None
+  with open(os.path.join(path, "index.pickle"), "rb") as f:
+    index = pickle.load(f)
+  index.attach(blocker, collection)
+  return index
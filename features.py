@@ -0,0 +1,89 @@
+import collections
+from utils import *
+
+
+class FeatureCache:
+  """A bounded cache of raw pairwise features, keyed on (paper1.id, paper2.id, feature),
+  which discards the least recently used entries once it is full.  Each entry also records the
+  values the feature was calculated from (e.g. the two titles), so that a paper normalised in
+  a different way, but with the same id, doesn't pick up a stale value."""
+  def __init__(self, maxsize=1000000):
+    self.maxsize = maxsize
+    self.entries = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __repr__(self):
+    return "FeatureCache(size={}, maxsize={}, hits={}, misses={})".format(len(self), self.maxsize, self.hits, self.misses)
+
+  def __len__(self):
+    return len(self.entries)
+
+  def lookup(self, key, source):
+    """Return the cached value for key, or None if it isn't cached (or was calculated from another source)."""
+    entry = self.entries.get(key)
+    if entry is None or entry[0] != source:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return entry[1]
+
+  def store(self, key, source, value):
+    self.entries[key] = (source, value)
+    self.entries.move_to_end(key)
+    if len(self.entries) > self.maxsize:
+      self.entries.popitem(last=False)
+
+  def clear(self):
+    self.entries.clear()
+    self.hits = 0
+    self.misses = 0
+
+cache = FeatureCache()
+
+def _bounded(p, q, feature, source, limit, fn):
+  """Return fn(limit), a distance which is INF unless it is less than limit, using the cache.
+  A cached distance is stored with the limit it was calculated with: if it was less than that
+  limit it is exact and can answer any query, otherwise it can answer any query with a smaller
+  limit.  Only a query with a larger limit needs the distance to be recalculated."""
+  key = (p.id, q.id, feature)
+  entry = cache.lookup(key, source)
+  if entry is not None:
+    value, bound = entry
+    if value < INF or limit <= bound:
+      return value if value < limit else INF
+  value = fn(limit)
+  cache.store(key, source, (value, limit))
+  return value
+
+def title_distance(p, q, limit=INF):
+  """The edit distance between the titles, or INF if it is not less than limit."""
+  return _bounded(p, q, "title_distance", (p.title, q.title), limit,
+                  lambda limit: bounded_edit_distance(p.title, q.title, limit))
+
+def cut_title_distance(p, q, limit=INF):
+  """The cut edit distance between the titles, or INF if it is not less than limit."""
+  return _bounded(p, q, "cut_title_distance", (p.title, q.title), limit,
+                  lambda limit: cut_edit_distance(p.title, q.title, limit))
+
+def author_distance(p, q, n, limit=INF):
+  """The largest edit distance between corresponding authors, amongst the first n authors,
+  or INF if it is not less than limit, or if the papers have different numbers of authors."""
+  a1 = p.authors[:n]
+  a2 = q.authors[:n]
+  def calc(limit):
+    if len(a1) != len(a2):
+      return INF
+    return max([bounded_edit_distance(x, y, limit) for x,y in zip(a1, a2)] or [0])
+  return _bounded(p, q, ("author_distance", n), (a1, a2), limit, calc)
+
+def word_overlap(p, q):
+  """The number of words the titles have in common."""
+  key = (p.id, q.id, "word_overlap")
+  source = (p.title, q.title)
+  value = cache.lookup(key, source)
+  if value is None:
+    value = len(p.words & q.words)
+    cache.store(key, source, value)
+  return value
@@ -0,0 +1,39 @@
+import csv
+
+from paper import Paper
+from normaliser import Normaliser
+
+def decode_lines(lines, encodings=("utf-8", "latin-1")):
+  """Decode each line of bytes with the first of the encodings which works.  The data files mix
+  encodings (DBLP1.csv is mostly ASCII, but some lines are Latin-1), so this is done line by line.
+  Latin-1 can decode any bytes, so it should come last."""
+  for line in lines:
+    for encoding in encodings:
+      try:
+        yield line.decode(encoding)
+        break
+      except UnicodeDecodeError:
+        pass
+
+def read_rows(filename, header=True):
+  """Yield the rows of a CSV file one at a time, as lists of strings, skipping the header row."""
+  with open(filename, 'rb') as csvfile:
+    rows = csv.reader(decode_lines(csvfile))
+    if header:
+      next(rows, None)
+    for row in rows:
+      yield row
+
+def stream(filename, chunksize=10000, normalise=True):
+  """Yield the papers in a CSV file as lists of at most chunksize papers, normalising
+  them as they are read if normalise is True.  Only one chunk of papers is held at a time,
+  although the Normaliser keeps the normalised names and venues for the whole file."""
+  normaliser = Normaliser()
+  chunk = []
+  for row in read_rows(filename):
+    chunk.append(Paper.build(*row))
+    if len(chunk) >= chunksize:
+      yield normaliser.papers(chunk) if normalise else chunk
+      chunk = []
+  if chunk:
+    yield normaliser.papers(chunk) if normalise else chunk
@@ -1,4 +1,6 @@
 import collections
+import itertools
+import numpy as np
 from paper import Paper
 import pandas as pd
 
@@ -39,11 +41,30 @@ class MatchResult:
     return "{}\n{}".format(self.key.year, "\n".join(str(v.year) for v in self.values))
 
 
+def _attribute(paper, name):
+  value = getattr(paper, name)
+  return ", ".join(value) if name == "authors" else value
+
+def _chunks(rows, size):
+  """Yield lists of up to size items from the iterable rows."""
+  rows = iter(rows)
+  while True:
+    chunk = list(itertools.islice(rows, size))
+    if not chunk:
+      return
+    yield chunk
+
+
 class MatchResults:
-  """MatchResults is a dictionary of MatchResult values, mapping papers to their matches."""
+  """MatchResults is a dictionary of MatchResult values, mapping papers to their matches.
+  The results shouldn't be changed once the object is built, as the ordered list of keys and the
+  columnar view used by the dataframe properties are built on first use and kept."""
   def __init__(self, results):
     self.results = results
     self.dict = {k.id:(k,v) for k,v in results.items()}
+    self._keys = None
+    self._store = None
+    self._frames = {}
 
   @staticmethod
   def fromKeys(pairs, collection1, collection2):
@@ -56,10 +77,18 @@ class MatchResults:
     result = {collection1[key]:[collection2[v] for v in values] for key,values in merged.items()}
     return MatchResults(result)
 
+  @property
+  def keys(self):
+    """The papers with matches, in order, so that a MatchResult can be found by position."""
+    if self._keys is None:
+      self._keys = list(self.results)
+    return self._keys
+
   def _get(self, index):
     """Get a single MatchResult item given an integer, string or Paper index."""
     if isinstance(index, int):
-      return self.results.items()[index]
+      key = self.keys[index]
+      return key, self.results[key]
     if isinstance(index, str):
       return self.dict[index]
     if isinstance(index, Paper):
@@ -74,7 +103,7 @@ class MatchResults:
     elif isinstance(index, (list, tuple, set)):
       return MatchResults(dict(self._get(x) for x in index))
     elif isinstance(index, slice):
-      return MatchResults(dict(self.results.items()[index]))
+      return MatchResults(dict((k, self.results[k]) for k in self.keys[index]))
     else:
       return MatchResult(self._get(index))
 
@@ -90,64 +119,138 @@ class MatchResults:
     This is effectively the reverse operation to MatchResults.fromKeys()"""
     return {(k.id,m.id) for k,matches in self.results.items() for m in matches}
 
+  @property
+  def store(self):
+    """The matches as parallel columns, with a row for each pair: (owner, rank, values), where
+    values[k] is the rank[k]'th match of the paper keys[owner[k]].  It is built on first use."""
+    if self._store is None:
+      lengths = [len(self.results[k]) for k in self.keys]
+      owner = np.repeat(np.arange(len(lengths)), lengths)
+      first = np.cumsum(lengths) - lengths
+      rank = np.arange(len(owner)) - np.repeat(first, lengths)
+      values = [v for k in self.keys for v in self.results[k]]
+      self._store = (owner, rank, values)
+    return self._store
+
+  def _frame(self, name, attribute, blank):
+    """Return a dataframe with a row for each paper with matches, and a column for it and for each
+    of its matches (up to the most any paper has), holding attribute(paper), or blank where a paper
+    has fewer matches.  The frame is built from the store, a column at a time, and kept."""
+    if name not in self._frames:
+      owner, rank, values = self.store
+      flat = np.empty(len(values), dtype=object)
+      for k, v in enumerate(values):
+        flat[k] = attribute(v)
+      keys = np.empty(len(self.keys), dtype=object)
+      for k, v in enumerate(self.keys):
+        keys[k] = attribute(v)
+      result = dict(DBLP1=keys)
+      for i in range(int(rank.max()) + 1 if len(rank) else 0):
+        column = np.full(len(keys), blank, dtype=object)
+        live = rank == i
+        column[owner[live]] = flat[live]
+        result["Scholar ({})".format(i)] = column
+      self._frames[name] = pd.DataFrame(result)
+    return self._frames[name].copy()
+
   @property
   def dataframe(self):
     """Construct a dataframe from the match results where each value is a paper."""
-    keys, values = list(zip(*self.results.items()))
-    n = max(len(v) for v in values)
-    result = dict(DBLP1=keys)
-    for i in range(n):
-      result["Scholar ({})".format(i)] = [v[i] if i<len(v) else None for v in values]
-    return pd.DataFrame(result)
+    return self._frame("dataframe", lambda v: v, None)
 
   @property
   def id(self):
     """Construct a dataframe from the match results where each value is the id of the paper."""
-    df = self.dataframe
-    for col in df.columns:
-      df[col] = [v.id if v is not None else "---" for v in df[col]]
-    return df
+    return self._frame("id", lambda v: v.id, "---")
 
   @property
   def authors(self):
     """Construct a dataframe from the match results where each value is the authors of the paper."""
-    df = self.dataframe
-    for col in df.columns:
-      df[col] = [", ".join(v.authors) if v is not None else "---" for v in df[col]]
-    return df
+    return self._frame("authors", lambda v: ", ".join(v.authors), "---")
 
   @property
   def title(self):
     """Construct a dataframe from the match results where each value is the title of the paper."""
-    df = self.dataframe
-    for col in df.columns:
-      df[col] = [v.title if v is not None else "---" for v in df[col]]
-    return df
+    return self._frame("title", lambda v: v.title, "---")
 
   @property
   def venue(self):
     """Construct a dataframe from the match results where each value is the venue of the paper."""
-    df = self.dataframe
-    for col in df.columns:
-      df[col] = [v.venue if v is not None else "---" for v in df[col]]
-    return df
+    return self._frame("venue", lambda v: v.venue, "---")
 
   @property
   def year(self):
     """Construct a dataframe from the match results where each value is the year of the paper."""
-    df = self.dataframe
-    for col in df.columns:
-      df[col] = [v.year if v is not None else "---" for v in df[col]]
-    return df
+    return self._frame("year", lambda v: v.year, "---")
+
+  def _columns(self, attributes):
+    """The names of the columns written by write()."""
+    return ["{}1".format(a) for a in attributes] + ["{}2".format(a) for a in attributes] + ["rank"]
+
+  def _rows(self, attributes):
+    """Yield a row for each match: the attributes of the two papers, and the rank of the match."""
+    for key in self.keys:
+      k = [_attribute(key, a) for a in attributes]
+      for rank, v in enumerate(self.results[key]):
+        yield k + [_attribute(v, a) for a in attributes] + [rank] + self._extra(key, v)
+
+  def _extra(self, key, value):
+    """Any further values written for the match between key and value."""
+    return []
+
+  def write(self, filename, attributes=("id", "title", "authors", "venue", "year"), chunksize=100000, format=None):
+    """Write the matches to a CSV or Parquet file, with a row for each pair of papers giving the
+    attributes of each (e.g. id1, title1, ..., id2, title2, ...) and the rank of the match.
+    The format is taken from the file extension (.parquet or .pq for Parquet), unless it is given.
+    The rows are written chunksize at a time, so only one chunk is ever held in memory.
+    Writing Parquet needs pyarrow."""
+    if format is None:
+      format = "parquet" if filename.endswith((".parquet", ".pq")) else "csv"
+    columns = self._columns(attributes)
+    chunks = (pd.DataFrame(chunk, columns=columns) for chunk in _chunks(self._rows(attributes), chunksize))
+    if format == "csv":
+      with open(filename, "w", newline="", encoding="utf-8") as f:
+        header = True
+        for df in chunks:
+          df.to_csv(f, header=header, index=False)
+          header = False
+        if header:
+          pd.DataFrame([], columns=columns).to_csv(f, index=False)
+    elif format == "parquet":
+      import pyarrow as pa
+      import pyarrow.parquet as pq
+      writer = None
+      try:
+        for df in chunks:
+          table = pa.Table.from_pandas(df.astype({c: str for c in columns if c.startswith("year")}), preserve_index=False)
+          if writer is None:
+            writer = pq.ParquetWriter(filename, table.schema)
+          writer.write_table(table)
+      finally:
+        if writer is not None:
+          writer.close()
+      if writer is None:
+        pq.write_table(pa.table({c: pa.array([], pa.string()) for c in columns}), filename)
+    else:
+      raise ValueError("Unknown format {!r}, expected csv or parquet".format(format))
+
+  def one_to_one(self, method="greedy", score=None):
+    """Resolve these matches into a one-to-one assignment, with assignment.assign()."""
+    import assignment
+    return assignment.assign(self, method, score)
 
   def __add__(self, matcher):
-    """Add this with a matcher.  That is, construct a new MatchResults based on this one, but further constrained."""
-    result = dict()
-    for key, values in self.results.items():
-      r = [v for v in values if matcher(key,v)]
-      if r:
-        result[key] = r
-    return MatchResults(result)
+    """Add this with a matcher.  That is, construct a new MatchResults based on this one, but further constrained.
+    The matcher is evaluated on all the stored pairs at once, with Matcher.mask()."""
+    from paper_collection import PaperCollection
+    owner, rank, values = self.store
+    if not len(values):
+      return MatchResults({})
+    keep = np.flatnonzero(matcher.mask(PaperCollection(None, self.keys), PaperCollection(None, values), owner, np.arange(len(values))))
+    result = collections.defaultdict(list)
+    for a, k in zip(owner[keep].tolist(), keep.tolist()):
+      result[a].append(values[k])
+    return MatchResults(dict((self.keys[a], v) for a, v in result.items()))
 
   def __or__(self, match_results):
     """Or this with other matcher results!  That is, construct a new MatchResults based on this, 
@@ -160,3 +263,28 @@ class MatchResults:
       else:
         result[k] = v[:]
     return MatchResults(result)
+
+
+class ScoredMatchResults(MatchResults):
+  """MatchResults where each match has a score, as returned by PaperCollection.best().  The matches
+  of each paper are in order of decreasing score.  scores maps (id1, id2) to the score of a pair.
+  Combining these with a matcher or other results gives plain MatchResults."""
+  def __init__(self, results, scores):
+    MatchResults.__init__(self, results)
+    self.scores = scores
+
+  def score(self, key, value):
+    """Return the score of the match between the papers (or ids) key and value."""
+    return self.scores[(getattr(key, "id", key), getattr(value, "id", value))]
+
+  def _columns(self, attributes):
+    return MatchResults._columns(self, attributes) + ["score"]
+
+  def _extra(self, key, value):
+    return [self.scores[(key.id, value.id)]]
+
+  @property
+  def scored(self):
+    """Construct a dataframe with a row for each match: the two ids, the score and the rank."""
+    rows = [(k.id, v.id, self.scores[(k.id, v.id)], rank) for k, values in self.results.items() for rank, v in enumerate(values)]
+    return pd.DataFrame(rows, columns=["DBLP1", "Scholar", "score", "rank"])
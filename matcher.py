@@ -1,14 +1,27 @@
+import numpy as np
+
 from utils import *
+from features import *
+from columns import MISSING_YEAR
 
 class Matcher:
   """A Matcher object is a function which determines whether two papers match.
   It may be negated to indicate that a False response from the matcher means
   that the papers do match.  It is commonly constructed from a function 
-  using the @matcher decorator."""
-  def __init__(self, label, fn, positive=True):
+  using the @matcher decorator.
+
+  A Matcher may also have a batch function, which takes the PaperColumns of two collections
+  and arrays of positions i and j, and returns a boolean array saying whether each pair of
+  papers (i[k], j[k]) match.  This is used by mask() to evaluate many pairs at once.
+
+  If the Matcher is monotone in one of its parameters, its threshold is a Threshold describing
+  that, which allows the results for every value of the parameter to be found at once."""
+  def __init__(self, label, fn, positive=True, batch=None, threshold=None):
     self.label = label
     self.func = fn
     self.positive = positive
+    self.batch = batch
+    self.threshold = threshold
 
   def __repr__(self):
     if self.positive:
@@ -20,7 +33,22 @@ class Matcher:
     return self.positive == self.func(p1, p2)
 
   def __neg__(self):
-    return Matcher(self.label, self.func, not self.positive)
+    return Matcher(self.label, self.func, not self.positive, self.batch, self.threshold)
+
+  @property
+  def batched(self):
+    """Whether any part of this matcher has a batch function."""
+    return self.batch is not None
+
+  def mask(self, collection1, collection2, i, j):
+    """Return a boolean array saying whether each pair of papers (collection1[i[k]], collection2[j[k]])
+    match.  If there is no batch function, each pair is evaluated in turn."""
+    if self.batch is not None:
+      result = self.batch(collection1.columns, collection2.columns, i, j)
+      return result if self.positive else ~result
+    papers1 = collection1.papers
+    papers2 = collection2.papers
+    return np.fromiter((self(papers1[a], papers2[b]) for a,b in zip(i.tolist(), j.tolist())), bool, len(i))
 
   def __add__(self, matcher):
     """Construct a CompoundMatcher from this and another matcher so that both conditions must be met."""
@@ -56,6 +84,10 @@ class CompositeMatcher(Matcher):
   def __neg__(self):
     return self.__class__(*[-m for m in self.matchers])
 
+  @property
+  def batched(self):
+    return any(m.batched for m in self.matchers)
+
 
 class CompoundMatcher(CompositeMatcher):
   """A composite matcher linked by '+', meaning that all matchers must match."""
@@ -67,6 +99,16 @@ class CompoundMatcher(CompositeMatcher):
         return False
     return True
 
+  def mask(self, collection1, collection2, i, j):
+    """Each matcher is only evaluated on the pairs which all the previous matchers accepted."""
+    result = np.ones(len(i), bool)
+    for matcher in self.matchers:
+      live = np.flatnonzero(result)
+      if not len(live):
+        break
+      result[live] = matcher.mask(collection1, collection2, i[live], j[live])
+    return result
+
 
 class AltCompoundMatcher(CompositeMatcher):
   """A composite matcher linked by '|', meaning that any matchers may match."""
@@ -78,29 +120,207 @@ class AltCompoundMatcher(CompositeMatcher):
         return True
     return False
 
+  def mask(self, collection1, collection2, i, j):
+    """Each matcher is only evaluated on the pairs which all the previous matchers rejected."""
+    result = np.zeros(len(i), bool)
+    for matcher in self.matchers:
+      live = np.flatnonzero(~result)
+      if not len(live):
+        break
+      result[live] = matcher.mask(collection1, collection2, i[live], j[live])
+    return result
+
+class Threshold:
+  """A Threshold describes a Matcher which is monotone in its parameter 'param': a pair matches
+  exactly when feature(c1, c2, i, j, limit) for the pair is less than the value of the parameter
+  (or more than it, if below is False).  The feature need only be exact when it is less than limit,
+  and may otherwise be INF.  The other parameters of the Matcher are already bound to the feature."""
+  def __init__(self, param, value, feature, below=True):
+    self.param = param
+    self.value = value
+    self.feature = feature
+    self.below = below
+
+  def __repr__(self):
+    return "Threshold({}={!r})".format(self.param, self.value)
+
+  def same(self, other):
+    """Whether other is a Threshold for the same feature, perhaps with a different value."""
+    return (other is not None and self.param == other.param and self.below == other.below and
+            self.feature.func == other.feature.func and self.feature.keywords == other.feature.keywords)
+
+
+def monotone(param, feature, below=True):
+  """A function decorator, used beneath @matcher or @vectorised, which records that the matcher
+  is monotone in the parameter 'param'.  The Matchers built from it are given a Threshold, with
+  feature taking (c1, c2, i, j, limit) and the other parameters.  For example:
+
+  @vectorised(_fuzzy_title_batch)
+  @monotone("edit", _title_distances)
+  def fuzzy_title(p, q, edit):
+    return title_distance(p, q, edit) < edit
+  """
+  def decorate(f):
+    f.monotone = (param, feature, below)
+    return f
+  return decorate
+
 import functools
 
-def matcher(f):
+def matcher(f, batch=None):
   """A function decorator which turns a function into a Matcher object.  This
   allows the function to be composed with other functions.  For example:
 
   @matcher
   def title(p, q):
     return p.title == q.title
-  """
+
+  If the function has parameters, the result is a function taking them and returning a Matcher,
+  and its 'func' is the function, as for the Matchers it returns."""
   if f.__code__.co_argcount > 2:
     keys = f.__code__.co_varnames[2:]
     def wrap(*args, **kws):
       kws.update(zip(keys, args))
       name = "{}({})".format(f.__name__, ", ".join("{}={!r}".format(k,v) for k,v in kws.items()))
       func = functools.partial(f, **kws)
-      return Matcher(name, func)
+      return Matcher(name, func, batch=batch and functools.partial(batch, **kws), threshold=_threshold(f, kws))
+    wrap.func = f
     return wrap
-  return Matcher(f.__name__, f)
-
-def fauthors(a1, a2, edit):
-  if len(a1) == len(a2):
-    return all(edit_distance(x,y)<edit for x,y in zip(a1, a2))
+  return Matcher(f.__name__, f, batch=batch)
+
+def _threshold(f, kws):
+  """Return the Threshold for the matcher f(p, q, **kws), if f is @monotone."""
+  if not hasattr(f, "monotone"):
+    return None
+  param, feature, below = f.monotone
+  names = f.__code__.co_varnames[2:f.__code__.co_argcount]
+  params = dict(zip(names[::-1], (f.__defaults__ or ())[::-1]))
+  params.update(kws)
+  value = params.pop(param)
+  return Threshold(param, value, functools.partial(feature, **params), below)
+
+def vectorised(batch):
+  """A function decorator like @matcher, which also gives the Matcher a batch function
+  taking (columns1, columns2, i, j), plus any parameters of the matcher.  For example:
+
+  def title_batch(c1, c2, i, j):
+    return c1.title.values[i] == c2.title.values[j]
+
+  @vectorised(title_batch)
+  def title(p, q):
+    return p.title == q.title
+  """
+  return lambda f: matcher(f, batch)
+
+def _gather(ragged, idx, n=None):
+  """Return (owner, codes) for the rows idx of a RaggedColumn, where owner[k] is the index into
+  idx of the row which codes[k] came from.  If n is given, only the first n codes of each row are used."""
+  offsets = ragged.offsets.values
+  starts = offsets[idx]
+  lengths = offsets[idx + 1] - starts
+  if n is not None:
+    lengths = np.minimum(lengths, n)
+  owner = np.repeat(np.arange(len(idx)), lengths)
+  first = np.cumsum(lengths) - lengths
+  codes = ragged.codes.values[np.repeat(starts - first, lengths) + np.arange(lengths.sum())]
+  return owner, codes
+
+def _rows_equal(r1, r2, i, j, n=None):
+  """Return whether the rows (or their first n codes) of two RaggedColumns are equal, in order."""
+  l1 = np.diff(r1.offsets.values)[i]
+  l2 = np.diff(r2.offsets.values)[j]
+  if n is not None:
+    l1 = np.minimum(l1, n)
+    l2 = np.minimum(l2, n)
+  result = l1 == l2
+  for k in range(int(l1.max()) if len(l1) else 0):
+    live = np.flatnonzero(result & (l1 > k))
+    if not len(live):
+      break
+    o1 = r1.offsets.values[i[live]] + k
+    o2 = r2.offsets.values[j[live]] + k
+    result[live] = r1.codes.values[o1] == r2.codes.values[o2]
+  return result
+
+def _odd_years(c, idx):
+  """Return whether each of the papers idx has a year which is neither an integer nor blank."""
+  if not c.odd_years:
+    return np.zeros(len(idx), bool)
+  return np.isin(idx, list(c.odd_years))
+
+def _fix_odd_years(result, c1, c2, i, j, test):
+  """Evaluate test on the years for the pairs with odd years, which aren't held in the columns."""
+  for k in np.flatnonzero(_odd_years(c1, i) | _odd_years(c2, j)):
+    result[k] = test(c1.paper(i[k]).year, c2.paper(j[k]).year)
+  return result
+
+def _strings(c, codes):
+  strings = c.vocabulary.strings
+  return [strings[x] for x in codes.tolist()]
+
+def _bad_title_batch(c1, c2, i, j):
+  codes = [c1.vocabulary.find(t) for t in bad_titles]
+  return np.isin(c1.title.values[i], codes) | np.isin(c2.title.values[j], codes)
+
+def _word_overlaps(c1, c2, i, j):
+  """Return the number of title words in common, and the total number of title words, for each pair."""
+  o1, w1 = _gather(c1.words, i)
+  o2, w2 = _gather(c2.words, j)
+  n = len(c1.vocabulary)
+  common = np.isin(o1.astype(np.int64) * n + w1, o2.astype(np.int64) * n + w2)
+  overlap = np.bincount(o1[common], minlength=len(i))
+  l1 = np.diff(c1.words.offsets.values)[i]
+  l2 = np.diff(c2.words.offsets.values)[j]
+  return overlap, l1 + l2
+
+def _words_batch(c1, c2, i, j, frac=0.5):
+  overlap, total = _word_overlaps(c1, c2, i, j)
+  return overlap > frac * total * 0.5
+
+def _word_fractions(c1, c2, i, j, limit):
+  """The threshold feature for words(frac): the overlap as a fraction of the average number of words."""
+  overlap, total = _word_overlaps(c1, c2, i, j)
+  result = np.full(len(i), -INF)
+  some = total > 0
+  result[some] = overlap[some] / (total[some] * 0.5)
+  return result
+
+def _title_batch(c1, c2, i, j):
+  return c1.title.values[i] == c2.title.values[j]
+
+def _authors_batch(c1, c2, i, j):
+  return _rows_equal(c1.authors, c2.authors, i, j)
+
+def _first_authors_batch(c1, c2, i, j, len):
+  return _rows_equal(c1.authors, c2.authors, i, j, len)
+
+def _year_batch(c1, c2, i, j):
+  result = c1.year.values[i] == c2.year.values[j]
+  return _fix_odd_years(result, c1, c2, i, j, lambda y1, y2: y1 == y2)
+
+def _valid_year_batch(c1, c2, i, j):
+  y1 = c1.year.values[i]
+  y2 = c2.year.values[j]
+  result = (y1 == y2) | (y1 == MISSING_YEAR) | (y2 == MISSING_YEAR)
+  return _fix_odd_years(result, c1, c2, i, j, lambda y1, y2: y1 == y2 or y1 == "" or y2 == "")
+
+def _venue_batch(c1, c2, i, j):
+  return c1.venue.values[i] == c2.venue.values[j]
+
+def _title_distances(c1, c2, i, j, limit, cut=False):
+  return edit_distances(_strings(c1, c1.title.values[i]), _strings(c2, c2.title.values[j]), limit, cut)
+
+def _cut_title_distances(c1, c2, i, j, limit):
+  return _title_distances(c1, c2, i, j, limit, cut=True)
+
+def _fuzzy_title_batch(c1, c2, i, j, edit, cut=False):
+  return _title_distances(c1, c2, i, j, edit, cut) < edit
+
+def _cut_fuzzy_title_batch(c1, c2, i, j, edit):
+  return _fuzzy_title_batch(c1, c2, i, j, edit, cut=True)
+
+def _author_distances(c1, c2, i, j, limit, len):
+  return np.array([author_distance(c1.paper(a), c2.paper(b), len, limit) for a,b in zip(i.tolist(), j.tolist())], float)
 
 bad_titles = {
   "editorial", "keynote address", "reminiscences on influential papers", 
@@ -108,55 +328,65 @@ bad_titles = {
   "guest editor s introduction", "title"
   }
 
-@matcher
+@vectorised(_bad_title_batch)
 def bad_title(p,q):
   return p.title in bad_titles or q.title in bad_titles
 
-@matcher
+@vectorised(_words_batch)
+@monotone("frac", _word_fractions, below=False)
 def words(p,q,frac=0.5):
-  return len(p.words & q.words) > frac * (len(p.words)+len(q.words))*0.5
+  return word_overlap(p, q) > frac * (len(p.words)+len(q.words))*0.5
 
-@matcher
+@vectorised(_title_batch)
 def title(p,q):
   return p.title==q.title
 
-@matcher
+@vectorised(_authors_batch)
 def authors(p,q):
   return p.authors==q.authors
 
-@matcher
+@vectorised(_first_authors_batch)
 def first_authors(p,q,len):
   return p.authors[:len]==q.authors[:len]
 
 @matcher
+@monotone("edit", _author_distances)
 def first_fuzzy_authors(p,q,len,edit):
-  return fauthors(p.authors[:len], q.authors[:len], edit)
+  return author_distance(p, q, len, edit) < edit
 
-@matcher
+@vectorised(_year_batch)
 def year(p,q):
   return p.year==q.year
 
-@matcher
+@vectorised(_valid_year_batch)
 def valid_year(p,q):
   return p.year==q.year or q.year=="" or p.year==""
 
-@matcher
+@vectorised(_venue_batch)
 def venue(p,q):
   return p.venue==q.venue
 
-@matcher
+@vectorised(_fuzzy_title_batch)
+@monotone("edit", _title_distances)
 def fuzzy_title(p,q,edit):
-  return edit_distance(p.title, q.title) < edit
+  return title_distance(p, q, edit) < edit
 
-@matcher
+@vectorised(_cut_fuzzy_title_batch)
+@monotone("edit", _cut_title_distances)
 def cut_fuzzy_title(p,q,edit):
-  return cut_edit_distance(p.title, q.title) < edit
+  return cut_title_distance(p, q, edit) < edit
 
 #fuzzy_title = lambda n: Matcher("fuzzy_title({})".format(n), lambda p,q: edit_distance(p.title, q.title) < n)
 #cut_fuzzy_title = lambda n: Matcher("cut_fuzzy_title({})".format(n), lambda p,q: cut_edit_distance(p.title, q.title) < n)
 
 #cauthors = lambda n: Matcher("cauthors({})".format(n), lambda p,q: p.authors[:n]==q.authors[:n])
-#cfauthors = lambda n: Matcher("cfauthors({})".format(n), lambda p,q: fauthors(p.authors[:n], q.authors[:n]))
+
+def _always_batch(c1, c2, i, j):
+  return np.ones(len(i), bool)
+
+@vectorised(_always_batch)
+def always(p,q):
+  return True
 
 match = title+(-bad_title|authors+year)
 
@@ -1,6 +1,23 @@
 import collections
 import re
 
+# The patterns used for normalisation, compiled once.
+TITLE_PUNCTUATION = re.compile("[^a-z0-9]+")
+VENUE_PROCEEDINGS = re.compile(r"proc(\.|eedings)? ?(of ?(the )?)?(\d+(st|nd|rd|th))? ?")
+VENUE_YEAR = re.compile(r"(19|20)\d\d ?")
+
+def normalise_title(title):
+  """Return the title normalised for punctuation and case."""
+  return TITLE_PUNCTUATION.sub(" ", title.lower()).strip()
+
+def normalise_venue(venue):
+  v = venue.strip(",").strip()
+  if v == "N/A":
+    return ""
+  v = VENUE_PROCEEDINGS.sub("proc ", v.lower())
+  v = VENUE_YEAR.sub("", v) # get rid of years
+  return v
+
 
 class Paper(collections.namedtuple('Paper', "id title words authors venue year")):
   """Paper is a class based on a named tuple, used to represent the attributes of a paper."""
@@ -33,7 +50,7 @@ Year:    {}
 
   def normalised_title(self):
     """Return the title normalised for punctuation and case."""
-    return re.sub("[^a-z0-9]+", " ", self.title.lower()).strip()
+    return normalise_title(self.title)
 
   @staticmethod
   def normalised_name(names):
@@ -47,12 +64,7 @@ Year:    {}
     return [self.normalised_name(names) for names in (author.split() for author in self.authors) if names]
 
   def normalised_venue(self):
-    v = self.venue.strip(",").strip()
-    if v == "N/A":
-      return ""
-    v = re.sub(r"proc(\.|eedings)? ?(of ?(the )?)?(\d+(st|nd|rd|th))? ?", "proc ", v.lower())
-    v = re.sub(r"(19|20)\d\d ?", "", v) # get rid of years
-    return v
+    return normalise_venue(self.venue)
 
   def normalise(self):
     """Return a version of this with some level of normalisation to facilitate comparisons."""
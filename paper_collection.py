@@ -1,9 +1,21 @@
-import csv
 import collections
+import heapq
+import numpy as np
 
 from matcher import *
-from match_results import MatchResults
+from match_results import MatchResults, ScoredMatchResults
 from paper import Paper
+from normaliser import Normaliser
+from columns import PaperColumns
+from blocking import JoinBlocker, FuzzyIndex, SortedNeighbourhood
+from venues import VenueCounts
+from query import QueryIndex
+import blocking
+import disk_cache
+import ingest
+import parallel
+import planner
+import ranking
 
 
 class PaperCollection:
@@ -11,14 +23,104 @@ class PaperCollection:
   def __init__(self, filename, papers=None):
     """Construct a collection of paper objects.  If the papers are given, treat this as a
     copy constructor, otherwise, read the papers from the file.  In either case, construct
-    a lookup dictionary for fast access of the papers by their id."""
+    a lookup dictionary for fast access of the papers by their id.  The papers may also be
+    given as a PaperColumns object, in which case the lookup is provided by the columns.
+
+    Papers read from the file are saved in the disk cache, and read from there next time
+    (unless the file, or the code for reading it, has changed)."""
     self.filename = filename
+    self.origin = None
     if papers is None:
-      with open(filename, 'rb') as csvfile:
-        self.papers = [Paper.build(*row) for row in csv.reader(csvfile)][1:]
+      self.origin = disk_cache.origin(filename, "raw")
+      columns = disk_cache.load_columns(filename, self.origin)
+      if columns is None:
+        self.papers = [Paper.build(*row) for row in ingest.read_rows(filename)]
+        disk_cache.save_columns(filename, self.origin, PaperColumns.build(self.papers))
+      else:
+        self.papers = list(columns)
     else:
       self.papers = papers
-    self.lookup = {p.id:p for p in self.papers}
+    if isinstance(self.papers, PaperColumns):
+      self.lookup = self.papers.lookup
+    else:
+      self.lookup = {p.id:p for p in self.papers}
+    self.indices = {}
+    self._columns = None
+    self.venue_alignment = None
+    self._query_index = None
+
+  @staticmethod
+  def load(filename, normalise=True, columnar=True, blockers=(), chunksize=10000):
+    """Construct a collection by streaming the papers from the file in chunks, normalising them
+    (if normalise is True) as they are read.  Unlike PaperCollection(filename).normalised(), there
+    is never a second copy of the papers: each chunk is added to the collection (held in columns,
+    if columnar is True), and to the lookup and the indices for the blockers, before the next one
+    is read.
+
+    The papers and the indices are saved in the disk cache, and on later calls are read from
+    there (unless the file, or the code for reading it, has changed).  Columns read from the cache
+    are memory-mapped where possible, so that loading a columnar collection is very fast."""
+    origin = disk_cache.origin(filename, "normalised" if normalise else "raw")
+    columns = disk_cache.load_columns(filename, origin)
+    if columns is not None:
+      collection = PaperCollection(filename, columns if columnar else list(columns))
+      collection.origin = origin
+      for blocker in blockers:
+        collection.index(blocker)
+      return collection
+    collection = PaperCollection(filename, PaperColumns() if columnar else [])
+    for blocker in blockers:
+      collection.index(blocker)
+    for chunk in ingest.stream(filename, chunksize, normalise):
+      collection.extend(chunk)
+    collection.origin = origin
+    disk_cache.save_columns(filename, origin, collection.columns)
+    for index in collection.indices.values():
+      disk_cache.save_index(filename, origin, index)
+    return collection
+
+  def extend(self, papers):
+    """Add the papers to the end of the collection, updating the lookup and any indices."""
+    papers = list(papers)
+    self.origin = None
+    self._query_index = None
+    self.papers.extend(papers)
+    if not self.is_columnar:
+      self.lookup.update((p.id, p) for p in papers)
+      if self._columns is not None:
+        self._columns.extend(papers)
+    for index in self.indices.values():
+      for p in papers:
+        index.add(p)
+
+  def add(self, papers, collection, matcher, blocker=None, first=True, optimise=True):
+    """Add the papers to this collection, updating its lookup and indices, and return a MatchResults
+    object for the matches between just the new papers and 'collection'.  This is the part of the
+    result of matchup() which involves the new papers, so it can be merged with the existing
+    result using MatchResults.__or__().  If first is True, this collection is the first in the
+    matchup (i.e. this.matchup(collection, ...)), otherwise it is the second, and the results
+    are keyed by the papers in 'collection'.  The cost depends on the number of new papers (and
+    their candidates), not on the size of the collections.  As with matchup(), if optimise is True
+    the matcher and blocker are rewritten by planner.plan()."""
+    if optimise:
+      matcher, blocker = planner.plan(matcher, blocker)
+    start = len(self)
+    self.extend(papers)
+    if isinstance(blocker, SortedNeighbourhood) and not first:
+      # Sort the papers in the order of the matchup, which decides how ties are broken.
+      blocker.orders(collection, self)
+    matches = collections.defaultdict(list)
+    for i, j in self.pairs(collection, blocker, rows=range(start, len(self))):
+      if first:
+        keep = matcher.mask(collection, self, j, i)
+        pairs = zip(i[keep].tolist(), j[keep].tolist())
+      else:
+        keep = matcher.mask(self, collection, i, j)
+        pairs = zip(j[keep].tolist(), i[keep].tolist())
+      for a, b in pairs:
+        matches[a].append(b)
+    papers1, papers2 = (self.papers, collection.papers) if first else (collection.papers, self.papers)
+    return MatchResults(dict((papers1[a], [papers2[b] for b in sorted(matches[a])]) for a in sorted(matches)))
 
   def __repr__(self):
     return "PaperCollection({!r}, length={})".format(self.filename, len(self.papers))
@@ -41,22 +143,60 @@ class PaperCollection:
       return self.lookup[item]
 
   def find(self, **kws):
-    """Return a list of papers which match the criteria exactly."""
-    result = self.papers
-    if "title" in kws:
-      result = (paper for paper in result if paper.match_title(kws["title"]))
-    if "authors" in kws:
-      result = (paper for paper in result if paper.match_authors(kws["authors"]))
-    if "venue" in kws:
-      result = (paper for paper in result if paper.match_venue(kws["venue"]))
-    return list(result)
+    """Return a list of the papers which meet all of the criteria, in order, e.g.
+
+    collection.find(authors="M Stonebraker", year=(1995, 1999), words="query")
+
+    The criteria are those of QueryIndex.find(): title, words, authors, venue and year.  The papers
+    are looked up in the secondary indices of query_index, which are built on first use."""
+    papers = self.papers
+    return [papers[k] for k in self.query_index.find(**kws).tolist()]
+
+  @property
+  def query_index(self):
+    """The QueryIndex of this collection, built on first use (and again after extend())."""
+    if self._query_index is None:
+      self._query_index = QueryIndex(self)
+    return self._query_index
 
   def __getslice__(self, start=None, stop=None):
     return PaperCollection(self.filename, self.papers[start:stop])
 
-  def matches(self, paper, matcher):
-    """Return a list of papers which match the paper (according to the matcher function)."""
-    return [p for p in self if matcher(p, paper)]
+  def matches(self, paper, matcher, candidates=None):
+    """Return a list of papers which match the paper (according to the matcher function).
+    If candidates is given, only those papers are considered, rather than the whole collection."""
+    if candidates is None:
+      candidates = self
+    return [p for p in candidates if matcher(p, paper)]
+
+  def index(self, blocker):
+    """Return the blocking index of this collection for 'blocker', building it on first use."""
+    if blocker not in self.indices:
+      index = disk_cache.load_index(self.filename, self.origin, blocker, self)
+      if index is None:
+        index = blocker.index(self)
+        disk_cache.save_index(self.filename, self.origin, index)
+      self.indices[blocker] = index
+    return self.indices[blocker]
+
+  def candidates(self, collection, blocker=None):
+    """Yield (paper, candidates) for each paper in this collection, where candidates are the
+    papers in 'collection' which share a blocking key with the paper.  If blocker is None,
+    every paper in 'collection' is a candidate."""
+    if blocker is None:
+      for p in self:
+        yield p, collection
+    elif isinstance(blocker, SortedNeighbourhood):
+      candidates = collections.defaultdict(list)
+      for i, j in self.pairs(collection, blocker):
+        for a, b in zip(i.tolist(), j.tolist()):
+          candidates[a].append(collection.papers[b])
+      for a, p in enumerate(self):
+        yield p, candidates[a]
+    else:
+      index = collection.index(blocker)
+      for p in self:
+        yield p, index.candidates(p)
 
   @property
   def n(self):
@@ -64,20 +204,201 @@ class PaperCollection:
     return self.normalised()
 
   def normalised(self):
-    """Return a new collection based on the current one with all the papers in the collection normalised."""
-    return PaperCollection(self.filename, [p.normalise() for p in self])
-
-  def align_venues(self, papers, matcher):
-    """Find an alignment between all the venues in one collection and the other."""
-    counters = collections.defaultdict(collections.Counter)
-    for p in papers:
-      matches = self.matches(p, matcher)
-      if len(matches) == 1:
-        counters[p.venue][matches[0].venue] += 1
-    self.venue_counts = counters
-    self.venue_map = {k2:k1 for k1,v1 in counters.items() for k2 in v1}
-
-  def matchup(self, collection, matcher):
+    """Return a new collection based on the current one with all the papers in the collection normalised.
+    If this collection was read from a file, the normalised papers are kept in the disk cache."""
+    origin = self.origin and (self.origin[0], "normalised")
+    columns = disk_cache.load_columns(self.filename, origin)
+    if columns is not None:
+      papers = columns if self.is_columnar else list(columns)
+    else:
+      papers = Normaliser().papers(self)
+      if self.is_columnar or origin is not None:
+        columns = PaperColumns.build(papers)
+        disk_cache.save_columns(self.filename, origin, columns)
+        if self.is_columnar:
+          papers = columns
+    result = PaperCollection(self.filename, papers)
+    result.origin = origin
+    return result
+
+  @property
+  def is_columnar(self):
+    return isinstance(self.papers, PaperColumns)
+
+  def columnar(self):
+    """Return a new collection with the same papers, held in a PaperColumns object.  The columns
+    are a copy, so that extending either collection leaves the other as it was."""
+    result = PaperCollection(self.filename, self.columns.copy())
+    result.origin = self.origin
+    return result
+
+  @property
+  def columns(self):
+    """The papers as a PaperColumns object, for vectorised code.  For a collection which is not
+    columnar, the columns are built on first use."""
+    if self.is_columnar:
+      return self.papers
+    if self._columns is None:
+      self._columns = PaperColumns.build(self.papers)
+    return self._columns
+
+  def align_venues(self, papers, matcher, blocker=None, update=False, most_common=False):
+    """Find an alignment between all the venues in one collection and the other, from the papers
+    which match exactly one paper in this collection.  papers may be a list or a PaperCollection.
+    The matching is done as by matchup() (so a matcher such as title becomes a hash join on the
+    titles), and the venue counts are kept in a venues.VenueCounts object, venue_alignment.
+    If update is True, the counts are added to those from earlier calls, so the alignment can be
+    refreshed as new papers arrive by passing just the new papers.
+
+    Nothing is returned: the results are the attributes venue_counts, a dictionary of venue in
+    papers -> Counter of venues in this collection, and venue_map, a dictionary of venue in this
+    collection -> venue in papers.  By default venue_map is built from every pairing seen, blanks
+    included, so each venue maps to the last venue in papers (in the order first seen) it went
+    with.  If most_common is True, each venue maps to the one it goes with most often instead (ties
+    going to the pair seen first), and blank venues on either side are left out."""
+    if not isinstance(papers, PaperCollection):
+      papers = PaperCollection(self.filename, list(papers))
+    matcher, blocker = planner.plan(matcher, blocker)
+    unique = [(a, matches[0]) for a, matches in papers.match_positions(self, matcher, blocker) if len(matches) == 1]
+    if not update or self.venue_alignment is None:
+      self.venue_alignment = VenueCounts(self.columns.vocabulary)
+    rows = np.array(unique, dtype=np.int64).reshape(-1, 2)
+    self.venue_alignment.add(papers.columns.venue.values[rows[:,0]], self.columns.venue.values[rows[:,1]])
+    self.venue_counts = self.venue_alignment.counters()
+    if most_common:
+      self.venue_map = {k2:k1 for k2,(k1,_) in self.venue_alignment.venue_map().items()}
+    else:
+      self.venue_map = {k2:k1 for k1,v1 in self.venue_counts.items() for k2 in v1}
+
+  def pairs(self, collection, blocker=None, size=1000000, rows=None):
+    """Yield the candidate pairs between this collection and 'collection' as arrays (i, j) of
+    positions in each, in chunks of about 'size' pairs, ordered by i and then j.
+    If rows is given (a range), only those positions in this collection are considered."""
+    if rows is None:
+      rows = range(len(self))
+    n = len(collection)
+    if blocker is None:
+      step = max(1, size // max(1, n))
+      for start in range(rows.start, rows.stop, step):
+        stop = min(rows.stop, start + step)
+        yield np.repeat(np.arange(start, stop), n), np.tile(np.arange(n), stop - start)
+      return
+    if isinstance(blocker, SortedNeighbourhood):
+      for i, j in blocker.pairs(self, collection, rows, size):
+        yield i, j
+      return
+    if isinstance(blocker, JoinBlocker) and self.is_columnar and collection.is_columnar and self.papers.vocabulary is collection.papers.vocabulary:
+      # A hash join of two columnar collections needs no index, and no loop over the papers.
+      i, j = blocker.join(self.papers, collection.papers, rows)
+      for start in range(0, len(i), size):
+        yield i[start:start+size], j[start:start+size]
+      return
+    index = collection.index(blocker)
+    papers = self.papers
+    if isinstance(index, FuzzyIndex):
+      # The BK-tree is searched for many papers at once.
+      for i, j in index.pairs(papers, rows, size):
+        yield i, j
+      return
+    i, j = [], []
+    for k in rows:
+      positions = sorted(index.positions(papers[k]))
+      i.extend([k] * len(positions))
+      j.extend(positions)
+      if len(i) >= size:
+        yield np.array(i, dtype=np.int64), np.array(j, dtype=np.int64)
+        i, j = [], []
+    if i:
+      yield np.array(i, dtype=np.int64), np.array(j, dtype=np.int64)
+
+  def match_positions(self, collection, matcher, blocker=None, rows=None):
+    """Return a list of (i, [j, ...]) where the paper at position i in this collection matches
+    the papers at positions j in 'collection', in order.  If rows is given (a range), only those
+    positions in this collection are considered.  If the matcher has batch functions (or the blocker
+    is a SortedNeighbourhood, which has no index), the pairs are evaluated in batches with
+    Matcher.mask(), otherwise one at a time."""
+    if rows is None:
+      rows = range(len(self))
+    if matcher.batched or isinstance(blocker, SortedNeighbourhood):
+      results = collections.OrderedDict()
+      for i, j in self.pairs(collection, blocker, rows=rows):
+        keep = matcher.mask(collection, self, j, i)
+        for a, b in zip(i[keep].tolist(), j[keep].tolist()):
+          results.setdefault(a, []).append(b)
+      return list(results.items())
+    papers1 = self.papers
+    papers2 = collection.papers
+    index = None if blocker is None else collection.index(blocker)
+    results = []
+    for a in rows:
+      p = papers1[a]
+      candidates = range(len(collection)) if index is None else sorted(index.positions(p))
+      matches = [b for b in candidates if matcher(papers2[b], p)]
+      if matches:
+        results.append((a, matches))
+    return results
+
+  def matchup(self, collection, matcher, blocker=None, processes=None, optimise=True):
     """Return a MatchResults object with constructed from all the papers in this 
-    and 'collection' which match according to 'matcher'."""
-    return MatchResults(dict((key,value) for key,value in ((p,collection.matches(p, matcher)) for p in self) if value))
+    and 'collection' which match according to 'matcher'.  If a blocker is given,
+    the matcher is only run on the candidate pairs generated by the blocker.
+    If processes is more than 1, the papers in this collection are shared out between
+    that many worker processes.
+
+    If optimise is True, the matcher and blocker are first rewritten by planner.plan(), which
+    gives the same results: cheap matchers are evaluated first, and equality tests which every
+    match must pass become a hash join."""
+    if optimise:
+      matcher, blocker = planner.plan(matcher, blocker)
+    if processes is not None and processes > 1:
+      positions = parallel.match_positions(self, collection, matcher, blocker, processes)
+    else:
+      positions = self.match_positions(collection, matcher, blocker)
+    papers1 = self.papers
+    papers2 = collection.papers
+    return MatchResults(dict((papers1[a], [papers2[b] for b in matches]) for a, matches in positions))
+
+  def best(self, collection, score=None, k=1, blocker=blocking.standard, min_score=0.0, size=1000000):
+    """Return a ScoredMatchResults object in which each paper in this collection is matched with
+    (at most) the k papers in 'collection' which have the highest scores, of those scoring at
+    least min_score.  score is a ranking.Score (by default ranking.default), and only the candidate
+    pairs generated by the blocker are scored: by default blocking.standard, or if the blocker is
+    None, every pair (which is only feasible for small collections).  Ties go to the earlier paper.
+
+    The candidate pairs are scored a chunk at a time with Score.best_values(), which only finds
+    the expensive features (such as title edit distances) exactly for the pairs which may be
+    amongst the best k of their chunk.  Only the best k of each chunk for each paper are kept, in
+    a heap for each paper which never holds more than k.  The pairs come in order of the papers in
+    this collection, so each heap is finished with as soon as the next paper starts."""
+    if score is None:
+      score = ranking.default
+    if k <= 0:
+      return ScoredMatchResults({}, {})
+    papers1 = self.papers
+    papers2 = collection.papers
+    results = {}
+    scores = {}
+    def finish(a, heap):
+      key = papers1[a]
+      results[key] = [papers2[-b] for s, b in sorted(heap, reverse=True)]
+      scores.update(((key.id, papers2[-b].id), s) for s, b in heap)
+    current, heap = None, []
+    for i, j in self.pairs(collection, blocker, size):
+      values = score.best_values(self, collection, i, j, k, min_score)
+      order = np.lexsort((j, -values, i))
+      i, j, values = i[order], j[order], values[order]
+      starts = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+      rank = np.arange(len(i)) - np.repeat(starts, np.diff(np.r_[starts, len(i)]))
+      keep = (rank < k) & (values >= min_score)
+      for a, b, s in zip(i[keep].tolist(), j[keep].tolist(), values[keep].tolist()):
+        if a != current:
+          if heap:
+            finish(current, heap)
+          current, heap = a, []
+        if len(heap) < k:
+          heapq.heappush(heap, (s, -b))
+        elif (s, -b) > heap[0]:
+          heapq.heapreplace(heap, (s, -b))
+    if heap:
+      finish(current, heap)
+    return ScoredMatchResults(results, scores)
@@ -0,0 +1,63 @@
+import multiprocessing
+
+from blocking import SortedNeighbourhood
+
+# The job shared by the worker processes: (collection1, collection2, matcher, blocker) for matching,
+# or (space, matchers) for counting.
+# It is handed over when the workers start, so with the "fork" start method the collections
+# are shared copy-on-write, rather than being pickled for every task.
+_job = None
+
+def _start(job):
+  global _job
+  _job = job
+
+def _work(rows):
+  collection1, collection2, matcher, blocker = _job
+  return collection1.match_positions(collection2, matcher, blocker, rows)
+
+def _count(k):
+  space, matchers = _job
+  bits = space.evaluate(matchers[k])
+  return len(bits), len(bits & space.gold)
+
+def context():
+  """Return the multiprocessing context, preferring "fork" where it is available."""
+  if "fork" in multiprocessing.get_all_start_methods():
+    return multiprocessing.get_context("fork")
+  return multiprocessing.get_context()
+
+def chunks(n, processes, per_process=8):
+  """Split range(n) into ranges, several for each process so that the work is balanced."""
+  size = max(1, -(-n // (processes * per_process)))
+  return [range(start, min(n, start + size)) for start in range(0, n, size)]
+
+def match_positions(collection1, collection2, matcher, blocker, processes):
+  """The parallel equivalent of collection1.match_positions(collection2, matcher, blocker).
+  The papers in collection1 are split into ranges, which are matched by a pool of worker
+  processes.  The partial results come back as positions, and are joined in order, so
+  the result is the same as for a single process."""
+  # Build anything the workers need before they start, so that it is only built once.
+  if isinstance(blocker, SortedNeighbourhood):
+    blocker.orders(collection1, collection2)
+  elif blocker is not None:
+    collection2.index(blocker)
+  if matcher.batched:
+    collection1.columns
+    collection2.columns
+  job = (collection1, collection2, matcher, blocker)
+  with context().Pool(processes, initializer=_start, initargs=(job,)) as pool:
+    parts = pool.map(_work, chunks(len(collection1), processes))
+  return [item for part in parts for item in part]
+
+def counts(space, matchers, processes):
+  """Evaluate each of the matchers over the CandidateSpace, in a pool of worker processes.
+  Yield (actual, true positives), the number of pairs matched and how many of them are in
+  gold, for each matcher in order.  The caller may stop early, in which case the remaining
+  work is abandoned."""
+  if any(m.batched for m in matchers):
+    space.collection1.columns
+    space.collection2.columns
+  with context().Pool(processes, initializer=_start, initargs=((space, matchers),)) as pool:
+    for count in pool.imap(_count, range(len(matchers))):
+      yield count
@@ -0,0 +1,170 @@
+import matcher as matchers
+from matcher import CompositeMatcher, CompoundMatcher, AltCompoundMatcher, always
+from blocking import AltBlocker, JoinBlocker, FuzzyBlocker, attributes
+
+# Rough estimates of (the cost of evaluating a pair, the fraction of candidate pairs which match)
+# for the primitive matchers, from profiling them on the DBLP-Scholar data.  Only the relative
+# sizes matter.  Other matchers (including the user's, whatever they are called) are assumed to be
+# expensive.
+estimates = {
+  "always": (0, 1.0),
+  "bad_title": (1, 0.001),
+  "title": (1, 0.01),
+  "authors": (1, 0.05),
+  "first_authors": (1, 0.1),
+  "year": (1, 0.2),
+  "venue": (1, 0.2),
+  "valid_year": (1, 0.5),
+  "words": (20, 0.1),
+  "fuzzy_title": (200, 0.02),
+  "cut_fuzzy_title": (200, 0.03),
+  "first_fuzzy_authors": (500, 0.15),
+}
+default_estimate = (1000, 0.5)
+
+# The functions of the built-in matchers named in estimates.  Matchers are recognised by their
+# function, not its name, so that a matcher of the user's called (say) year is left alone.
+builtins = [(getattr(matchers, name).func, name) for name in estimates]
+
+def _name(matcher):
+  """Return the name of a built-in matcher, or None for any other matcher."""
+  func = getattr(matcher.func, "func", matcher.func)
+  for f, name in builtins:
+    if f is func:
+      return name
+  return None
+
+def estimate(matcher):
+  """Return (cost, match rate) for a matcher, from the estimates of its primitive matchers.
+  The parts of a composition are assumed to be independent, and each part is only evaluated
+  on the pairs which the parts before it leave undecided."""
+  if isinstance(matcher, CompositeMatcher):
+    cost, live = 0.0, 1.0
+    for m in matcher.matchers:
+      c, p = estimate(m)
+      cost += live * c
+      live *= p if isinstance(matcher, CompoundMatcher) else 1 - p
+    return cost, live if isinstance(matcher, CompoundMatcher) else 1 - live
+  cost, p = estimates.get(_name(matcher), default_estimate)
+  return cost, p if matcher.positive else 1 - p
+
+def _rank(matcher, conjunction):
+  """Matchers are ordered by their cost per pair decided: in a '+' composition a matcher decides the
+  pairs it rejects, and in a '|' composition those it accepts."""
+  cost, p = estimate(matcher)
+  decided = 1 - p if conjunction else p
+  return cost / decided if decided else float("inf")
+
+def optimise(matcher):
+  """Return a Matcher equivalent to matcher, with the parts of each composition reordered so that
+  cheap, decisive matchers come first, e.g. fuzzy_title(5) + year becomes year + fuzzy_title(5).
+  Only the order changes: each primitive matcher keeps its sign, so negation (which applies to each
+  part of a composition separately) has the same effect as before.  The sort is stable, so parts
+  with the same estimates keep the order they were written in."""
+  if not isinstance(matcher, CompositeMatcher):
+    return matcher
+  conjunction = isinstance(matcher, CompoundMatcher)
+  parts = sorted((optimise(m) for m in matcher.matchers), key=lambda m: _rank(m, conjunction))
+  return matcher.__class__(*parts)
+
+
+def _equality(matcher):
+  """Return a key for the attribute which a primitive matcher tests for equality, or None."""
+  if isinstance(matcher, CompositeMatcher) or not matcher.positive or _name(matcher) not in attributes:
+    return None
+  keywords = getattr(matcher.func, "keywords", {})
+  return (_name(matcher),) + tuple(sorted(keywords.items()))
+
+def equality_keys(matcher):
+  """Return the keys of the equality tests which every match must pass: the positive equality
+  matchers of a '+' composition (or the matcher itself)."""
+  parts = matcher.matchers if isinstance(matcher, CompoundMatcher) else [matcher]
+  keys = []
+  for m in parts:
+    key = _equality(m)
+    if key is not None and key not in keys:
+      keys.append(key)
+  return keys
+
+_join_blockers = {}
+
+def join_blocker(keys):
+  """Return the JoinBlocker for the attributes given by equality_keys().  The same JoinBlocker is
+  returned for the same keys, so its index is only built once per collection."""
+  keys = tuple(sorted(keys))
+  if keys not in _join_blockers:
+    _join_blockers[keys] = JoinBlocker(keys)
+  return _join_blockers[keys]
+
+# The fuzzy matchers which a FuzzyBlocker can generate candidates for, and the attribute it indexes.
+fuzzy_attributes = {"fuzzy_title": "title", "first_fuzzy_authors": "first_author"}
+
+def _fuzzy(matcher):
+  """Return (attribute, edit) for a positive fuzzy matcher which a FuzzyBlocker can generate the
+  candidates for, or None."""
+  if isinstance(matcher, CompositeMatcher) or not matcher.positive or _name(matcher) not in fuzzy_attributes:
+    return None
+  keywords = getattr(matcher.func, "keywords", {})
+  if "edit" not in keywords or keywords.get("len", 1) < 1:
+    return None
+  return fuzzy_attributes[_name(matcher)], keywords["edit"]
+
+_fuzzy_blockers = {}
+
+def fuzzy_blocker(field, edit):
+  """Return the FuzzyBlocker for the attribute and distance, the same object each time."""
+  if (field, edit) not in _fuzzy_blockers:
+    _fuzzy_blockers[(field, edit)] = FuzzyBlocker(field, edit)
+  return _fuzzy_blockers[(field, edit)]
+
+def _plan_blocker(matcher):
+  """Return a Blocker which generates every pair that can match, from the equality tests of the
+  matcher, or failing those its fuzzy title or author test (titles first, then the smallest
+  distance), or None if some matches needn't pass any such test."""
+  if isinstance(matcher, AltCompoundMatcher):
+    blockers = [_plan_blocker(m) for m in matcher.matchers]
+    if None in blockers:
+      return None
+    return _combined(AltBlocker, *blockers)
+  keys = equality_keys(matcher)
+  if keys:
+    return join_blocker(keys)
+  parts = matcher.matchers if isinstance(matcher, CompoundMatcher) else [matcher]
+  fuzzy = [f for f in (_fuzzy(m) for m in parts) if f is not None]
+  if fuzzy:
+    return fuzzy_blocker(*min(fuzzy, key=lambda f: (f[0] != "title", f[1])))
+  return None
+
+_combinations = {}
+
+def _combined(cls, *blockers):
+  """Return cls(*blockers), the same object each time for the same blockers."""
+  key = (cls,) + blockers
+  if key not in _combinations:
+    _combinations[key] = cls(*blockers)
+  return _combinations[key]
+
+def residual(matcher):
+  """Return the part of matcher which is left to test on the pairs from the hash join on
+  equality_keys(matcher), i.e. matcher without the equality tests which the join has already
+  passed.  For a pure equality rule, such as full, nothing is left, and the result is always."""
+  keys = equality_keys(matcher)
+  parts = matcher.matchers if isinstance(matcher, CompoundMatcher) else [matcher]
+  rest = [m for m in parts if _equality(m) not in keys]
+  if not rest:
+    return always
+  return rest[0] if len(rest) == 1 else CompoundMatcher(*rest)
+
+def plan(matcher, blocker=None):
+  """Return (matcher, blocker) to evaluate in place of the given matcher and blocker, with the same
+  results.  If there is no blocker, any equality tests which every match must pass are turned into
+  a hash join (a JoinBlocker keyed on the attributes), and only the rest of the matcher is evaluated
+  on the joined pairs.  Failing that, a fuzzy title or author test becomes a FuzzyBlocker, whose
+  BK-tree generates the pairs within the distance, which the matcher then tests as before.
+  (A given blocker already avoids the full cross product, and combining it with a join costs more
+  than the join saves.)  Then the matcher is reordered by optimise()."""
+  if blocker is None:
+    blocker = _plan_blocker(matcher)
+    if isinstance(blocker, JoinBlocker):
+      matcher = residual(matcher)
+  return optimise(matcher), blocker
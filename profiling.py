@@ -0,0 +1,120 @@
+import time
+
+from matcher import Matcher, CompositeMatcher, CompoundMatcher, AltCompoundMatcher
+
+
+class NodeStats:
+  """The statistics for one node of a matcher: how many pairs it was evaluated on, how many of
+  them matched, and the time taken (including the time taken by any sub-matchers)."""
+  def __init__(self, matcher, depth):
+    self.matcher = matcher
+    self.depth = depth
+    self.calls = 0
+    self.passed = 0
+    self.seconds = 0.0
+
+  def __repr__(self):
+    return "{}{!r}: {} calls, {} passed, {:.3f}s".format("  " * self.depth, self.matcher, self.calls, self.passed, self.seconds)
+
+  @property
+  def pass_rate(self):
+    return self.passed / (1.0 * self.calls) if self.calls else float("nan")
+
+  @property
+  def cost(self):
+    """The average time per pair, in seconds."""
+    return self.seconds / self.calls if self.calls else float("nan")
+
+
+class _Profiled:
+  """A mixin for the profiled versions of the matcher classes, which records the statistics
+  of each call to the node, whether for a single pair or through mask()."""
+  def __call__(self, p1, p2):
+    start = time.perf_counter()
+    result = super().__call__(p1, p2)
+    stats = self.stats
+    stats.seconds += time.perf_counter() - start
+    stats.calls += 1
+    stats.passed += bool(result)
+    return result
+
+  def mask(self, collection1, collection2, i, j):
+    if not isinstance(self, CompositeMatcher) and self.batch is None:
+      # Each pair is evaluated by __call__, which records it.
+      return super().mask(collection1, collection2, i, j)
+    start = time.perf_counter()
+    result = super().mask(collection1, collection2, i, j)
+    stats = self.stats
+    stats.seconds += time.perf_counter() - start
+    stats.calls += len(i)
+    stats.passed += int(result.sum())
+    return result
+
+class ProfiledMatcher(_Profiled, Matcher):
+  pass
+
+class ProfiledCompoundMatcher(_Profiled, CompoundMatcher):
+  pass
+
+class ProfiledAltCompoundMatcher(_Profiled, AltCompoundMatcher):
+  pass
+
+_profiled = {CompoundMatcher: ProfiledCompoundMatcher, AltCompoundMatcher: ProfiledAltCompoundMatcher}
+
+
+class Profile:
+  """Profiles a matcher.  Profile(matcher).matcher is an instrumented copy of the matcher, which
+  matches in the same way, but records the number of pairs each node of the composition
+  is evaluated on, how many of them it passes, and the time it takes.  So it shows which parts
+  of a rule are expensive, and how often the parts of a composition short-circuit.
+  The statistics are shown as a table, in the order of the nodes in the matcher:
+
+  result = eval.calc(match, profile=True)
+  result.profile
+
+  reorder() uses the statistics to reorder the compositions so that cheap, selective matchers
+  are evaluated first."""
+  def __init__(self, matcher):
+    self.original = matcher
+    self.nodes = []
+    self.matcher = self._instrument(matcher, 0)
+
+  def _instrument(self, matcher, depth):
+    stats = NodeStats(matcher, depth)
+    self.nodes.append(stats)
+    if isinstance(matcher, CompositeMatcher):
+      node = _profiled[matcher.__class__](*[self._instrument(m, depth + 1) for m in matcher.matchers])
+    else:
+      node = ProfiledMatcher(matcher.label, matcher.func, matcher.positive, matcher.batch, matcher.threshold)
+    node.stats = stats
+    return node
+
+  def __repr__(self):
+    return self.table().to_string()
+
+  def table(self):
+    """Return the statistics as a pandas DataFrame, with a row for each node."""
+    import pandas as pd
+    rows = [("  " * s.depth + repr(s.matcher), s.calls, s.passed, s.pass_rate, s.seconds, 1e6 * s.cost) for s in self.nodes]
+    return pd.DataFrame(rows, columns=["matcher", "calls", "passed", "pass rate", "seconds", "us per call"])
+
+  def reorder(self):
+    """Return a Matcher equivalent to the original one, but with the parts of each composition
+    reordered by their observed cost and selectivity.  In a '+' composition, the matchers which are
+    cheapest for each pair they reject come first (ranked by cost / (1 - pass rate)), and in a '|'
+    composition, those which are cheapest for each pair they accept come first (cost / pass rate).
+    The statistics of the later parts were only gathered on the pairs the earlier parts let through,
+    so this is a heuristic, and profiling the result again may suggest a different order."""
+    return self._reorder(self.matcher)
+
+  def _reorder(self, node):
+    if not isinstance(node, CompositeMatcher):
+      return node.stats.matcher
+    def rank(child):
+      s = child.stats
+      if not s.calls:
+        return float("inf")
+      rate = 1 - s.pass_rate if isinstance(node, CompoundMatcher) else s.pass_rate
+      return s.cost / rate if rate else float("inf")
+    children = sorted(node.matchers, key=rank)
+    return node.stats.matcher.__class__(*[self._reorder(c) for c in children])
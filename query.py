@@ -0,0 +1,139 @@
+import numpy as np
+
+from columns import MISSING_YEAR
+from paper import Paper, normalise_title, normalise_venue
+
+
+class Postings:
+  """An inverted index from keys to the positions of the papers which have them.  The (key, position)
+  pairs are held in two arrays sorted by key and then position, so that the positions for a key,
+  or a range of keys, are found by binary search, already in order."""
+  def __init__(self, keys, positions):
+    order = np.lexsort((positions, keys))
+    keys = keys[order]
+    positions = positions[order]
+    distinct = np.r_[True, (keys[1:] != keys[:-1]) | (positions[1:] != positions[:-1])] if len(keys) else np.zeros(0, bool)
+    self.keys = keys[distinct]
+    self.positions = positions[distinct]
+
+  def __repr__(self):
+    return "Postings(keys={}, entries={})".format(len(np.unique(self.keys)), len(self.keys))
+
+  def lookup(self, key):
+    """Return the positions of the papers with the key, in order."""
+    return self.positions[np.searchsorted(self.keys, key, "left"):np.searchsorted(self.keys, key, "right")]
+
+  def range(self, low, high):
+    """Return the positions of the papers with a key from low to high inclusive, in order."""
+    positions = self.positions[np.searchsorted(self.keys, low, "left"):np.searchsorted(self.keys, high, "right")]
+    return np.unique(positions)
+
+
+def intersect(lists):
+  """Return the positions which are in all of the sorted arrays of positions, starting with the
+  shortest, so that the work is bounded by its length, and stopping as soon as nothing is left."""
+  lists = sorted(lists, key=len)
+  result = lists[0]
+  for other in lists[1:]:
+    if not len(result) or not len(other):
+      return result[:0]
+    k = np.minimum(np.searchsorted(other, result), len(other) - 1)
+    result = result[other[k] == result]
+  return result
+
+
+def _author(name):
+  names = name.split()
+  return Paper.normalised_name(names) if names else ""
+
+
+class QueryIndex:
+  """Secondary indices of a PaperCollection, for looking papers up by their attributes:
+  - title, venue and authors (each author of a paper) are indexed by their normalised form
+  - words indexes the words of the normalised title
+  - year indexes the integer years, and allows ranges of years to be looked up.
+  Each index is a Postings object over codes from the collection's vocabulary.  The indices are
+  built from the columns of the collection, normalising each distinct string just once, so the
+  collection may be normalised or not.  They aren't updated when the collection grows."""
+  def __init__(self, collection):
+    columns = collection.columns
+    self.vocabulary = columns.vocabulary
+    n = self.size = len(columns)
+    positions = np.arange(n, dtype=np.int64)
+    titles = self._normalised(columns.title.values, normalise_title)
+    self.title = Postings(titles, positions)
+    self.venue = Postings(self._normalised(columns.venue.values, normalise_venue), positions)
+    self.years = columns.year.values.astype(np.int64)
+    known = self.years != MISSING_YEAR
+    self.year = Postings(self.years[known], positions[known])
+    lengths = columns.authors.lengths
+    owner = np.repeat(positions, lengths)
+    authors = self._normalised(columns.authors.codes.values[:len(owner)], _author)
+    named = authors != self.vocabulary.find("")
+    self.authors = Postings(authors[named], owner[named])
+    self.words = self._words(titles, positions)
+
+  def __repr__(self):
+    return "QueryIndex(title={!r}, words={!r}, authors={!r}, venue={!r}, year={!r})".format(
+      self.title, self.words, self.authors, self.venue, self.year)
+
+  def _normalised(self, codes, fn):
+    """Return the codes of the normalised forms of the strings with the given codes."""
+    if not len(codes):
+      return np.zeros(0, dtype=np.int64)
+    strings = self.vocabulary.strings
+    distinct, inverse = np.unique(codes, return_inverse=True)
+    normalised = np.array(self.vocabulary.codes([fn(strings[c]) for c in distinct.tolist()]), dtype=np.int64)
+    return normalised[inverse]
+
+  def _words(self, titles, positions):
+    """Return the Postings of the words of the (normalised) titles.  Each distinct title is split
+    into words once, and the words are then spread over the papers with that title."""
+    strings = self.vocabulary.strings
+    distinct, inverse = np.unique(titles, return_inverse=True)
+    words = [self.vocabulary.codes(strings[t].split()) for t in distinct.tolist()]
+    lengths = np.array([len(w) for w in words], dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    codes = np.array([c for w in words for c in w], dtype=np.int64)
+    per_paper = lengths[inverse]
+    first = np.cumsum(per_paper) - per_paper
+    owner = np.repeat(positions, per_paper)
+    return Postings(codes[np.repeat(starts[inverse] - first, per_paper) + np.arange(per_paper.sum())], owner)
+
+  def _lookup(self, postings, string):
+    return postings.lookup(self.vocabulary.find(string))
+
+  def find(self, title=None, words=None, authors=None, venue=None, year=None):
+    """Return an array of the positions of the papers which meet all of the criteria given:
+    - title: the title, which is normalised before looking it up
+    - words: the title contains all of these words (a string, or a list of words)
+    - authors: all of these are amongst the authors (as in the file, "A Smith, B Jones", or a list)
+    - venue: the venue, which is normalised before looking it up
+    - year: an integer year, or a range of years (low, high), including both, or a range().
+    The lists of positions for each criterion are intersected smallest first, and the year, if there
+    are other criteria, is checked on the papers which meet them."""
+    lists = []
+    if title is not None:
+      lists.append(self._lookup(self.title, normalise_title(title)))
+    if words is not None:
+      words = normalise_title(words if isinstance(words, str) else " ".join(words)).split()
+      lists.extend(self._lookup(self.words, w) for w in words)
+    if authors is not None:
+      authors = authors.split(", ") if isinstance(authors, str) else authors
+      lists.extend(self._lookup(self.authors, _author(a)) for a in authors)
+    if venue is not None:
+      lists.append(self._lookup(self.venue, normalise_venue(venue)))
+    if year is not None:
+      if isinstance(year, range):
+        year = (year.start, year.stop - 1)
+      low, high = year if isinstance(year, (tuple, list)) else (int(year), int(year))
+      if lists:
+        # A range of years may cover most of the papers, so rather than gathering them, the
+        # papers meeting the other criteria are checked.
+        result = intersect(lists)
+        years = self.years[result]
+        return result[(years >= low) & (years <= high) & (years != MISSING_YEAR)]
+      lists.append(self.year.range(low, high) if low != high else self.year.lookup(low))
+    if not lists:
+      return np.arange(self.size)
+    return intersect(lists)
@@ -0,0 +1,218 @@
+import numpy as np
+
+from utils import *
+from features import title_distance
+from columns import MISSING_YEAR
+from matcher import _gather, _word_overlaps, _fix_odd_years, _strings
+
+
+class Feature:
+  """A Feature is a function giving the similarity of two papers, from 0 (nothing in common)
+  to 1 (the same).  Unlike a Matcher, it doesn't decide whether the papers match: features are
+  weighted and added up into a Score, which ranks the candidates for each paper.
+
+  Like a Matcher, a Feature may have a batch function, taking the PaperColumns of two collections
+  and arrays of positions i and j, and returning an array of the similarities of the pairs
+  (i[k], j[k]).  This is used by values() to score many pairs at once.  It may also have a bounded
+  batch function, which takes an array of floors as well, and need only be exact for the pairs
+  whose similarity is at least their floor (returning -INF, say, for the others)."""
+  def __init__(self, label, fn, batch=None, bounded=None):
+    self.label = label
+    self.func = fn
+    self.batch = batch
+    self.bounded = bounded
+
+  def __repr__(self):
+    return self.label
+
+  def __call__(self, p1, p2):
+    return self.func(p1, p2)
+
+  @property
+  def terms(self):
+    return [(1.0, self)]
+
+  def values(self, collection1, collection2, i, j, floor=None):
+    """Return an array of the similarities of each pair of papers (collection1[i[k]], collection2[j[k]]).
+    If floor is given (an array), a pair whose similarity is less than its floor may be given any
+    lower value, if the feature has a bounded batch function."""
+    if floor is not None and self.bounded is not None:
+      return self.bounded(collection1.columns, collection2.columns, i, j, floor)
+    if self.batch is not None:
+      return self.batch(collection1.columns, collection2.columns, i, j)
+    papers1 = collection1.papers
+    papers2 = collection2.papers
+    return np.fromiter((self(papers1[a], papers2[b]) for a,b in zip(i.tolist(), j.tolist())), float, len(i))
+
+  def best_values(self, collection1, collection2, i, j, k, min_score=-INF):
+    """As Score.best_values(), for this feature alone."""
+    return Score(*self.terms).best_values(collection1, collection2, i, j, k, min_score)
+
+  def __mul__(self, weight):
+    """Construct a Score from this feature, with the given weight."""
+    return Score((weight, self))
+
+  __rmul__ = __mul__
+
+  def __add__(self, other):
+    """Construct a Score adding up this and another feature (or Score)."""
+    return Score(*(self.terms + other.terms))
+
+
+class Score:
+  """A Score is a weighted sum of Features, for example:
+
+  score = 0.5 * title_similarity + 0.2 * word_jaccard + 0.2 * author_overlap + 0.1 * year_similarity
+
+  It can be called on a pair of papers, or evaluated over arrays of positions with values()."""
+  def __init__(self, *terms):
+    self.terms = list(terms)
+
+  def __repr__(self):
+    return " + ".join("{:g}*{!r}".format(w, f) for w, f in self.terms)
+
+  def __call__(self, p1, p2):
+    return sum(w * f(p1, p2) for w, f in self.terms)
+
+  def values(self, collection1, collection2, i, j):
+    """Return an array of the scores of each pair of papers (collection1[i[k]], collection2[j[k]])."""
+    result = np.zeros(len(i))
+    for w, f in self.terms:
+      result += w * f.values(collection1, collection2, i, j)
+    return result
+
+  def best_values(self, collection1, collection2, i, j, k, min_score=-INF):
+    """Return an array of the scores of each pair of papers, as values() does, except that a pair
+    which can't be amongst the k best pairs for its paper collection1[i], or which scores less than
+    min_score, may be given any lower score.  (Ties are broken by j, so a pair is only left out if it
+    scores less than k others.)
+
+    This saves time on the features with bounded batch functions, such as title_similarity, whose
+    edit distances are expensive.  The other features are calculated first, which gives an upper
+    bound on each score, as no feature is more than 1.  The k pairs of each paper with the highest
+    bounds are scored in full, and the least of those scores is a floor which the other pairs must
+    reach, so the bounded features need only be exact down to that.  If k is 0 (or there are no
+    pairs), no pair can be amongst the best, and they all score -INF."""
+    if k <= 0 or not len(i):
+      return np.full(len(i), -INF)
+    exact = Score(*[(w, f) for w, f in self.terms if w <= 0 or f.bounded is None])
+    bounded = [(w, f) for w, f in self.terms if w > 0 and f.bounded is not None]
+    result = exact.values(collection1, collection2, i, j)
+    if not bounded or not len(i):
+      return result
+    upper = result + sum(w for w, f in bounded)
+    order = np.lexsort((-upper, i))
+    ordered = i[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    lengths = np.diff(np.r_[starts, len(i)])
+    top = np.arange(len(i)) - np.repeat(starts, lengths) < k
+    first = order[top]
+    result[first] += Score(*bounded).values(collection1, collection2, i[first], j[first])
+    # The papers with more than k pairs have exactly k amongst the first, so the least of their
+    # scores is the k'th best so far.
+    least = np.minimum.reduceat(result[first], np.flatnonzero(np.r_[True, ordered[top][1:] != ordered[top][:-1]]))
+    floors = np.maximum(np.where(lengths > k, least, -INF), min_score)
+    rest = order[~top]
+    floor = np.repeat(floors, lengths)[~top]
+    partial = result[rest]
+    remaining = sum(w for w, f in bounded)
+    for w, f in bounded:
+      # The features after this one score at most 1 each.
+      remaining -= w
+      partial = partial + w * f.values(collection1, collection2, i[rest], j[rest], (floor - partial - remaining) / w)
+    result[rest] = partial
+    return result
+
+  def __mul__(self, weight):
+    return Score(*[(weight * w, f) for w, f in self.terms])
+
+  __rmul__ = __mul__
+
+  def __add__(self, other):
+    return Score(*(self.terms + other.terms))
+
+
+def similarity(batch=None, bounded=None):
+  """A function decorator which makes a Feature from a function of two papers, with optional batch
+  and bounded batch functions, as @vectorised does for matchers."""
+  return lambda f: Feature(f.__name__, f, batch, bounded)
+
+
+def _title_similarities(c1, c2, i, j):
+  t1 = _strings(c1, c1.title.values[i])
+  t2 = _strings(c2, c2.title.values[j])
+  longest = np.array([max(len(x), len(y), 1) for x,y in zip(t1, t2)], float)
+  return 1 - edit_distances(t1, t2) / longest
+
+def _bounded_title_similarities(c1, c2, i, j, floor):
+  """The title similarities, exact where they are at least floor, and otherwise -INF.  A similarity
+  is at least floor exactly when the edit distance is at most (1 - floor) times the longer title,
+  so the distances are bounded by that (plus half an edit, the unit of the distances)."""
+  result = np.full(len(i), -INF)
+  live = np.flatnonzero(floor <= 1)
+  if not len(live):
+    return result
+  t1 = _strings(c1, c1.title.values[i[live]])
+  t2 = _strings(c2, c2.title.values[j[live]])
+  longest = np.array([max(len(x), len(y), 1) for x,y in zip(t1, t2)], float)
+  result[live] = 1 - edit_distances(t1, t2, longest * (1 - floor[live]) + 0.5) / longest
+  return result
+
+def _word_jaccards(c1, c2, i, j):
+  overlap, total = _word_overlaps(c1, c2, i, j)
+  union = total - overlap
+  result = np.zeros(len(i))
+  some = union > 0
+  result[some] = overlap[some] / union[some]
+  return result
+
+def _author_overlaps(c1, c2, i, j):
+  """The number of authors in common over the larger number of authors, counting each name once."""
+  n = len(c1.vocabulary)
+  o1, a1 = _gather(c1.authors, i)
+  o2, a2 = _gather(c2.authors, j)
+  k1 = np.unique(o1.astype(np.int64) * n + a1)
+  k2 = np.unique(o2.astype(np.int64) * n + a2)
+  overlap = np.bincount(k1[np.isin(k1, k2)] // n, minlength=len(i))
+  larger = np.maximum(np.bincount(k1 // n, minlength=len(i)), np.bincount(k2 // n, minlength=len(i)))
+  result = np.zeros(len(i))
+  some = larger > 0
+  result[some] = overlap[some] / larger[some]
+  return result
+
+def _year_similarities(c1, c2, i, j):
+  y1 = c1.year.values[i].astype(np.int64)
+  y2 = c2.year.values[j].astype(np.int64)
+  result = np.where((y1 == MISSING_YEAR) | (y2 == MISSING_YEAR), 0.5, 1.0 / (1 + np.abs(y1 - y2)))
+  return _fix_odd_years(result, c1, c2, i, j, _year_similarity)
+
+def _year_similarity(y1, y2):
+  if isinstance(y1, int) and isinstance(y2, int):
+    return 1.0 / (1 + abs(y1 - y2))
+  return 1.0 if y1 == y2 and y1 != "" else 0.5
+
+@similarity(_title_similarities, _bounded_title_similarities)
+def title_similarity(p, q):
+  """One less the edit distance between the titles as a fraction of the longer title."""
+  return 1 - title_distance(p, q) / max(len(p.title), len(q.title), 1)
+
+@similarity(_word_jaccards)
+def word_jaccard(p, q):
+  """The Jaccard similarity of the sets of title words."""
+  union = len(p.words | q.words)
+  return len(p.words & q.words) / union if union else 0.0
+
+@similarity(_author_overlaps)
+def author_overlap(p, q):
+  """The number of authors in common over the larger number of authors."""
+  a1 = set(p.authors)
+  a2 = set(q.authors)
+  larger = max(len(a1), len(a2))
+  return len(a1 & a2) / larger if larger else 0.0
+
+@similarity(_year_similarities)
+def year_similarity(p, q):
+  """1 for the same year, 1/(1 + difference) for different years, and 0.5 if either year is missing."""
+  return _year_similarity(p.year, q.year)
+
+default = 0.5 * title_similarity + 0.2 * word_jaccard + 0.2 * author_overlap + 0.1 * year_similarity
@@ -1,5 +1,13 @@
-import csv
+import time
+import random
+import itertools
+import numpy as np
+import ingest
+import parallel
 from match_results import *
+from candidate_space import CandidateSpace
+from matcher import CompositeMatcher, always, INF
+from profiling import Profile
 
 RPF_names   = ["recall", "precision", "F1"]
 RPF_colours = ["#666", "steelblue", "red"]
@@ -9,23 +17,58 @@ class ScoreResults:
   In particular, it stores the gold and actual results for the match, and calculates
   the true positives, false positives and false negatives.  
   """
-  def __init__(self, scorer, match_results, matcher):
+  def __init__(self, scorer, match_results, matcher, bits=None):
     """Save the matcher, the gold and actual results.  Further, save the collections
     so that the papers can be easily reconstructed later.  Finally, calculate
     _tp, _fp, _fn as the true positives, false positives and false negatives (respectively),
-    expressed as sets of (paper1.id, paper2.id)."""
-    self.match_results = match_results
+    expressed as sets of (paper1.id, paper2.id).
+
+    Alternatively, the actual results may be given as bits, a PairSet over the candidate space
+    of the Eval, with match_results None.  Then the counts come straight from the PairSet, and
+    match_results and the sets of pairs are only built if they are asked for."""
+    self.scorer = getattr(scorer, "scorer", scorer)
     self.matcher = matcher
     self.collection1 = scorer.collection1
     self.collection2 = scorer.collection2
-    gold = scorer._gold
-    actual = set(match_results.pairs)
-    self._gold = gold
+    self.blocker = scorer.blocker
+    self.processes = scorer.processes
+    self._gold = scorer._gold
+    self._bits = bits
+    if match_results is not None:
+      self.match_results = match_results
+      self._expand(set(match_results.pairs))
+
+  def _expand(self, actual):
+    gold = self._gold
     self._actual = actual
     self._tp = actual & gold
     self._fp = actual - gold
     self._fn = gold - actual
 
+  def __getattr__(self, name):
+    """Build match_results and the sets of pairs from the PairSet, when they are first needed."""
+    if name in ("match_results", "_actual", "_tp", "_fp", "_fn") and self.__dict__.get("_bits") is not None:
+      space = self.scorer.space
+      self.match_results = space.match_results(self._bits)
+      self._expand(space.pairs(self._bits))
+      return getattr(self, name)
+    raise AttributeError(name)
+
+  @property
+  def bits(self):
+    """The actual results as a PairSet over the candidate space of the Eval."""
+    if self._bits is None:
+      self._bits = self.scorer.space.from_pairs(self._actual)
+    return self._bits
+
+  def _count(self, attr):
+    """The number of pairs in _actual or _tp, counted from the PairSet if there is one."""
+    if self._bits is None or "_" + attr in self.__dict__:
+      return len(getattr(self, "_" + attr))
+    if attr == "tp":
+      return len(self._bits & self.scorer.space.gold)
+    return len(self._bits)
+
   def __str__(self):
     """Show some basic statics about the match results."""
     return """\
@@ -34,7 +77,7 @@ Gold:      {} relations
 Actual:    {} relations
 Recall:    {:.2f}%
 Precision: {:.2f}%
-F1:        {:.2f}%""".format(self.matcher, len(self._gold), len(self._actual), 100*self.recall, 100*self.precision, 100*self.F1)
+F1:        {:.2f}%""".format(self.matcher, len(self._gold), self._count("actual"), 100*self.recall, 100*self.precision, 100*self.F1)
 
   def __repr__(self):
     """As a side-effect, produce a bokeh chart showing the recall, precision and F1 score,
@@ -57,27 +100,33 @@ F1:        {:.2f}%""".format(self.matcher, len(self._gold), len(self._actual), 1
 
   def __add__(self, matcher):
     """Return a new ScoreResults object which is the combination with
-    a Matcher object to restrict the results to those which also match matcher."""
-    results = self.match_results + matcher
-    return ScoreResults(self, results, self.matcher + matcher)
+    a Matcher object to restrict the results to those which also match matcher.
+    The matcher is only evaluated on the current results, and only on pairs it hasn't
+    been evaluated on before."""
+    bits = self.scorer.space.evaluate(matcher, self.bits)
+    return ScoreResults(self, None, self.matcher + matcher, bits)
 
   def __sub__(self, matcher):
     """Return a new ScoreResults object which is the combination with
     a Matcher object to restrict the results to those which don't match matcher."""
-    results = self.match_results + -matcher
-    return ScoreResults(self, results, self.matcher - matcher)
+    bits = self.scorer.space.evaluate(-matcher, self.bits)
+    return ScoreResults(self, None, self.matcher - matcher, bits)
 
   def __or__(self, score_results_or_matcher):
     """Return a new ScoreResults object which is the combination with either 
     a ScoreResults object, or a Matcher object to extend the results."""
     if not isinstance(score_results_or_matcher, ScoreResults):
       matcher = score_results_or_matcher
-      scorer = Eval(None, self.collection1, self.collection2, self._gold)
-      score_results = scorer.calc(matcher)
-    else: 
+      bits = self.scorer.space.evaluate(matcher)
+    elif score_results_or_matcher.scorer is self.scorer:
+      matcher = score_results_or_matcher.matcher
+      bits = score_results_or_matcher.bits
+    else:
+      # Results from another Eval are not over the same candidate space.
       score_results = score_results_or_matcher
-    results = self.match_results | score_results.match_results
-    return ScoreResults(self, results, self.matcher | score_results.matcher)
+      results = self.match_results | score_results.match_results
+      return ScoreResults(self, results, self.matcher | score_results.matcher)
+    return ScoreResults(self, None, self.matcher | matcher, self.bits | bits)
 
   def _lookup(self, attr):
     """A helper function which takes an attribute such as "_fp", 
@@ -118,11 +167,11 @@ F1:        {:.2f}%""".format(self.matcher, len(self._gold), len(self._actual), 1
 
   @property
   def recall(self):
-    return len(self._tp)/(1.0*len(self._gold))
+    return self._count("tp")/(1.0*len(self._gold))
 
   @property
   def precision(self):
-    return len(self._tp)/(1.0*len(self._actual))
+    return self._count("tp")/(1.0*self._count("actual"))
 
   @property
   def F1(self):
@@ -135,24 +184,75 @@ F1:        {:.2f}%""".format(self.matcher, len(self._gold), len(self._actual), 1
     return (1+beta*beta) * (precision * recall) / (beta*beta*precision + recall)
 
 
+class BlockingResults:
+  """BlockingResults describes the candidate pairs generated by a Blocker, and in particular
+  how many of the gold pairs survive blocking.  Any gold pair which is not a candidate can never
+  be found by a Matcher run with that blocker, so the candidate recall is an upper bound on
+  the recall of any subsequent match."""
+  def __init__(self, scorer, blocker):
+    """Generate the candidate pairs for collection1 x collection2, and compare them with gold."""
+    self.blocker = blocker
+    self.collection1 = scorer.collection1
+    self.collection2 = scorer.collection2
+    start = time.time()
+    candidates = {(p.id, q.id) for p,c in self.collection1.candidates(self.collection2, blocker) for q in c}
+    self.seconds = time.time() - start
+    self._gold = scorer._gold
+    self._candidates = candidates
+    self._found = candidates & self._gold
+    self._missed = self._gold - candidates
+
+  def __str__(self):
+    return """\
+Blocker:    {!r}
+Gold:       {} relations
+Candidates: {} pairs ({:.4f}% of {} x {})
+Recall:     {:.2f}%
+Time:       {:.2f}s""".format(self.blocker, len(self._gold), len(self._candidates), 100*self.reduction,
+                             len(self.collection1), len(self.collection2), 100*self.recall, self.seconds)
+
+  def __repr__(self):
+    return str(self)
+
+  @property
+  def recall(self):
+    """The fraction of the gold pairs which are candidates."""
+    return len(self._found)/(1.0*len(self._gold))
+
+  @property
+  def reduction(self):
+    """The number of candidate pairs as a fraction of the full cross product."""
+    return len(self._candidates)/(1.0*len(self.collection1)*len(self.collection2))
+
+  @property
+  def missed(self):
+    """The gold pairs lost by blocking, expressed as a MatchResults object."""
+    return MatchResults.fromKeys(self._missed, self.collection1, self.collection2)
+
+
 class Eval:
   """Eval houses the gold standard match and the two paper collections.
   It is used to calculate the effectiveness of matches"""
 
-  def __init__(self, filename, collection1, collection2, gold=None):
+  def __init__(self, filename, collection1, collection2, gold=None, blocker=None, processes=None):
     """If gold is None, construct an Eval object by reading the file specified by filename.
     Otherwise use the matches given by gold.  In either case, limit the values in gold
     to those that possible in the product collection1 x collection2.  If collection1 and
     collection2 have not been subsetted, this won't make a difference, but it means that
     smaller datasets can be considered.  For example, a training or development dataset
-    can be effectively evaluated under this subset."""
+    can be effectively evaluated under this subset.
+
+    If blocker is given, matchers are only run on the candidate pairs it generates.
+    If processes is more than 1, matching is shared out between that many processes."""
     if gold is not None:
       self._gold = gold
     else:
-      with open(filename, 'rb') as csvfile:
-        self._gold = set([tuple(row) for row in csv.reader(csvfile)][1:])
+      self._gold = set(tuple(row) for row in ingest.read_rows(filename))
     self.collection1 = collection1
     self.collection2 = collection2
+    self.blocker = blocker
+    self.processes = processes
+    self._space = None
     keys1 = set([x.id for x in self.collection1])
     keys2 = set([x.id for x in self.collection2])
     self._gold = set([(k1,k2) for k1,k2 in self._gold if k1 in keys1 and k2 in keys2])
@@ -160,24 +260,139 @@ class Eval:
   def __getitem__(self, item):
     """Return an Eval object with a subset of the papers from collection2, and with
     gold trimmed appropriately too."""
-    return Eval(None, self.collection1, self.collection2[item], self._gold)
+    return Eval(None, self.collection1, self.collection2[item], self._gold, self.blocker, self.processes)
+
+  @property
+  def space(self):
+    """The CandidateSpace of collection1 x collection2 under the blocker, which holds the results
+    of matchers as PairSets.  It is built when first needed, and shared by all the ScoreResults
+    from this Eval."""
+    if self._space is None:
+      self._space = CandidateSpace(self.collection1, self.collection2, self.blocker, self._gold)
+    return self._space
 
-  def calc(self, matcher):
+  def calc(self, matcher, profile=False):
     """Return a ScoreResults object as the result of matching papers from collection1 with those
-    in collection2."""
-    m = self.collection1.matchup(self.collection2, matcher)
+    in collection2.  If profile is True, the matcher is profiled (in a single process), and the
+    Profile is kept as the profile attribute of the result."""
+    if profile:
+      prof = Profile(matcher)
+      m = self.collection1.matchup(self.collection2, prof.matcher, self.blocker, optimise=False)
+      result = ScoreResults(self, m, matcher)
+      result.profile = prof
+      return result
+    m = self.collection1.matchup(self.collection2, matcher, self.blocker, self.processes)
     return ScoreResults(self, m, matcher)
 
+  def candidates(self, blocker=None):
+    """Return a BlockingResults object describing how well 'blocker' (by default the blocker
+    of this Eval) preserves the gold pairs."""
+    return BlockingResults(self, blocker or self.blocker)
+
+  def score(self, matcher):
+    """Return a ScoreResults object like calc(), but evaluated over the candidate space, so that the
+    results of primitive matchers (and the candidate pairs) are shared with other calls."""
+    return ScoreResults(self, None, matcher, self.space.evaluate(matcher))
+
+  def search(self, matcher, grid, n=None, processes=None, patience=None, seed=None):
+    """Search for the best parameters for 'matcher', which is expressed as a function taking the
+    parameters as keyword arguments, and returning a Matcher object.  'grid' maps the name of
+    each parameter to the values to try.  For example:
+
+    eval.search(lambda edit, frac: fuzzy_title(edit) + words(frac), dict(edit=[2, 4, 6], frac=[0.4, 0.6]))
+
+    Every combination of the values is evaluated, or if n is given, a random sample of n of them.
+    The points are evaluated over the candidate space, so the candidate pairs and the results of
+    primitive matchers are reused between points, and are shared out between 'processes' processes
+    (by default those of this Eval).  If patience is given, the search stops once F1 has not
+    improved for that many points in a row.
+
+    Return a pandas DataFrame with a row for each point evaluated, in order, giving the
+    parameters and the recall, precision and F1."""
+    import pandas as pd
+    names = list(grid)
+    points = list(itertools.product(*[grid[name] for name in names]))
+    if n is not None:
+      points = random.Random(seed).sample(points, min(n, len(points)))
+    matchers = [matcher(**dict(zip(names, point))) for point in points]
+    processes = processes if processes is not None else self.processes
+    space = self.space
+    if processes is not None and processes > 1:
+      counts = parallel.counts(space, matchers, processes)
+    else:
+      counts = ((len(bits), len(bits & space.gold)) for bits in map(space.evaluate, matchers))
+    rows = []
+    best, since = -1, 0
+    for point, (actual, tp) in zip(points, counts):
+      rows.append(list(point) + _rpf(tp, actual, len(self._gold)))
+      F1 = rows[-1][-1]
+      if F1 > best:
+        best, since = F1, 0
+      else:
+        since += 1
+        if patience is not None and since >= patience:
+          break
+    counts.close()
+    return pd.DataFrame(rows, columns=names + RPF_names)
+
+  def sweep(self, matcher, values, var=None):
+    """Evaluate 'matcher' for all of 'values' at once.  As with fit(), 'matcher' is expressed as a
+    function which takes a single value and returns a Matcher object, but exactly one part of
+    the Matcher may vary with the value, and that must be monotone in it, such as fuzzy_title(edit)
+    or words(frac).  For example:
+
+    eval.sweep(lambda edit: valid_year + fuzzy_title(edit), range(1, 11))
+
+    Rather than matching once per value, the rest of the matcher is evaluated once, and the
+    feature behind the threshold (e.g. the title edit distance) is calculated once for each of
+    the pairs which depend on it.  The counts for every value then come from sorting the feature.
+
+    Return a pandas DataFrame with a row for each value, giving the recall, precision and F1."""
+    import pandas as pd
+    values = list(values)
+    matchers = [matcher(v) for v in values]
+    k, thresholds = _varying(matchers)
+    threshold = thresholds[0]
+    leaf = _leaves(matchers[0])[k]
+    # The matcher is monotone in each of its parts, so the pairs which match with the varying part
+    # replaced by never match for every value, and those which only match with it replaced by always
+    # match exactly when the varying part does.
+    space = self.space
+    fixed = space.evaluate(_substitute(matchers[0], k, -always))
+    varying = space.evaluate(_substitute(matchers[0], k, always)) - fixed
+    if leaf.positive:
+      # Only the pairs which can match the loosest value need the feature.
+      loosest = max(range(len(values)), key=lambda v: thresholds[v].value if threshold.below else -thresholds[v].value)
+      varying = space.plan(matchers[loosest], varying)[1]
+    limit = max(t.value for t in thresholds) if threshold.below else INF
+    x = space.feature(threshold, varying, limit)
+    gold = (varying & space.gold).mask[varying.ids()]
+    counts = [np.sort(x), np.sort(x[gold])]
+    rows = []
+    for v in [t.value for t in thresholds]:
+      # The number of pairs where the varying part matches: those with x < v (or x > v).
+      if threshold.below:
+        n = [np.searchsorted(c, v, "left") for c in counts]
+      else:
+        n = [len(c) - np.searchsorted(c, v, "right") for c in counts]
+      if not leaf.positive:
+        n = [len(c) - m for c, m in zip(counts, n)]
+      actual = len(fixed) + int(n[0])
+      tp = len(fixed & space.gold) + int(n[1])
+      rows.append([v] + _rpf(tp, actual, len(self._gold)))
+    return pd.DataFrame(rows, columns=[var or threshold.param] + RPF_names)
+
   def fit(self, matcher, values, var):
     """Display parameter fitting by looping through 'values' and evaluating the performance 
     of 'matcher'.  Note that 'matcher' is expressed as a function which takes a single value
     as a parameter, and returns a Matcher object for matching.  
     
     'var' is the name of the looping parameter for display purposes only."""
-    scores = []
-    for v in values:
-        s = self.calc(matcher(v))
-        scores.append([s.recall, s.precision, s.F1])
+    # Evaluate the largest values first: for thresholds such as fuzzy_title(edit), the distances
+    # the candidate space keeps from evaluating the loosest setting then answer all the tighter ones.
+    df = self.search(lambda **kws: matcher(kws[var]), {var: sorted(set(values), reverse=True)})
+    results = {row[0]: list(row[1:]) for row in df.itertuples(index=False)}
+    scores = [results[v] for v in values]
     self._display_fit(matcher, values, scores, var)
 
   def _display_fit(self, matcher, keys, values, var):
@@ -188,3 +403,39 @@ class Eval:
     df.index = keys
     line = Line(df, ylabel="", title=repr(matcher(var)), xlabel=var, plot_width=900, plot_height=300, toolbar_location=None)
     show(line)
+
+
+def _rpf(tp, actual, gold):
+  """Return [recall, precision, F1] from the numbers of true positives, actual and gold pairs."""
+  recall = tp/(1.0*gold) if gold else 0.0
+  precision = tp/(1.0*actual) if actual else 0.0
+  F1 = 2 * precision * recall / (precision + recall) if tp else 0.0
+  return [recall, precision, F1]
+
+def _leaves(matcher):
+  """The primitive matchers of a matcher, in order."""
+  if isinstance(matcher, CompositeMatcher):
+    return [leaf for m in matcher.matchers for leaf in _leaves(m)]
+  return [matcher]
+
+def _substitute(matcher, k, new):
+  """Return a copy of matcher with its k'th primitive matcher replaced by new."""
+  leaves = iter(range(len(_leaves(matcher))))
+  def walk(m):
+    if isinstance(m, CompositeMatcher):
+      return m.__class__(*[walk(x) for x in m.matchers])
+    return new if next(leaves) == k else m
+  return walk(matcher)
+
+def _varying(matchers):
+  """Find the primitive matcher which varies between the matchers, which must otherwise be the same.
+  Return its index and its Threshold in each of the matchers."""
+  leaves = [_leaves(m) for m in matchers]
+  if len(set(repr(m) for m in matchers)) > 1 and len(set(len(l) for l in leaves)) == 1:
+    varying = [k for k in range(len(leaves[0])) if len(set(repr(l[k]) for l in leaves)) > 1]
+    if len(varying) == 1:
+      k = varying[0]
+      thresholds = [l[k].threshold for l in leaves]
+      if thresholds[0] is not None and all(thresholds[0].same(t) for t in thresholds):
+        return k, thresholds
+  raise ValueError("sweep() needs a matcher in which one monotone part varies with the value")
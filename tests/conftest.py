@@ -0,0 +1,35 @@
+"""Fixtures for the tests: small collections taken from DBLP1.csv, matched against perturbed copies
+of the same papers (written by benchmark.synthetic()), so that there are plenty of near matches."""
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import benchmark
+import ingest
+from paper import Paper
+
+size = 300
+
+
+@pytest.fixture(scope="session")
+def data(tmp_path_factory):
+  """Return (papers1, papers2, gold): the first 'size' papers of DBLP1.csv, two perturbed copies of
+  each of them, and the gold pairs of their ids."""
+  papers1 = [Paper.build(*row) for row in ingest.read_rows(os.path.join(root, "DBLP1.csv"))][:size]
+  ids = set(p.id for p in papers1)
+  filename, gold_filename = benchmark.synthetic(os.path.join(root, "DBLP1.csv"), 2, str(tmp_path_factory.mktemp("synthetic")))
+  papers2 = [Paper.build(*row) for row in ingest.read_rows(filename) if row[0].split("#")[0] in ids]
+  gold = set(tuple(row) for row in ingest.read_rows(gold_filename) if row[0] in ids)
+  return papers1, papers2, gold
+
+
+@pytest.fixture
+def normalised(data):
+  """Return new collections of the papers, normalised."""
+  from paper_collection import PaperCollection
+  papers1, papers2, gold = data
+  return PaperCollection("dblp", [p.normalise() for p in papers1]), PaperCollection("copies", [p.normalise() for p in papers2])
@@ -0,0 +1,87 @@
+"""The assignments agree with trying every matching of small components."""
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from assignment import MatchGraph, assign, greedy, hungarian, optimal
+from match_results import ScoredMatchResults
+from paper import Paper
+
+
+def paper(id):
+  return Paper._make((id, "", set(), [], "", ""))
+
+def random_results(rnd, n1, n2, edges, low=-0.5):
+  """ScoredMatchResults with up to 'edges' random matches between n1 and n2 papers, with scores
+  from low to 1 (rounded, so that there are ties)."""
+  pairs = sorted(set((rnd.randrange(n1), rnd.randrange(n2)) for _ in range(edges)))
+  results, scores = {}, {}
+  for a, b in pairs:
+    key, value = paper("a{}".format(a)), paper("b{}".format(b))
+    results.setdefault(key, []).append(value)
+    scores[(key.id, value.id)] = round(rnd.uniform(low, 1), 1)
+  return ScoredMatchResults(results, scores)
+
+def best_total(graph, edges):
+  """The largest total weight of a matching amongst the edges, by trying every subset of them."""
+  best = 0.0
+  for k in range(1, len(edges) + 1):
+    for subset in itertools.combinations(edges.tolist(), k):
+      if len(set(graph.u[list(subset)])) == k and len(set(graph.v[list(subset)])) == k:
+        best = max(best, graph.w[list(subset)].sum())
+  return best
+
+def is_matching(results):
+  values = [v.id for vs in results.results.values() for v in vs]
+  return all(len(vs) == 1 for vs in results.results.values()) and len(values) == len(set(values))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_hungarian(seed):
+  rnd = random.Random(seed)
+  n = rnd.randint(1, 5)
+  m = rnd.randint(n, 6)
+  cost = np.array([[rnd.choice([0, 1, 2, 3, 5, 8]) for _ in range(m)] for _ in range(n)], float)
+  columns = hungarian(cost)
+  assert len(set(columns.tolist())) == n
+  assert cost[np.arange(n), columns].sum() == min(cost[np.arange(n), list(p)].sum() for p in itertools.permutations(range(m), n))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_optimal(seed):
+  rnd = random.Random(seed)
+  results = random_results(rnd, rnd.randint(1, 5), rnd.randint(1, 5), rnd.randint(1, 9))
+  graph = MatchGraph(results)
+  for edges in graph.components():
+    chosen = optimal(graph, edges)
+    assert (graph.w[chosen] > 0).all()
+    assert graph.w[chosen].sum() == pytest.approx(best_total(graph, edges))
+  assigned = assign(results, "optimal")
+  assert is_matching(assigned)
+  assert sum(assigned.scores.values()) == pytest.approx(best_total(graph, np.arange(len(graph))))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_greedy(seed):
+  """Greedy assignment takes the best remaining match each time, ties going to the earlier one."""
+  rnd = random.Random(seed)
+  results = random_results(rnd, 5, 5, 12, low=0)
+  graph = MatchGraph(results)
+  order = sorted(range(len(graph)), key=lambda e: (-graph.w[e], e))
+  expected, used = [], set()
+  for e in order:
+    if ("u", graph.u[e]) not in used and ("v", graph.v[e]) not in used:
+      used.update([("u", graph.u[e]), ("v", graph.v[e])])
+      expected.append(e)
+  assert greedy(graph).tolist() == expected
+  assert is_matching(assign(results))
+
+
+def test_single_edges():
+  """A component of one match is kept, unless its score isn't positive, as for larger components."""
+  results = ScoredMatchResults({paper("a"): [paper("x")], paper("b"): [paper("y")], paper("c"): [paper("z"), paper("w")]},
+                               {("a", "x"): 0.5, ("b", "y"): -0.5, ("c", "z"): 0.0, ("c", "w"): -1.0})
+  assert assign(results, "optimal").scores == {("a", "x"): 0.5}
+  assert len(assign(results, "greedy").scores) == 3
@@ -0,0 +1,84 @@
+"""The blockers which search for near matches find what a scan of every pair would."""
+import pytest
+
+from blocking import FuzzyBlocker, JoinBlocker, MinHashBlocker
+from utils import edit_distance
+
+
+def jaccard(a, b):
+  return len(a & b) / float(len(a | b)) if a | b else 0.0
+
+
+@pytest.mark.parametrize("shingle", [3, None])
+def test_minhash_recall(normalised, shingle):
+  """Nearly every pair of titles with a Jaccard similarity of 0.8 or more is a candidate, and every
+  candidate shares a band of its signature."""
+  c1, c2 = normalised
+  blocker = MinHashBlocker(bands=20, rows=5, shingle=shingle)
+  candidates = {(p.id, q.id) for p, c in c1.candidates(c2, blocker) for q in c}
+  shingles1 = [(p.id, blocker.shingles(p)) for p in c1]
+  shingles2 = [(q.id, blocker.shingles(q)) for q in c2]
+  similar = {(a, b) for a, s in shingles1 for b, t in shingles2 if jaccard(s, t) >= 0.8}
+  assert len(similar) > 100
+  assert len(similar & candidates) >= 0.98 * len(similar)
+  keys1 = {p.id: blocker.keys(p) for p in c1}
+  keys2 = {q.id: blocker.keys(q) for q in c2}
+  assert all(keys1[a] & keys2[b] for a, b in candidates)
+
+
+def test_minhash_threshold(normalised):
+  """With a threshold, the candidates are those whose signatures agree in that fraction of places."""
+  c1, c2 = normalised
+  loose = MinHashBlocker(bands=20, rows=2)
+  strict = MinHashBlocker(bands=20, rows=2, threshold=0.6)
+  candidates = {(p.id, q.id) for p, c in c1.candidates(c2, strict) for q in c}
+  expected = set()
+  for p, c in c1.candidates(c2, loose):
+    s = loose.unpack(loose.keys(p))
+    expected.update((p.id, q.id) for q in c if (loose.unpack(loose.keys(q)) == s).mean() >= 0.6)
+  assert candidates == expected
+
+
+def pairs(c1, c2, blocker):
+  return {(c1[a].id, c2[b].id) for i, j in c1.pairs(c2, blocker) for a, b in zip(i.tolist(), j.tolist())}
+
+
+@pytest.mark.parametrize("fields", [
+  [("title",)],
+  [("title",), ("year",)],
+  [("authors",), ("venue",)],
+  [("first_authors", ("len", 2)), ("year",)],
+], ids=repr)
+def test_join(normalised, fields):
+  """A hash join of columnar collections, and the index of a list, both find the pairs whose keys are equal."""
+  c1, c2 = normalised
+  blocker = JoinBlocker(fields)
+  keys1 = [(p.id, blocker.keys(p)) for p in c1]
+  keys2 = [(q.id, blocker.keys(q)) for q in c2]
+  expected = {(a, b) for a, k in keys1 for b, l in keys2 if k & l}
+  assert len(expected) > 10
+  assert pairs(c1, c2, blocker) == expected
+  assert pairs(c1.columnar(), c2.columnar(), blocker) == expected
+
+
+@pytest.mark.parametrize("field, edit", [("title", 1.5), ("title", 4), ("first_author", 1), ("first_author", 3)])
+def test_fuzzy(normalised, field, edit):
+  """The BK-tree of a FuzzyIndex finds every string within the distance, as comparing the query with
+  every string does, and still does after papers are added to it."""
+  c1, c2 = normalised
+  blocker = FuzzyBlocker(field, edit)
+  papers1, papers2 = list(c1), list(c2)
+  keys1 = [blocker.keys(p) for p in papers1]
+  keys2 = [blocker.keys(q) for q in papers2]
+  def scan(n):
+    return [(a, b) for a, k in enumerate(keys2) for b, l in enumerate(keys1[:n]) if edit_distance(k, l) < edit]
+  def search(index):
+    return [(a, b) for i, j in index.pairs(papers2, range(len(papers2)), size=500, batch=70) for a, b in zip(i.tolist(), j.tolist())]
+  index = blocker.index(papers1[:200])
+  expected = scan(200)
+  assert len(expected) > len(papers2) // 2
+  assert search(index) == expected
+  assert index.positions(papers2[5]) == {b for a, b in expected if a == 5}
+  for p in papers1[200:]:
+    index.add(p)
+  assert search(index) == scan(len(papers1))
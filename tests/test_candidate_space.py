@@ -0,0 +1,63 @@
+"""PairSets behave as sets of pair ids, and results over a CandidateSpace agree with matchup()."""
+import random
+
+import numpy as np
+import pytest
+
+import blocking
+from candidate_space import CandidateSpace, PairSet
+from matcher import *
+from scorer import Eval
+
+
+@pytest.mark.parametrize("size", [0, 1, 7, 8, 9, 100, 1001])
+def test_pair_sets(size):
+  rnd = random.Random(size)
+  sets = [set(x for x in range(size) if rnd.random() < p) for p in (0.1, 0.5, 0.9)]
+  pair_sets = [PairSet.from_ids(sorted(s), size) for s in sets]
+  everything = set(range(size))
+  for s, a in zip(sets, pair_sets):
+    assert a.ids().tolist() == sorted(s) and len(a) == len(s) and bool(a) == bool(s)
+    assert (~a).ids().tolist() == sorted(everything - s) and len(~a) == size - len(s)
+    assert np.concatenate(list(a.chunks(16)) or [np.zeros(0, int)]).tolist() == sorted(s)
+    assert PairSet.from_mask(a.mask).ids().tolist() == sorted(s)
+    for t, b in zip(sets, pair_sets):
+      assert (a & b).ids().tolist() == sorted(s & t)
+      assert (a | b).ids().tolist() == sorted(s | t)
+      assert (a - b).ids().tolist() == sorted(s - t)
+
+
+@pytest.fixture(params=[None, blocking.standard], ids=repr)
+def scorer(request, data, normalised):
+  c1, c2 = normalised
+  return Eval(None, c1, c2, data[2], blocker=request.param)
+
+rules = [match, title + year, fuzzy_title(3) + valid_year, valid_year + first_fuzzy_authors(2, 2), -title + venue + year]
+
+
+@pytest.mark.parametrize("rule", rules, ids=repr)
+def test_evaluate(scorer, rule):
+  space = scorer.space
+  expected = scorer.collection1.matchup(scorer.collection2, rule, scorer.blocker, optimise=False).pairs
+  assert space.pairs(space.evaluate(rule)) == expected
+  assert scorer.score(rule)._count("tp") == len(expected & scorer._gold)
+
+
+def test_algebra(scorer):
+  """Combining ScoreResults with matchers gives the results of the combined matcher."""
+  r = scorer.score(title + year)
+  for result, matcher in [(r + venue, title + year + venue), (r - venue, title + year - venue),
+                          (r | fuzzy_title(3), (title + year) | fuzzy_title(3)),
+                          (r | scorer.calc(authors + year), (title + year) | (authors + year))]:
+    assert result._actual == scorer.calc(matcher)._actual
+
+
+def test_unblocked_is_planned(normalised, monkeypatch):
+  """Without a blocker, only the pairs which a hash join of the titles generates are evaluated."""
+  c1, c2 = normalised
+  space = CandidateSpace(c1, c2)
+  calls = []
+  mask = space._mask
+  monkeypatch.setattr(space, "_mask", lambda m, ids: calls.append(len(ids)) or mask(m, ids))
+  space.evaluate(title + year + venue)
+  assert sum(calls) < len(c1) * len(c2) / 100
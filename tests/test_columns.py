@@ -0,0 +1,53 @@
+"""PaperColumns hold the same papers as the lists they were built from."""
+import numpy as np
+
+import blocking
+from columns import PaperColumns
+from paper_collection import PaperCollection
+
+
+def test_round_trip(data):
+  papers1, papers2, gold = data
+  for papers in (papers1, [p.normalise() for p in papers2]):
+    columns = PaperColumns.build(papers)
+    assert list(columns) == papers
+    assert [columns.paper(k) for k in range(len(papers))] == papers
+    assert all(columns.lookup[p.id] == p for p in papers)
+    assert list(columns[10:20]) == papers[10:20]
+    assert list(PaperColumns.from_arrays(columns.arrays(), columns.odd_years)) == papers
+
+
+def test_odd_years(data):
+  papers = [p._replace(year=y) for p, y in zip(data[0], [1999, "", "c. 1990", 40000, -3])]
+  assert list(PaperColumns.build(papers)) == papers
+
+
+def test_independent(normalised):
+  """Extending a collection or its columnar copy leaves the other, and its indices, as they were."""
+  c1, c2 = normalised
+  papers = list(c1)
+  c = PaperCollection("dblp", papers[:100])
+  columnar = c.columnar()
+  again = columnar.columnar()
+  index = c.index(blocking.exact_title)
+  columnar.extend(papers[100:200])
+  assert (len(c), len(c.columns), len(again)) == (100, 100, 100)
+  assert list(columnar) == papers[:200] and list(c.columns) == papers[:100]
+  c.extend(papers[200:250])
+  again.extend(papers[250:300])
+  assert list(c.columns) == papers[:100] + papers[200:250] and list(columnar) == papers[:200]
+  assert list(again) == papers[:100] + papers[250:300]
+  assert len(index) == 150 and papers[250].id not in columnar.lookup
+
+
+def test_copy_of_memory_mapped(tmp_path, data):
+  """A copy of read-only columns (as read from the disk cache) can still be extended."""
+  columns = PaperColumns.build(data[0][:50])
+  arrays = {}
+  for name, array in columns.arrays().items():
+    np.save(str(tmp_path / name), array)
+    arrays[name] = np.load(str(tmp_path / (name + ".npy")), mmap_mode="r")
+  mapped = PaperColumns.from_arrays(arrays)
+  copy = mapped.copy()
+  copy.extend(data[0][50:60])
+  assert list(copy) == data[0][:60] and list(mapped) == data[0][:50]
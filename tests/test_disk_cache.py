@@ -0,0 +1,85 @@
+"""The disk cache gives back what was saved, and is invalidated when the file or the code changes."""
+import os
+import pickle
+
+import pytest
+
+import blocking
+import disk_cache
+from paper_collection import PaperCollection
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def filename(tmp_path):
+  """A copy of the first hundred lines of DBLP1.csv, in a directory of its own."""
+  with open(os.path.join(root, "DBLP1.csv"), "rb") as f:
+    lines = f.readlines()[:101]
+  path = tmp_path / "papers.csv"
+  path.write_bytes(b"".join(lines))
+  return str(path)
+
+def entries(filename):
+  return sorted(os.listdir(os.path.join(os.path.dirname(filename), disk_cache.directory)))
+
+
+def test_round_trip(filename):
+  first = PaperCollection.load(filename, blockers=[blocking.exact_title])
+  assert len(entries(filename)) == 2
+  second = PaperCollection.load(filename, blockers=[blocking.exact_title])
+  assert list(second) == list(first) == list(PaperCollection(filename).normalised())
+  assert second.index(blocking.exact_title).postings == first.index(blocking.exact_title).postings
+  assert list(PaperCollection(filename)) == list(PaperCollection(filename))
+
+
+def test_changed_file(filename):
+  """Changing the file changes its digest, so the old entries are not used, and are replaced."""
+  PaperCollection.load(filename)
+  before = entries(filename)
+  with open(filename, "ab") as f:
+    f.write(b'"new/paper","A new paper","A Author","VLDB",2001\n')
+  collection = PaperCollection.load(filename)
+  assert len(collection) == 101 and collection[-1].id == "new/paper"
+  after = entries(filename)
+  assert len(after) == 1 and after != before
+
+
+def test_changed_code(filename, monkeypatch):
+  """A change to the code which reads the papers changes the version, and so the entry."""
+  PaperCollection.load(filename)
+  before = entries(filename)
+  monkeypatch.setattr(disk_cache, "VERSION", "0" * 40)
+  assert disk_cache.load_columns(filename, disk_cache.origin(filename, "normalised")) is None
+  PaperCollection.load(filename)
+  assert entries(filename) != before
+
+
+def test_changed_blocker(filename):
+  """An index is saved under a hash of the blocker, including the code of its key functions."""
+  @blocking.blocker
+  def key(p):
+    return {p.title}
+  PaperCollection.load(filename, blockers=[key])
+  origin = disk_cache.origin(filename, "normalised")
+  assert disk_cache.load_index(filename, origin, key, PaperCollection(filename)) is not None
+  @blocking.blocker
+  def key(p):
+    return {p.title[:10]}
+  assert disk_cache.load_index(filename, origin, key, PaperCollection(filename)) is None
+
+
+def test_failed_write(filename):
+  """If an entry can't be written, nothing is left behind."""
+  def write(dirname):
+    with open(os.path.join(dirname, "strings.pickle"), "wb") as f:
+      pickle.dump(lambda: None, f)
+  with pytest.raises(Exception):
+    disk_cache._save(os.path.join(os.path.dirname(filename), disk_cache.directory, "papers.csv-raw-x-y"), write)
+  assert entries(filename) == []
+
+
+def test_disabled(filename, monkeypatch):
+  monkeypatch.setattr(disk_cache, "enabled", False)
+  PaperCollection.load(filename)
+  assert not os.path.exists(os.path.join(os.path.dirname(filename), disk_cache.directory))
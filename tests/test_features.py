@@ -0,0 +1,34 @@
+"""Cached features give the same results as calculating them afresh, and are reused."""
+import blocking
+import features
+import matcher as matchers
+from candidate_space import CandidateSpace
+from matcher import *
+from utils import INF, bounded_edit_distance
+
+
+def test_cache(normalised):
+  """Distances cached with one limit answer queries with another correctly."""
+  c1, c2 = normalised
+  features.cache.clear()
+  pairs = [(p, q) for p in c1[:20] for q in c2[:40]]
+  for limit in (3, 10, 1, INF, 5):
+    for p, q in pairs:
+      assert features.title_distance(p, q, limit) == bounded_edit_distance(p.title, q.title, limit)
+  assert features.cache.hits and len(features.cache) == len(pairs)
+
+
+def test_space_distances(normalised, monkeypatch):
+  """Evaluating the loosest threshold first leaves nothing to calculate for the tighter ones."""
+  c1, c2 = normalised
+  space = CandidateSpace(c1, c2, blocking.standard)
+  calls = []
+  distances = matchers.edit_distances
+  monkeypatch.setattr(matchers, "edit_distances", lambda *args, **kws: calls.append(len(args[0])) or distances(*args, **kws))
+  results = [space.evaluate(valid_year + fuzzy_title(edit)) for edit in (8, 5, 3, 1)]
+  assert len(calls) == 1
+  space.evaluate(fuzzy_title(10))
+  assert len(calls) == 2
+  for edit, result in zip((8, 5, 3, 1), results):
+    fresh = CandidateSpace(c1, c2, blocking.standard).evaluate(valid_year + fuzzy_title(edit))
+    assert (result.bits == fresh.bits).all()
@@ -0,0 +1,36 @@
+"""Reading the CSV files line by line, in whatever encoding each line is in."""
+import ingest
+from paper import Paper
+
+
+def write(path, lines):
+  path.write_bytes(b"".join(lines))
+  return str(path)
+
+
+def test_mixed_encodings(tmp_path):
+  """Each line falls back to Latin-1 on its own, so UTF-8 lines either side are still read as UTF-8."""
+  filename = write(tmp_path / "papers.csv", [
+    b'"id","title","authors","venue","year"\r\n',
+    '"1","Café queries","J Müller","VLDB",1999\r\n'.encode("utf-8"),
+    '"2","Café queries","J Müller","VLDB",""\r\n'.encode("latin-1"),
+    '"3","λ calculus","A Øre","",2001\r\n'.encode("utf-8"),
+  ])
+  rows = list(ingest.read_rows(filename))
+  assert rows == [
+    ["1", "Café queries", "J Müller", "VLDB", "1999"],
+    ["2", "Café queries", "J Müller", "VLDB", ""],
+    ["3", "λ calculus", "A Øre", "", "2001"],
+  ]
+  assert list(ingest.read_rows(filename, header=False))[1:] == rows
+
+
+def test_stream(tmp_path):
+  """The chunks add up to the papers of the file, normalised or not."""
+  filename = write(tmp_path / "papers.csv", [b'"id","title","authors","venue","year"\n'] +
+                   ['"{}","Paper number {}","A Author, B Other","Venue {}",{}\n'.format(k, k, k % 3, 1990 + k).encode() for k in range(25)])
+  papers = [Paper.build(*row) for row in ingest.read_rows(filename)]
+  chunks = list(ingest.stream(filename, chunksize=10, normalise=False))
+  assert [len(c) for c in chunks] == [10, 10, 5]
+  assert sum(chunks, []) == papers
+  assert sum(ingest.stream(filename, chunksize=7), []) == [p.normalise() for p in papers]
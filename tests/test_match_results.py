@@ -0,0 +1,72 @@
+"""MatchResults.write() writes every match, and the file reads back as the matches it came from."""
+import pandas as pd
+import pytest
+
+import blocking
+from match_results import MatchResults, ScoredMatchResults
+from matcher import *
+
+attributes = ("id", "title", "authors", "venue", "year")
+
+
+def expected_rows(results):
+  """The rows write() should give, built pair by pair from the results."""
+  rows = []
+  for key, values in results.results.items():
+    for rank, v in enumerate(values):
+      row = {}
+      for a in attributes:
+        row[a + "1"] = ", ".join(key.authors) if a == "authors" else str(getattr(key, a))
+        row[a + "2"] = ", ".join(v.authors) if a == "authors" else str(getattr(v, a))
+      row["rank"] = str(rank)
+      if isinstance(results, ScoredMatchResults):
+        row["score"] = results.scores[(key.id, v.id)]
+      rows.append(row)
+  return rows
+
+def read(filename, format):
+  if format == "csv":
+    df = pd.read_csv(filename, dtype=str, keep_default_na=False)
+  else:
+    df = pd.read_parquet(filename).astype({"rank": str})
+  if "score" in df:
+    df["score"] = df["score"].astype(float)
+  return df.to_dict("records")
+
+
+@pytest.fixture
+def results(normalised):
+  c1, c2 = normalised
+  return c1.matchup(c2, title + year | words(0.8), blocking.title_tokens)
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+@pytest.mark.parametrize("chunksize", [1, 7, 100000])
+def test_write(results, tmp_path, format, chunksize):
+  if format == "parquet":
+    pytest.importorskip("pyarrow")
+  assert 100 < len(results.pairs)
+  filename = str(tmp_path / "matches.{}".format(format))
+  results.write(filename, chunksize=chunksize)
+  assert read(filename, format) == expected_rows(results)
+  # A subset of the attributes, and the format given rather than taken from the extension.
+  results.write(str(tmp_path / "matches"), ("id",), chunksize, format)
+  assert read(str(tmp_path / "matches"), format) == [{k: r[k] for k in ("id1", "id2", "rank")} for r in expected_rows(results)]
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+def test_write_scored(normalised, tmp_path, format):
+  if format == "parquet":
+    pytest.importorskip("pyarrow")
+  c1, c2 = normalised
+  results = c1.best(c2, k=3)
+  filename = str(tmp_path / "best.{}".format(format))
+  results.write(filename, chunksize=50)
+  assert read(filename, format) == expected_rows(results)
+
+@pytest.mark.parametrize("format", ["csv", "parquet"])
+def test_write_nothing(tmp_path, format):
+  if format == "parquet":
+    pytest.importorskip("pyarrow")
+  filename = str(tmp_path / "empty.{}".format(format))
+  MatchResults({}).write(filename)
+  assert read(filename, format) == []
+  assert list(pd.read_csv(filename) if format == "csv" else pd.read_parquet(filename)) == [a + "1" for a in attributes] + [a + "2" for a in attributes] + ["rank"]
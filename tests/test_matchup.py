@@ -0,0 +1,90 @@
+"""Blocked, planned, parallel and incremental matching all give the same pairs as matching every
+pair of the cross product with the matcher as written."""
+import pytest
+
+import blocking
+from blocking import ANY, AltBlocker, ConjBlocker
+from matcher import *
+from paper_collection import PaperCollection
+
+
+def unplanned(collection1, collection2, rule):
+  """The pairs found by testing every pair with the rule as it is written."""
+  return collection1.matchup(collection2, rule, optimise=False).pairs
+
+def shares(blocker, p, q):
+  """Whether the papers are candidates according to the blocker, by comparing their keys."""
+  if isinstance(blocker, ConjBlocker):
+    return all(shares(b, p, q) for b in blocker.blockers)
+  if isinstance(blocker, AltBlocker):
+    return any(shares(b, p, q) for b in blocker.blockers)
+  k1, k2 = blocker.keys(p), blocker.keys(q)
+  return bool(k1 & k2) or ANY in k1 or ANY in k2
+
+blockers = [
+  blocking.exact_title,
+  blocking.first_author + blocking.year_bucket(1),
+  blocking.title_tokens | blocking.first_author,
+]
+
+
+@pytest.mark.parametrize("blocker", blockers, ids=repr)
+def test_candidates(normalised, blocker):
+  c1, c2 = normalised
+  candidates = {(p.id, q.id) for p, c in c1.candidates(c2, blocker) for q in c}
+  assert candidates == {(p.id, q.id) for p in c1 for q in c2 if shares(blocker, p, q)}
+
+
+@pytest.mark.parametrize("blocker", blockers, ids=repr)
+def test_blocked(normalised, blocker):
+  """A blocked matchup finds the pairs of the cross product which are candidates."""
+  c1, c2 = normalised
+  expected = {(a, b) for a, b in unplanned(c1, c2, match) if shares(blocker, c1[a], c2[b])}
+  assert c1.matchup(c2, match, blocker, optimise=False).pairs == expected
+
+@pytest.mark.parametrize("rule, blocker", [
+  (fuzzy_title(3) + valid_year, blocking.FuzzyBlocker("title", 3)),
+  (valid_year + first_fuzzy_authors(1, 2), blocking.FuzzyBlocker("first_author", 2)),
+], ids=repr)
+def test_fuzzy_blocked(normalised, rule, blocker):
+  """Blocking a fuzzy matcher on its own distance finds every pair it matches."""
+  c1, c2 = normalised
+  expected = unplanned(c1, c2, rule)
+  assert len(expected) > 100
+  assert c1.matchup(c2, rule, blocker, optimise=False).pairs == expected
+  assert c1.columnar().matchup(c2.columnar(), rule, blocker, optimise=False).pairs == expected
+
+rules = [
+  title + year,
+  match,
+  fuzzy_title(3) + valid_year,
+  valid_year + first_fuzzy_authors(3, 3) + words(0.5),
+  (title + year) | fuzzy_title(4),
+]
+
+
+@pytest.mark.parametrize("rule", rules[:3], ids=repr)
+def test_parallel(normalised, rule):
+  c1, c2 = normalised
+  expected = unplanned(c1, c2, rule)
+  assert c1.matchup(c2, rule, processes=2, optimise=False).pairs == expected
+  assert c1.matchup(c2, rule, blocking.standard, processes=3, optimise=False).pairs == c1.matchup(c2, rule, blocking.standard, optimise=False).pairs
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+@pytest.mark.parametrize("rule", rules, ids=repr)
+def test_add(normalised, rule, columnar):
+  """Papers added to either collection a chunk at a time are matched as they would have been if
+  they had been there from the start."""
+  c1, c2 = normalised
+  expected = unplanned(c1, c2, rule)
+  papers1, papers2 = list(c1), list(c2)
+  build = lambda name, papers: PaperCollection(name, PaperCollection(name, papers).columnar().papers if columnar else papers)
+  a, b = build("a", papers1[:100]), build("b", papers2[:200])
+  pairs = a.matchup(b, rule).pairs
+  for k in range(100, len(papers1), 100):
+    pairs |= a.add(papers1[k:k+100], b, rule).pairs
+    pairs |= b.add(papers2[2*k:2*k+200], a, rule, first=False).pairs
+  assert (len(a), len(b)) == (len(c1), len(c2))
+  assert pairs == expected
+  assert a.add([], b, rule).pairs == set()
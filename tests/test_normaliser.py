@@ -0,0 +1,17 @@
+"""A Normaliser gives the same papers as Paper.normalise()."""
+from normaliser import Normaliser
+
+
+def test_papers(data):
+  papers1, papers2, gold = data
+  normaliser = Normaliser()
+  for papers in (papers1, papers2):
+    assert normaliser.papers(papers) == [p.normalise() for p in papers]
+
+
+def test_collection(normalised, data):
+  """PaperCollection.normalised() (which uses a Normaliser) agrees too, for lists and columns."""
+  from paper_collection import PaperCollection
+  papers1 = data[0]
+  assert list(PaperCollection("dblp", papers1).normalised()) == list(normalised[0])
+  assert list(PaperCollection("dblp", papers1).columnar().normalised()) == list(normalised[0])
@@ -0,0 +1,65 @@
+"""Planned matchups give the same pairs as the matchers as written, and the planner only rewrites
+the built-in matchers, not those of the user which share their names."""
+import pytest
+
+import matcher as matchers
+import planner
+from matcher import matcher
+
+
+@matcher
+def year(p, q):
+  """Within a year of each other, unlike the built-in year."""
+  return isinstance(p.year, int) and isinstance(q.year, int) and abs(p.year - q.year) <= 1
+
+@matcher
+def authors(p, q, n):
+  return len(set(p.authors) & set(q.authors)) >= n
+
+@matcher
+def fuzzy_title(p, q, edit):
+  """The same first 'edit' letters of the title, which no BK-tree can find."""
+  return p.title[:edit] == q.title[:edit]
+
+
+def test_shadowed_names():
+  m, blocker = planner.plan(matchers.title + year)
+  assert blocker.fields == (("title",),) and m is year
+  m, blocker = planner.plan(authors(1) + matchers.year)
+  assert blocker.fields == (("year",),)
+  assert planner.plan(fuzzy_title(10) + matchers.valid_year)[1] is None
+
+
+@pytest.mark.parametrize("rule", [
+  matchers.title + year,
+  matchers.title + year + matchers.venue,
+  authors(1) + matchers.year,
+  fuzzy_title(10) + matchers.valid_year,
+  (matchers.title + year) | fuzzy_title(20),
+], ids=repr)
+def test_planned(normalised, rule):
+  c1, c2 = normalised
+  expected = c1.matchup(c2, rule, optimise=False).pairs
+  assert c1.matchup(c2, rule).pairs == expected
+  assert c1.columnar().matchup(c2.columnar(), rule).pairs == expected
+
+
+@pytest.mark.parametrize("rule", [
+  matchers.title + matchers.year,
+  matchers.match,
+  matchers.fuzzy_title(3) + matchers.valid_year,
+  matchers.valid_year + matchers.first_fuzzy_authors(3, 3) + matchers.words(0.5),
+  (matchers.title + matchers.year) | matchers.fuzzy_title(4),
+  matchers.fuzzy_title(5) - matchers.year,
+  -matchers.title + matchers.venue + matchers.authors,
+], ids=repr)
+def test_builtins(normalised, rule):
+  c1, c2 = normalised
+  expected = c1.matchup(c2, rule, optimise=False).pairs
+  assert c1.matchup(c2, rule).pairs == expected
+  assert c1.columnar().matchup(c2.columnar(), rule).pairs == expected
+
+
+def test_optimise():
+  assert repr(planner.optimise(matchers.fuzzy_title(5) + matchers.year)) == "year + fuzzy_title(edit=5)"
+  assert repr(planner.optimise(matchers.fuzzy_title(5) | matchers.title)) == "title | fuzzy_title(edit=5)"
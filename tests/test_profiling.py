@@ -0,0 +1,59 @@
+"""Profiling a matcher counts the pairs each part sees and passes, without changing the results."""
+import pytest
+
+import blocking
+from matcher import *
+from profiling import Profile
+from scorer import Eval
+
+
+@pytest.fixture
+def scorer(data, normalised):
+  c1, c2 = normalised
+  return Eval(None, c1, c2, data[2], blocker=blocking.standard)
+
+def candidates(scorer):
+  return sum(len(c) for p, c in scorer.collection1.candidates(scorer.collection2, scorer.blocker))
+
+
+@pytest.mark.parametrize("rule", [
+  match,
+  fuzzy_title(3) + valid_year,
+  valid_year + first_fuzzy_authors(2, 2) + words(0.5),
+  (title + year) | fuzzy_title(4) | (authors + venue),
+], ids=repr)
+def test_counts(scorer, rule):
+  result = scorer.calc(rule, profile=True)
+  assert result._actual == scorer.calc(rule)._actual
+  nodes = result.profile.nodes
+  assert nodes[0].calls == candidates(scorer)
+  assert nodes[0].passed == len(result._actual)
+  def check(k):
+    """Check the counts of the children of node k against it, and return the next node after it."""
+    node, child, previous = nodes[k], k + 1, None
+    for m in getattr(node.matcher, "matchers", []):
+      s = nodes[child]
+      if previous is None:
+        assert s.calls == node.calls
+      elif isinstance(node.matcher, CompoundMatcher):
+        assert s.calls == previous.passed
+      else:
+        assert s.calls == previous.calls - previous.passed
+      previous = s
+      child = check(child)
+    if previous is not None:
+      assert node.passed == (previous.passed if isinstance(node.matcher, CompoundMatcher) else node.calls - previous.calls + previous.passed)
+    return child
+  assert check(0) == len(nodes)
+
+
+def test_timings(scorer):
+  profile = scorer.calc(fuzzy_title(3) + valid_year, profile=True).profile
+  root, fuzzy, year = profile.nodes
+  assert 0 < fuzzy.seconds + year.seconds <= root.seconds
+  assert fuzzy.cost > year.cost
+  table = profile.table()
+  assert table["calls"].tolist() == [s.calls for s in profile.nodes]
+  reordered = profile.reorder()
+  assert repr(reordered) == "valid_year + fuzzy_title(edit=3)"
+  assert scorer.calc(reordered)._actual == scorer.calc(fuzzy_title(3) + valid_year)._actual
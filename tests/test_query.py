@@ -0,0 +1,81 @@
+"""QueryIndex.find() finds the same papers as checking every paper against the criteria."""
+import random
+
+import numpy as np
+import pytest
+
+from paper import normalise_title, normalise_venue
+from paper_collection import PaperCollection
+from query import QueryIndex, _author
+
+
+def meets(p, title=None, words=None, authors=None, venue=None, year=None):
+  """Whether the paper p meets the criteria, as QueryIndex.find() describes them."""
+  if title is not None and normalise_title(p.title) != normalise_title(title):
+    return False
+  if words is not None:
+    words = normalise_title(words if isinstance(words, str) else " ".join(words)).split()
+    if not set(words) <= set(normalise_title(p.title).split()):
+      return False
+  if authors is not None:
+    authors = authors.split(", ") if isinstance(authors, str) else authors
+    if not set(_author(a) for a in authors) <= set(_author(a) for a in p.authors) - {""}:
+      return False
+  if venue is not None and normalise_venue(p.venue) != normalise_venue(venue):
+    return False
+  if year is not None:
+    low, high = (year.start, year.stop - 1) if isinstance(year, range) else year if isinstance(year, tuple) else (year, year)
+    if not isinstance(p.year, int) or not low <= p.year <= high:
+      return False
+  return True
+
+def queries(papers, count, seed=0):
+  """Random queries, mostly built from the attributes of the papers, so that they find something."""
+  rnd = random.Random(seed)
+  for _ in range(count):
+    p = rnd.choice(papers)
+    words = normalise_title(p.title).split()
+    year = p.year if isinstance(p.year, int) else 2000
+    criteria = {
+      "title": p.title.upper(),
+      "words": rnd.sample(words, min(len(words), rnd.randint(1, 3))) if rnd.random() < 0.5 else " ".join(words[:2]),
+      "authors": ", ".join(rnd.sample(p.authors, min(len(p.authors), 2))) if rnd.random() < 0.5 else p.authors[:1],
+      "venue": p.venue,
+      "year": rnd.choice([year, (year - 2, year + 1), range(year, year + 3), (1900, 1990)])}
+    chosen = rnd.sample(sorted(criteria), rnd.randint(1, 3))
+    yield {k: criteria[k] for k in chosen}
+
+def linear(papers, criteria):
+  return [k for k, p in enumerate(papers) if meets(p, **criteria)]
+
+
+@pytest.mark.parametrize("normalise", [False, True])
+def test_find(data, normalise):
+  papers = data[0] + data[1]
+  if normalise:
+    papers = [p.normalise() for p in papers]
+  collection = PaperCollection("papers", papers)
+  index = QueryIndex(collection)
+  found = 0
+  for criteria in queries(papers, 300):
+    expected = linear(papers, criteria)
+    assert index.find(**criteria).tolist() == expected, criteria
+    found += len(expected) > 0
+  assert found > 200
+  # Criteria which match nothing, and none at all.
+  assert index.find(words="no such words here", year=2000).tolist() == []
+  assert index.find(authors="Nobody Atall").tolist() == []
+  assert index.find(year=(3000, 4000)).tolist() == []
+  assert index.find().tolist() == list(range(len(papers)))
+
+def test_extend(data):
+  """find() sees the papers added to a collection after it was first used."""
+  papers1, papers2, _ = data
+  collection = PaperCollection("papers", list(papers1))
+  criteria = list(queries(papers2, 50, seed=1))
+  for c in criteria:
+    assert collection.find(**c) == [papers1[k] for k in linear(papers1, c)]
+  collection.extend(papers2)
+  papers = papers1 + papers2
+  for c in criteria:
+    assert collection.find(**c) == [papers[k] for k in linear(papers, c)]
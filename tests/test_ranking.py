@@ -0,0 +1,83 @@
+"""best() finds the same top k as scoring every candidate pair in full."""
+import numpy as np
+import pytest
+
+import blocking
+import ranking
+from paper_collection import PaperCollection
+
+
+def brute_force(c1, c2, score, k, blocker, min_score):
+  """The best k matches of each paper, by scoring every candidate with Score.values().  Ties go to
+  the earlier paper in c2."""
+  position = {p.id: b for b, p in enumerate(c2)}
+  result = {}
+  for a, (p, candidates) in enumerate(c1.candidates(c2, blocker)):
+    j = np.array(sorted(position[q.id] for q in candidates), dtype=np.int64)
+    values = score.values(c1, c2, np.full(len(j), a, dtype=np.int64), j)
+    ranked = sorted(zip((-values).tolist(), j.tolist()))[:k]
+    ranked = [(b, -s) for s, b in ranked if -s >= min_score]
+    if ranked:
+      result[p.id] = ranked
+  return result
+
+def found(results, c2):
+  position = {p.id: b for b, p in enumerate(c2)}
+  return {key.id: [(position[v.id], results.score(key, v)) for v in values] for key, values in results.results.items()}
+
+def compare(got, expected):
+  assert got.keys() == expected.keys()
+  for key in expected:
+    assert [b for b, s in got[key]] == [b for b, s in expected[key]]
+    assert [s for b, s in got[key]] == pytest.approx([s for b, s in expected[key]])
+
+
+@pytest.fixture
+def collections(normalised):
+  """The first 60 papers, against the copies with every tenth paper duplicated under another id,
+  so that there are exact ties."""
+  c1, c2 = normalised
+  papers2 = list(c2)
+  papers2 += [p._replace(id=p.id + "-again") for p in papers2[::10]]
+  return PaperCollection("dblp", list(c1)[:60]), PaperCollection("copies", papers2)
+
+
+@pytest.mark.parametrize("k, min_score", [(1, 0.0), (3, 0.0), (5, 0.6), (2, -1.0)])
+def test_best(collections, k, min_score):
+  c1, c2 = collections
+  score = ranking.default
+  got = found(c1.best(c2, score, k, min_score=min_score, size=5000), c2)
+  compare(got, brute_force(c1, c2, score, k, blocking.standard, min_score))
+
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_best_unblocked(collections, k):
+  c1, c2 = collections
+  c1 = c1[:15]
+  got = found(c1.best(c2, k=k, blocker=None, size=5000), c2)
+  compare(got, brute_force(c1, c2, ranking.default, k, None, 0.0))
+
+
+def test_ties(collections):
+  """A paper and its duplicate score the same, and the earlier one is preferred."""
+  c1, c2 = collections
+  got = found(c1.best(c2, k=2), c2)
+  ties = [v for v in got.values() if len(v) == 2 and v[0][1] == v[1][1]]
+  assert ties and all(a < b for (a, _), (b, _) in ties)
+
+
+def test_features(collections):
+  """A single feature, or a score of features without bounded batch functions, works as well."""
+  c1, c2 = collections
+  for score in (ranking.title_similarity, 0.5 * ranking.word_jaccard + 0.5 * ranking.year_similarity):
+    compare(found(c1.best(c2, score, 2), c2), brute_force(c1, c2, score, 2, blocking.standard, 0.0))
+
+
+def test_nothing(collections):
+  c1, c2 = collections
+  assert c1.best(c2, k=0).results == {}
+  assert c1[:0].best(c2).results == {}
+  empty = np.zeros(0, dtype=np.int64)
+  assert len(ranking.default.best_values(c1, c2, empty, empty, 3)) == 0
+  i, j = np.zeros(4, dtype=np.int64), np.arange(4)
+  assert (ranking.default.best_values(c1, c2, i, j, 0) == -np.inf).all()
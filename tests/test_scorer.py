@@ -0,0 +1,67 @@
+"""Eval.search() and Eval.sweep() give the same recall, precision and F1 as Eval.calc() at each point."""
+import pytest
+
+import blocking
+from matcher import *
+from scorer import Eval
+
+
+@pytest.fixture
+def scorer(data, normalised):
+  c1, c2 = normalised
+  return Eval(None, c1, c2, data[2], blocker=blocking.standard)
+
+def rpf(result):
+  return [result.recall, result.precision, result.F1]
+
+
+@pytest.mark.parametrize("processes", [None, 2])
+def test_search(scorer, processes):
+  grid = dict(edit=[2, 4], frac=[0.4, 0.7])
+  df = scorer.search(lambda edit, frac: fuzzy_title(edit) + words(frac), grid, processes=processes)
+  assert len(df) == 4
+  for row in df.itertuples(index=False):
+    assert list(row[2:]) == pytest.approx(rpf(scorer.calc(fuzzy_title(row.edit) + words(row.frac))))
+
+
+def test_patience(scorer):
+  df = scorer.search(lambda edit: fuzzy_title(edit) + valid_year, dict(edit=[8, 1, 1, 1, 1, 6]), patience=2)
+  assert df.edit.tolist() == [8, 1, 1]
+
+
+def test_optimised(scorer, monkeypatch):
+  """The parts of a composition are evaluated cheapest first, as in a planned matchup."""
+  space = scorer.space
+  evaluated = []
+  mask = space._mask
+  monkeypatch.setattr(space, "_mask", lambda m, ids: evaluated.append(repr(m)) or mask(m, ids))
+  scorer.search(lambda edit: fuzzy_title(edit) + year, dict(edit=[4, 2]))
+  assert evaluated[0] == "year"
+
+
+@pytest.mark.parametrize("matcher", [
+  lambda edit: valid_year + fuzzy_title(edit),
+  lambda edit: fuzzy_title(edit) | (title + year),
+  lambda edit: valid_year + first_fuzzy_authors(2, edit) + words(0.5),
+  lambda edit: valid_year + words(0.5) - fuzzy_title(edit),
+])
+def test_sweep(scorer, matcher):
+  values = [1, 2, 3, 5, 8]
+  df = scorer.sweep(matcher, values)
+  for row, v in zip(df.itertuples(index=False), values):
+    assert list(row[1:]) == pytest.approx(rpf(scorer.calc(matcher(v))))
+
+
+def test_sweep_fraction(scorer):
+  values = [0.2, 0.5, 0.8]
+  df = scorer.sweep(lambda frac: valid_year + words(frac), values)
+  for row, v in zip(df.itertuples(index=False), values):
+    assert list(row[1:]) == pytest.approx(rpf(scorer.calc(valid_year + words(v))))
+
+
+def test_sweep_unblocked(data, normalised):
+  c1, c2 = normalised
+  scorer = Eval(None, c1, c2, data[2])
+  df = scorer.sweep(lambda edit: valid_year + fuzzy_title(edit), [2, 4])
+  for row, v in zip(df.itertuples(index=False), [2, 4]):
+    assert list(row[1:]) == pytest.approx(rpf(scorer.calc(valid_year + fuzzy_title(v))))
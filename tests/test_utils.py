@@ -0,0 +1,59 @@
+"""The bounded and batched edit distances agree with edit_distance()."""
+import random
+
+import numpy as np
+import pytest
+
+from utils import INF, bounded_edit_distance, cut_edit_distance, edit_distance, edit_distances
+
+
+def strings(n, seed=0):
+  """Pairs of short strings, many of them near each other."""
+  rnd = random.Random(seed)
+  pairs = []
+  for _ in range(n):
+    a = "".join(rnd.choice("abcd ") for _ in range(rnd.randint(0, 12)))
+    b = a
+    for _ in range(rnd.randint(0, 4)):
+      k = rnd.randint(0, len(b))
+      edit = rnd.choice(["insert", "delete", "substitute"])
+      if edit == "insert":
+        b = b[:k] + rnd.choice("abcde") + b[k:]
+      else:
+        b = b[:k] + ("e" if edit == "substitute" and k < len(b) else "") + b[k+1:]
+    pairs.append((a, b))
+  return pairs
+
+def bounded(d, limit):
+  return d if d < limit else INF
+
+def cut(a, b):
+  """The distance from the shorter string to the closest prefix of the longer one."""
+  if len(b) < len(a):
+    a, b = b, a
+  return min(edit_distance(a, b[:k]) for k in range(len(b) + 1))
+
+pairs = strings(500)
+limits = [0.5, 1, 2.5, 4, INF]
+
+
+@pytest.mark.parametrize("limit", limits)
+def test_bounded_edit_distance(limit):
+  for a, b in pairs:
+    assert bounded_edit_distance(a, b, limit) == bounded(edit_distance(a, b), limit)
+    assert cut_edit_distance(a, b, limit) == bounded(cut(a, b), limit)
+
+
+@pytest.mark.parametrize("limit", limits)
+def test_edit_distances(limit):
+  a, b = zip(*pairs)
+  assert edit_distances(a, b, limit).tolist() == [bounded(edit_distance(x, y), limit) for x,y in pairs]
+  assert edit_distances(a, b, limit, cut=True).tolist() == [bounded(cut(x, y), limit) for x,y in pairs]
+  assert edit_distances(a, b, limit, chunk=7).tolist() == [bounded(edit_distance(x, y), limit) for x,y in pairs]
+
+
+def test_edit_distances_limits():
+  """With a limit for each pair."""
+  a, b = zip(*pairs)
+  limit = np.array([limits[k % len(limits)] for k in range(len(pairs))])
+  assert edit_distances(a, b, limit).tolist() == [bounded(edit_distance(x, y), l) for (x,y),l in zip(pairs, limit)]
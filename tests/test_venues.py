@@ -0,0 +1,66 @@
+"""VenueCounts and align_venues() give the same maps as counting with collections.Counter."""
+import collections
+
+import pytest
+
+import venues
+from matcher import *
+from paper_collection import PaperCollection
+
+
+def counter_venue_map(gold, collection1, collection2, min_count=5):
+  """venue_map() as it was, with a list of venues for each venue2 and Counter.most_common()."""
+  d = collections.defaultdict(list)
+  for x1, x2 in zip([collection1[x].venue for x,_ in gold], [collection2[x].venue for _,x in gold]):
+    if x1 != "" and x2 != "":
+      d[x2].append(x1)
+  d2 = {k:collections.Counter(v).most_common(1) for k,v in d.items()}
+  return {k:v[0] for k,v in d2.items() if v[0][1] >= min_count}
+
+def counter_counts(gold, collection1, collection2):
+  counters = collections.defaultdict(collections.Counter)
+  for x1, x2 in gold:
+    counters[collection1[x1].venue][collection2[x2].venue] += 1
+  return counters
+
+def unique_matches(collection, papers, matcher):
+  """The pairs (id in papers, id in collection) of the papers with exactly one match."""
+  return [(p.id, matches[0].id) for p in papers for matches in [collection.matches(p, matcher)] if len(matches) == 1]
+
+def items(counters):
+  return [(k, list(v.items())) for k, v in counters.items()]
+
+
+@pytest.mark.parametrize("min_count", [1, 2, 5])
+def test_venue_map(data, min_count):
+  papers1, papers2, gold = data
+  c1, c2 = PaperCollection("dblp", papers1), PaperCollection("copies", papers2)
+  # Sorted, so that the order the pairs are counted in (and so how ties are broken) is fixed.
+  gold = sorted(gold)
+  expected = counter_venue_map(gold, c1, c2, min_count)
+  assert list(venues.venue_map(gold, c1, c2, min_count).items()) == list(expected.items())
+  # Counting the pairs a few at a time gives the same.
+  counts = venues.VenueCounts()
+  for k in range(0, len(gold), 70):
+    counts.add_pairs(gold[k:k+70], c1, c2)
+  assert list(counts.venue_map(min_count).items()) == list(expected.items())
+  assert items(counts.counters()) == items(counter_counts(gold, c1, c2))
+
+
+def test_align_venues(normalised):
+  c1, c2 = normalised
+  papers = list(c2)
+  # align_venues() as it was, one paper at a time.
+  unique = unique_matches(c1, papers, title)
+  expected_counts = counter_counts(unique, c2, c1)
+  expected_map = {k2:k1 for k1,v1 in expected_counts.items() for k2 in v1}
+  c1.align_venues(papers, title)
+  assert items(c1.venue_counts) == items(expected_counts)
+  assert list(c1.venue_map.items()) == list(expected_map.items())
+  # Adding the papers in two parts gives the same as adding them all at once.
+  c1.align_venues(papers[:200], title)
+  c1.align_venues(papers[200:], title, update=True)
+  assert items(c1.venue_counts) == items(expected_counts)
+  assert list(c1.venue_map.items()) == list(expected_map.items())
+  c1.align_venues(papers, title, most_common=True)
+  assert list(c1.venue_map.items()) == [(k2, k1) for k2,(k1,_) in counter_venue_map(unique, c2, c1, 1).items()]
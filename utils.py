@@ -1,3 +1,8 @@
+import math
+import numpy as np
+
+INF = float("inf")
+
 def edit_distance(a, b):
   """Calculate the Levenshtein_distance between to strings.
   Here we choose the cost of insertion=1, deletion=1, substitution=1.5
@@ -7,7 +12,7 @@ def edit_distance(a, b):
   n = len(b)
   if n < m:
     return edit_distance(b, a)
-  v0 = range(n+1)
+  v0 = list(range(n+1))
   v1 = [0] * (n+1)
   for i in range(m):
     v1[0] = i+1
@@ -19,3 +24,116 @@ def edit_distance(a, b):
       v1[j+1] = min(v1[j]+1, v0[j+1]+1, v0[j]+cost)
     v0, v1 = v1, v0
   return v0[-1]
+
+# The functions below work in units of half an edit, so that all the costs are integers:
+# insertion=2, deletion=2, substitution=3.
+
+def bounded_edit_distance(a, b, limit=INF, cut=False):
+  """Return edit_distance(a, b) if it is less than limit, and otherwise INF.
+  This is the same as edit_distance(), but much cheaper when only small distances are of interest:
+  - if the lengths of the strings differ by limit or more, INF is returned immediately
+  - only the band of the table within limit of the diagonal is calculated
+  - the calculation stops as soon as no path through the current row can be less than limit.
+  If cut is True, calculate cut_edit_distance(a, b) instead."""
+  m = len(a)
+  n = len(b)
+  if n < m:
+    a, b, m, n = b, a, n, m
+  if limit <= 0 or (not cut and n - m >= limit):
+    return INF
+  bound = 2 * limit
+  w = n if limit > n else int(math.ceil(limit)) - 1
+  big = 2 * (m + n) + 1
+  v0 = [2*j if j <= w else big for j in range(n+1)]
+  v1 = [big] * (n+1)
+  for i in range(1, m+1):
+    lo = max(1, i-w)
+    hi = min(n, i+w)
+    v1[lo-1] = 2*i if lo == 1 else big
+    x = a[i-1]
+    for j in range(lo, hi+1):
+      d = v0[j-1] if x == b[j-1] else v0[j-1] + 3
+      if v0[j] + 2 < d:
+        d = v0[j] + 2
+      if v1[j-1] + 2 < d:
+        d = v1[j-1] + 2
+      v1[j] = d
+    if cut:
+      least = min(v1[lo-1:hi+1])
+    else:
+      # Every remaining difference in length costs at least one more edit.
+      least = min(v1[j] + 2*abs(n - j - m + i) for j in range(lo-1, hi+1))
+    if least >= bound:
+      return INF
+    v0, v1 = v1, v0
+  d = min(v0[max(0, m-w):n+1]) if cut else v0[n]
+  return d / 2.0 if d < bound else INF
+
+def cut_edit_distance(a, b, limit=INF):
+  """Calculate the edit distance between the shorter of the strings and the closest prefix of
+  the longer one.  That is, the longer string may be cut short at no cost, which allows for
+  titles which have been truncated.  As with bounded_edit_distance(), INF is returned if the
+  distance is not less than limit."""
+  return bounded_edit_distance(a, b, limit, cut=True)
+
+def edit_distances(a, b, limit=INF, cut=False, chunk=20000):
+  """Return a numpy array of bounded_edit_distance(x, y, limit, cut) for each x,y in zip(a, b).
+  The pairs are processed together, one row of the table at a time, with each row calculated
+  using numpy operations across both the pairs and the columns.  Pairs drop out of the calculation
+  as soon as they are finished, or can no longer be less than limit.  To bound the memory used,
+  the pairs are sorted by length and processed at most 'chunk' at a time.
+  limit may also be an array, with a limit for each pair."""
+  result = np.full(len(a), INF)
+  limits = np.broadcast_to(np.asarray(limit, dtype=float), (len(a),))
+  if not len(a) or not (limits > 0).any():
+    return result
+  swap = [len(x) > len(y) for x,y in zip(a, b)]
+  short = [y if s else x for x,y,s in zip(a, b, swap)]
+  long = [x if s else y for x,y,s in zip(a, b, swap)]
+  ls = np.array([len(x) for x in short])
+  ll = np.array([len(y) for y in long])
+  live = np.flatnonzero((ll - ls < limits) & (limits > 0)) if not cut else np.flatnonzero(limits > 0)
+  live = live[np.argsort(ll[live], kind="stable")]
+  for start in range(0, len(live), chunk):
+    k = live[start:start+chunk]
+    result[k] = _edit_distances([short[x] for x in k], [long[x] for x in k], ls[k], ll[k], limits[k], cut)
+  return result
+
+def _edit_distances(short, long, ls, ll, limit, cut):
+  """The calculation for edit_distances(), where each short string is no longer than its long string,
+  and limit is an array."""
+  result = np.full(len(short), INF)
+  live = np.arange(len(short))
+  S = _codes(short, max(1, ls.max()))
+  L = _codes(long, max(1, ll.max()))
+  bound = 2 * limit
+  big = np.iinfo(np.int32).max
+  J = 2 * np.arange(L.shape[1] + 1)
+  inside = J[None,:] <= 2 * ll[:,None]
+  row = np.tile(J, (len(live), 1))
+  for i in range(0, S.shape[1] + 1):
+    if i:
+      t = np.empty_like(row)
+      t[:,0] = 2 * i
+      np.minimum(row[:,1:] + 2, row[:,:-1] + np.where(S[:,i-1,None] == L, 0, 3), out=t[:,1:])
+      row = np.minimum.accumulate(t - J, axis=1) + J
+    masked = np.where(inside, row, big)
+    if cut:
+      least = masked.min(axis=1)
+    else:
+      # Every remaining difference in length costs at least one more edit.
+      least = (masked + np.abs(2*(ll - ls + i)[:,None] - J[None,:])).min(axis=1)
+    done = ls == i
+    if done.any():
+      d = least[done] if cut else row[done, ll[done]]
+      result[live[done]] = np.where(d < bound[done], d / 2.0, INF)
+    keep = ~done & (least < bound)
+    if not keep.all():
+      live, ls, ll, S, L, row, inside, bound = live[keep], ls[keep], ll[keep], S[keep], L[keep], row[keep], inside[keep], bound[keep]
+      if not len(live):
+        break
+  return result
+
+def _codes(strings, width):
+  """Return the strings as a 2-d array of unicode code points, padded with zeros to width."""
+  return np.array(strings, dtype="U{}".format(width)).view(np.uint32).reshape(len(strings), width).astype(np.int32)
@@ -1,21 +1,92 @@
 import collections
 import re
+import numpy as np
+
+from columns import vocabulary
+
+
+class VenueCounts:
+  """Counts of how often each venue in one collection goes with each venue in another, over a set
+  of matched pairs of papers, from which a venue map can be read off.  The counts are held in
+  arrays keyed by the pair of venue codes (from the shared vocabulary), sorted by venue2 and then
+  venue1, and add() merges in the counts from more pairs, so the counts can be kept up to date
+  as matches arrive, in time linear in the number of distinct pairs of venues.
+
+  The order in which each pair of venues was first seen is kept too, so that ties are broken as
+  collections.Counter.most_common() breaks them."""
+  def __init__(self, vocab=vocabulary):
+    self.vocabulary = vocab
+    self.keys = np.zeros(0, dtype=np.int64)
+    self.counts = np.zeros(0, dtype=np.int64)
+    self.first = np.zeros(0, dtype=np.int64)
+    self.seen = 0
+
+  def __repr__(self):
+    return "VenueCounts(venues={}, pairs={})".format(len(self.keys), self.seen)
+
+  def add(self, venues1, venues2):
+    """Count the pairs (venues1[k], venues2[k]), given as arrays of venue codes."""
+    venues1 = np.asarray(venues1, dtype=np.int64)
+    venues2 = np.asarray(venues2, dtype=np.int64)
+    keys, first, counts = np.unique(venues2 << 32 | venues1, return_index=True, return_counts=True)
+    merged, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+    self.counts = np.bincount(inverse, np.concatenate([self.counts, counts]), len(merged)).astype(np.int64)
+    earliest = np.full(len(merged), np.iinfo(np.int64).max)
+    np.minimum.at(earliest, inverse, np.concatenate([self.first, self.seen + first]))
+    self.first = earliest
+    self.keys = merged
+    self.seen += len(venues1)
+
+  def add_pairs(self, pairs, collection1, collection2):
+    """Count the venues of the pairs of papers (id1, id2) from the two collections."""
+    pairs = list(pairs)
+    self.add(_venue_codes(collection1, [x for x,_ in pairs], self.vocabulary), _venue_codes(collection2, [x for _,x in pairs], self.vocabulary))
+
+  @property
+  def venues(self):
+    """Arrays (venue1, venue2) of the codes of the pairs of venues counted."""
+    return self.keys & 0xffffffff, self.keys >> 32
+
+  def counters(self):
+    """Return the counts as a dictionary of venue1 -> Counter of venue2, in the order first seen."""
+    strings = self.vocabulary.strings
+    venues1, venues2 = self.venues
+    result = collections.defaultdict(collections.Counter)
+    for k in np.argsort(self.first, kind="stable").tolist():
+      result[strings[venues1[k]]][strings[venues2[k]]] = int(self.counts[k])
+    return result
+
+  def venue_map(self, min_count=1):
+    """Return a dictionary of venue2 -> (venue1, count), mapping each venue2 to the venue1 it most
+    often goes with, where that is at least min_count times.  Blank venues are left out, and the
+    venues are in the order first seen."""
+    strings = self.vocabulary.strings
+    blank = self.vocabulary.find("")
+    venues1, venues2 = self.venues
+    live = np.flatnonzero((venues1 != blank) & (venues2 != blank))
+    if not len(live):
+      return {}
+    live = live[np.lexsort((self.first[live], -self.counts[live], venues2[live]))]
+    starts = np.flatnonzero(np.r_[True, venues2[live][1:] != venues2[live][:-1]])
+    best = live[starts][np.argsort(np.minimum.reduceat(self.first[live], starts), kind="stable")]
+    best = best[self.counts[best] >= min_count]
+    return {strings[v2]:(strings[v1], c) for v1, v2, c in zip(venues1[best].tolist(), venues2[best].tolist(), self.counts[best].tolist())}
+
+
+def _venue_codes(collection, ids, vocab=vocabulary):
+  """Return an array of the venue codes of the papers with the given ids."""
+  if collection.is_columnar and collection.papers.vocabulary is vocab:
+    columns = collection.papers
+    return columns.venue.values[np.array([columns.position[x] for x in ids], dtype=np.int64)]
+  return np.array(vocab.codes([collection[x].venue for x in ids]), dtype=np.int64)
 
 def venue_map(gold, collection1, collection2, min_count=5):
   """Return a dictionary of venue2 -> venue1 maps from the dataset where the map is given by
-  the most common mapping, and there are at least min_count entries."""
-  # Extract the venues
-  v1 = [collection1[x].venue for x,_ in gold]
-  v2 = [collection2[x].venue for _,x in gold]
-  # Count how many venue2 -> venue1 we find
-  d = collections.defaultdict(list)
-  for x1,x2 in zip(v1,v2):
-    if x1 != "" and x2 != "":
-      d[x2].append(x1)
-  # Get the most common elements
-  d2 = {k:collections.Counter(v).most_common(1) for k,v in d.items()}
-  # Ensure that there are at least min_count elements
-  return {k:v[0] for k,v in d2.items() if v[0][1] >= min_count}
+  the most common mapping, and there are at least min_count entries.  To keep a venue map up to
+  date as more pairs are matched, use a VenueCounts object, which this is a shorthand for."""
+  counts = VenueCounts()
+  counts.add_pairs(gold, collection1, collection2)
+  return counts.venue_map(min_count)
 
 def show_venue_map(map):
   import pandas as pd